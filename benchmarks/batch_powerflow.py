@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Compares the batched Newton-Raphson solver of `powerdata_gen.batch_powerflow` with `pp.runpp`.
+
+Injection scenarios of the topology of each bundled power grid are sampled at once using `config/config.yaml`, with
+independent active generation and voltage set points. Their power flows are solved one by one with `pp.runpp`, then
+all together, and both are checked to agree on the convergence and on the results.
+
+Run from the root of the repository with :
+    python -m benchmarks.batch_powerflow [n_samples]
+"""
+
+import glob
+import sys
+import time
+
+import numpy as np
+import pandapower as pp
+from omegaconf import OmegaConf
+
+from powerdata_gen.batch_powerflow import run_power_flows
+from powerdata_gen.powergrid.core import apply_scenario, clone_net, sample_scenarios
+from powerdata_gen.utils import get_rng
+
+NET_PATHS = sorted(glob.glob('inputs/case60nordic_*.json'))
+RESULT_COLUMNS = [("res_bus", "vm_pu"), ("res_bus", "va_degree"), ("res_gen", "q_mvar"), ("res_ext_grid", "p_mw"),
+                  ("res_line", "loading_percent"), ("res_trafo", "loading_percent")]
+
+
+def main(n_samples: int = 100) -> None:
+    """Prints the time per power flow of both solvers, and the largest result differences between them."""
+    cfg = OmegaConf.load('config/config.yaml')
+    cfg.sampling.active_gen = {"method": "uniform_independent_factor", "params": {"beta": 0.2}}
+    cfg.sampling.voltage_setpoint = {"method": "uniform_independent_factor", "params": {"min_val": 0.97,
+                                                                                          "max_val": 1.03}}
+    powerflow_kwargs = OmegaConf.to_container(cfg.powerflow)
+    for net_path in NET_PATHS:
+        default_net = pp.from_json(net_path)
+        scenarios = sample_scenarios(default_net, default_net, cfg.sampling, get_rng(cfg.seed), n_samples)
+        nets = []
+        for k in range(n_samples):
+            net = clone_net(default_net)
+            apply_scenario(net, scenarios, k, cfg.sampling)
+            nets.append(net)
+
+        references, start = [], time.perf_counter()
+        for net in nets:
+            net = clone_net(net)
+            try:
+                pp.runpp(net, **powerflow_kwargs)
+            except pp.powerflow.LoadflowNotConverged:
+                pass
+            references.append(net)
+        runpp_duration = time.perf_counter() - start
+        start = time.perf_counter()
+        run_power_flows(nets, powerflow_kwargs)
+        batch_duration = time.perf_counter() - start
+
+        n_mismatch = sum(reference.converged != net.converged for reference, net in zip(references, nets))
+        print("{} : {} / {} converged, {} convergence mismatches".format(
+            net_path, sum(net.converged for net in nets), n_samples, n_mismatch))
+        for table, column in RESULT_COLUMNS:
+            max_error = max([np.nanmax(np.abs(reference[table][column].values - net[table][column].values))
+                             for reference, net in zip(references, nets) if reference.converged and net.converged],
+                            default=0.)
+            print("    max {}/{} difference : {:.2e}".format(table, column, max_error))
+        print("    {:<10} {:>10}".format("solver", "time ms"))
+        print("    {:<10} {:>10.2f}".format("runpp", 1e3 * runpp_duration / n_samples))
+        print("    {:<10} {:>10.2f}".format("batch", 1e3 * batch_duration / n_samples))
+
+
+if __name__ == '__main__':
+    main(*[int(n) for n in sys.argv[1:2]])
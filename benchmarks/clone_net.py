@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Compares the time and memory allocated by `copy.deepcopy` and `clone_net` on the bundled power grids.
+
+Run from the root of the repository with :
+    python -m benchmarks.clone_net
+"""
+
+import copy
+import glob
+import timeit
+import tracemalloc
+
+import pandapower as pp
+
+from powerdata_gen.powergrid.core import clone_net
+
+
+def measure_allocation(function, net) -> int:
+    """Returns the amount of bytes still allocated by the copy returned by `function`."""
+    tracemalloc.start()
+    clone = function(net)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del clone
+    return size
+
+
+def main(n_repeat: int = 200) -> None:
+    """Prints the time and allocation per copy for each bundled power grid."""
+    print("{:<35} {:>12} {:>12} {:>12} {:>12}".format("net", "deepcopy ms", "clone ms", "deepcopy kB", "clone kB"))
+    for net_path in sorted(glob.glob('inputs/case60nordic_*.json')):
+        net = pp.from_json(net_path)
+        deepcopy_time = timeit.timeit(lambda: copy.deepcopy(net), number=n_repeat) / n_repeat
+        clone_time = timeit.timeit(lambda: clone_net(net), number=n_repeat) / n_repeat
+        deepcopy_size = measure_allocation(copy.deepcopy, net)
+        clone_size = measure_allocation(clone_net, net)
+        print("{:<35} {:>12.2f} {:>12.2f} {:>12.1f} {:>12.1f}".format(net_path, 1e3 * deepcopy_time, 1e3 * clone_time,
+                                                                      deepcopy_size / 1e3, clone_size / 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Compares `pandapower.topology.unsupplied_buses` with the sparse graph version of `powerdata_gen.graph`.
+
+Power grids are sampled once using `config/config.yaml`, and both functions are checked to agree on all of them.
+
+Run from the root of the repository with :
+    python -m benchmarks.connectivity [net_path] [n_samples]
+"""
+
+import sys
+import timeit
+
+import pandapower as pp
+import pandapower.topology as top
+from omegaconf import OmegaConf
+
+from benchmarks.warm_start import sample_nets
+from powerdata_gen import graph
+
+
+def main(net_path: str = 'inputs/case60nordic_vanilla.json', n_samples: int = 50) -> None:
+    """Prints the time per call of both functions, and the amount of power grids on which they disagree."""
+    cfg = OmegaConf.load('config/config.yaml')
+    nets = sample_nets(pp.from_json(net_path), cfg.sampling, n_samples, cfg.seed)
+    n_mismatch = sum(top.unsupplied_buses(net) != graph.unsupplied_buses(net) for net in nets)
+
+    networkx_time = timeit.timeit(lambda: [top.unsupplied_buses(net) for net in nets], number=5) / (5 * n_samples)
+    graph._unsupplied_buses_cache.clear()
+    cold_time = timeit.timeit(lambda: [graph.unsupplied_buses(net) for net in nets], number=1) / n_samples
+    cached_time = timeit.timeit(lambda: [graph.unsupplied_buses(net) for net in nets], number=5) / (5 * n_samples)
+
+    print("mismatches : {} / {}".format(n_mismatch, n_samples))
+    print("{:<25} {:>10}".format("method", "time ms"))
+    for name, duration in [("networkx", networkx_time), ("csgraph", cold_time), ("csgraph (cached)", cached_time)]:
+        print("{:<25} {:>10.3f}".format(name, 1e3 * duration))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *[int(n) for n in sys.argv[2:3]])
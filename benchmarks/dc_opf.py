@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Compares the `pandapower` and `highs` DC-OPF backends of `powerdata_gen.powergrid.active_generation`.
+
+Power grids are sampled once using `config/config.yaml`, with a DC-OPF active generation method. Both backends are
+then run on copies of each grid, and checked to agree on the feasibility and on the active generation dispatch.
+
+Run from the root of the repository with :
+    python -m benchmarks.dc_opf [net_path] [n_samples]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandapower as pp
+from omegaconf import OmegaConf
+
+from benchmarks.warm_start import sample_nets
+from powerdata_gen.powergrid.active_generation import run_dc_opf
+from powerdata_gen.powergrid.core import clone_net
+from powerdata_gen.utils import SamplingException
+
+
+def run(nets: list, backend: str) -> tuple[list, float]:
+    """Solves the DC-OPF of copies of `nets`, and returns the generator dispatches (None if infeasible) and the time
+    per DC-OPF."""
+    dispatches, duration = [], 0.
+    for net in nets:
+        net = clone_net(net)
+        start = time.perf_counter()
+        try:
+            dispatches.append(run_dc_opf(net, backend)["gen"])
+        except SamplingException:
+            dispatches.append(None)
+        duration += time.perf_counter() - start
+    return dispatches, duration / len(nets)
+
+
+def main(net_path: str = 'inputs/case60nordic_vanilla.json', n_samples: int = 50) -> None:
+    """Prints the time per DC-OPF of both backends, and the largest dispatch difference between them."""
+    cfg = OmegaConf.load('config/config.yaml')
+    cfg.sampling.active_gen.method = "dc_opf"
+    cfg.sampling.active_gen.params = {"min_cp1": 1., "max_cp1": 2.}
+    nets = sample_nets(pp.from_json(net_path), cfg.sampling, n_samples, cfg.seed)
+
+    results = {backend: run(nets, backend) for backend in ["pandapower", "highs"]}
+    pairs = list(zip(results["pandapower"][0], results["highs"][0]))
+    n_mismatch = sum((reference is None) != (dispatch is None) for reference, dispatch in pairs)
+    max_error = max([np.abs(reference - dispatch).max() for reference, dispatch in pairs
+                     if reference is not None and dispatch is not None], default=0.)
+
+    print("feasibility mismatches : {} / {}".format(n_mismatch, n_samples))
+    print("max dispatch difference : {:.2e} MW".format(max_error))
+    print("{:<15} {:>10}".format("backend", "time ms"))
+    for backend, (_, duration) in results.items():
+        print("{:<15} {:>10.2f}".format(backend, 1e3 * duration))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *[int(n) for n in sys.argv[2:3]])
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Times the samplers, the filtering, the storage formats and the end-to-end throughput of the sampling pipeline.
+
+Every case runs offline with a fixed seed, on each bundled power grid. Results are written as JSON along with the
+commit and the versions of the main dependencies, and can be compared with the results of another commit :
+    python -m benchmarks.suite --output before.json
+    git checkout <other commit>
+    python -m benchmarks.suite --output after.json --baseline before.json
+
+Cases whose median time changed by more than `--threshold` are flagged. Run from the root of the repository.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandapower as pp
+import scipy
+from omegaconf import OmegaConf
+
+from powerdata_gen.dataset import build_one_dataset, filter_sample
+from powerdata_gen.powerflow import run_power_flow
+from powerdata_gen.powergrid.active_generation import sample_active_generation
+from powerdata_gen.powergrid.active_load import sample_active_load
+from powerdata_gen.powergrid.core import SamplingPlan, clone_net, sample_power_grid
+from powerdata_gen.powergrid.reactive_load import sample_reactive_load
+from powerdata_gen.powergrid.topology import sample_topology
+from powerdata_gen.powergrid.total_load import sample_total_load
+from powerdata_gen.powergrid.voltage_setpoint import sample_voltage_setpoint
+from powerdata_gen.storage import get_writer
+from powerdata_gen.utils import SamplingException, get_rng
+
+SEED = 0
+NET_PATHS = sorted(glob.glob('inputs/case60nordic_*.json'))
+SAMPLER_CASES = {
+    "topology": [
+        ("constant", {}),
+        ("random_disconnection", {"line": {"probs": {0: 0.2, 1: 0.2, 2: 0.2, 3: 0.2, 4: 0.2}}}),
+        ("random_disconnection", {"line": {"probs": {0: 0.2, 1: 0.2, 2: 0.2, 3: 0.2, 4: 0.2}, "secure": True}})],
+    "total_load": [
+        ("constant", {}), ("uniform_factor", {"min_val": 0.5, "max_val": 1.2}),
+        ("normal_factor", {"mean": 1., "std": 0.1}), ("uniform_values", {"min_val": 2000., "max_val": 3000.}),
+        ("normal_values", {"mean": 2500., "std": 100.})],
+    "active_load": [
+        ("homothetic", {}), ("uniform_independent_factor", {"beta": 0.1}),
+        ("normal_independent_factor", {"std": 0.05}), ("uniform_independent_values", {"beta": 0.1}),
+        ("normal_independent_values", {"std": 0.05})],
+    "reactive_load": [
+        ("constant", {}), ("constant_pq_ratio", {}), ("uniform_homothetic_factor", {"min_val": 0.9, "max_val": 1.1}),
+        ("normal_homothetic_factor", {"std": 0.05}), ("uniform_independent_factor", {"min_val": 0.9, "max_val": 1.1}),
+        ("normal_independent_factor", {"std": 0.05}), ("uniform_independent_values", {"min_val": 0., "max_val": 10.}),
+        ("normal_independent_values", {"mean": 5., "std": 1.}), ("uniform_power_factor", {})],
+    "active_gen": [
+        ("homothetic", {}), ("uniform_independent_factor", {"beta": 0.1}),
+        ("normal_independent_factor", {"std": 0.05}), ("uniform_independent_values", {"beta": 0.1}),
+        ("normal_independent_values", {"std": 0.05}), ("dc_opf", {"min_cp1": 1., "max_cp1": 2.}),
+        ("dc_opf", {"min_cp1": 1., "max_cp1": 2., "backend": "highs"}),
+        ("dc_opf_disconnect", {"max_loading_percent": 80., "min_cp1": 1., "max_cp1": 2.}),
+        ("dc_opf_disconnect", {"max_loading_percent": 80., "min_cp1": 1., "max_cp1": 2., "backend": "highs"})],
+    "voltage_setpoint": [
+        ("constant", {}), ("uniform_homothetic_factor", {"min_val": 0.98, "max_val": 1.02}),
+        ("normal_homothetic_factor", {"std": 0.01}),
+        ("uniform_independent_factor", {"min_val": 0.98, "max_val": 1.02}),
+        ("normal_independent_factor", {"std": 0.01}),
+        ("uniform_independent_values", {"min_val": 0.98, "max_val": 1.02}),
+        ("normal_independent_values", {"mean": 1., "std": 0.01})],
+}
+STORAGE_FORMATS = ["json", "delta", "hdf5"]
+
+
+def run_sampler(stage: str, net, default_net, rng, cfg) -> None:
+    """Runs the sampling step `stage` on `net`, using the total load of `default_net`."""
+    total_load = (default_net.load.p_mw * default_net.load.in_service).sum()
+    if stage == "topology":
+        sample_topology(net, rng, cfg)
+    elif stage == "total_load":
+        sample_total_load(net, rng, cfg)
+    elif stage == "active_load":
+        sample_active_load(net, default_net, total_load, rng, cfg)
+    elif stage == "reactive_load":
+        sample_reactive_load(net, default_net, rng, cfg)
+    elif stage == "active_gen":
+        sample_active_generation(net, default_net, total_load, rng, cfg)
+    else:
+        sample_voltage_setpoint(net, default_net, rng, cfg)
+
+
+def summarize(durations: list[float], n_errors: int = 0) -> dict:
+    """Returns the median, mean and minimum of `durations` in *ms*."""
+    durations = np.array(durations) * 1e3
+    return {"median_ms": float(np.median(durations)), "mean_ms": float(durations.mean()),
+            "min_ms": float(durations.min()), "n_runs": len(durations), "n_errors": n_errors}
+
+
+def bench_samplers(default_net, n_repeat: int) -> dict:
+    """Times each method of each sampling step on clones of `default_net`, excluding the cloning time."""
+    results = {}
+    for stage, cases in SAMPLER_CASES.items():
+        for method, params in cases:
+            cfg = OmegaConf.create({"method": method, "params": params})
+            durations, n_errors = [], 0
+            for k in range(n_repeat):
+                net = clone_net(default_net)
+                rng = get_rng(SEED, k)
+                start = time.perf_counter()
+                try:
+                    run_sampler(stage, net, default_net, rng, cfg)
+                except SamplingException:
+                    n_errors += 1
+                durations.append(time.perf_counter() - start)
+            name = "{}/{}".format(stage, method) + ("/highs" if params.get("backend") == "highs" else "") + (
+                "/secure" if params.get("line", {}).get("secure", False) else "")
+            results[name] = summarize(durations, n_errors)
+    return results
+
+
+def sample_solved_nets(default_net, cfg, n_samples: int) -> list:
+    """Samples power grids with the shipped configuration, and returns those whose power flow converged."""
+    plan = SamplingPlan(default_net, cfg.sampling)
+    nets = []
+    for k in range(n_samples):
+        try:
+            net = sample_power_grid(default_net, plan, get_rng(SEED, k))
+            run_power_flow(net, OmegaConf.to_container(cfg.powerflow))
+        except (SamplingException, pp.powerflow.LoadflowNotConverged):
+            continue
+        nets.append(net)
+    return nets
+
+
+def bench_filtering(nets: list, cfg) -> dict:
+    """Times `filter_sample` on solved power grids."""
+    durations = []
+    for net in nets:
+        start = time.perf_counter()
+        filter_sample(net, **cfg.filtering)
+        durations.append(time.perf_counter() - start)
+    return {"filter_sample": summarize(durations)}
+
+
+def bench_storage(nets: list, default_net) -> dict:
+    """Times the storage of solved power grids in each format, per sample, including the final flush."""
+    results = {}
+    for storage_format in STORAGE_FORMATS:
+        with tempfile.TemporaryDirectory() as path:
+            writer = get_writer(path, default_net, len(nets), OmegaConf.create({"format": storage_format}))
+            durations = []
+            for i, net in enumerate(nets):
+                start = time.perf_counter()
+                writer.write(i, net)
+                durations.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            writer.close()
+            durations[-1] += time.perf_counter() - start
+        results["storage/" + storage_format] = summarize(durations)
+    return results
+
+
+def bench_end_to_end(default_net, cfg, n_samples: int) -> dict:
+    """Builds a dataset of `n_samples` accepted samples with the shipped configuration, and returns the throughput."""
+    log = logging.getLogger(__name__)
+    with tempfile.TemporaryDirectory() as path:
+        start = time.perf_counter()
+        build_one_dataset(default_net, path, log, n_samples, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED,
+                          storage_cfg=cfg.storage, solver_cfg=cfg.solver)
+        duration = time.perf_counter() - start
+    return {"end_to_end": {"samples_per_s": n_samples / duration, "mean_ms": 1e3 * duration / n_samples,
+                           "n_runs": n_samples}}
+
+
+def metadata() -> dict:
+    """Returns the commit and versions the results were obtained with."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "scipy": scipy.__version__, "pandapower": pp.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "seed": SEED}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> None:
+    """Prints the ratio of the median (or mean) times of `results` and `baseline`, flagging large changes."""
+    print("\n{:<80} {:>10} {:>10} {:>8}".format("case", "base ms", "new ms", "ratio"))
+    for name, stats in results["cases"].items():
+        if name not in baseline["cases"]:
+            continue
+        key = "median_ms" if "median_ms" in stats else "mean_ms"
+        ratio = stats[key] / baseline["cases"][name][key]
+        flag = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 / (1 + threshold) else ""
+        print("{:<80} {:>10.3f} {:>10.3f} {:>8.2f} {}".format(name, baseline["cases"][name][key], stats[key], ratio,
+                                                              flag))
+
+
+def main() -> None:
+    """Runs all cases on all bundled power grids, and writes the results."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark_results.json", help="path of the JSON results")
+    parser.add_argument("--baseline", default=None, help="path of the JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change that is flagged")
+    parser.add_argument("--n-repeat", type=int, default=20, help="runs per sampler case")
+    parser.add_argument("--n-samples", type=int, default=20, help="samples for the filtering and storage cases")
+    parser.add_argument("--n-end-to-end", type=int, default=10, help="accepted samples for the end-to-end case")
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load('config/config.yaml')
+    cases = {}
+    for net_path in NET_PATHS:
+        print("Benchmarking {}...".format(net_path))
+        default_net = pp.from_json(net_path)
+        nets = sample_solved_nets(default_net, cfg, args.n_samples)
+        results = bench_samplers(default_net, args.n_repeat)
+        results.update(bench_filtering(nets, cfg))
+        results.update(bench_storage(nets, default_net))
+        results.update(bench_end_to_end(default_net, cfg, args.n_end_to_end))
+        cases.update({"{}/{}".format(net_path, name): stats for name, stats in results.items()})
+
+    results = {"metadata": metadata(), "parameters": vars(args), "cases": cases}
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("{:<80} {:>10} {:>10}".format("case", "median ms", "mean ms"))
+    for name, stats in cases.items():
+        print("{:<80} {:>10} {:>10.3f}".format(name, "{:.3f}".format(stats["median_ms"]) if "median_ms" in stats
+                                                else "", stats["mean_ms"]))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(results, json.load(f), args.threshold)
+
+
+if __name__ == '__main__':
+    main()
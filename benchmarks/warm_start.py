@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Compares the Newton-Raphson iteration counts and divergence rates of cold and warm started power flows.
+
+Power grids are sampled once using `config/config.yaml`, and the same sequence of power flows is then run with the
+configured initialization, and with a warm start from previously converged solutions.
+
+Run from the root of the repository with :
+    python -m benchmarks.warm_start [net_path] [n_samples] [init]
+
+where `init` optionally overrides the `powerflow.init` option of the configuration.
+"""
+
+import copy
+import sys
+import time
+
+import pandapower as pp
+from omegaconf import OmegaConf
+
+from powerdata_gen.powerflow import WarmStartStore, newton_iterations, run_power_flow
+from powerdata_gen.powergrid.core import SamplingPlan, sample_power_grid
+from powerdata_gen.utils import SamplingException, get_rng
+
+
+def sample_nets(default_net, sampling_cfg, n_samples: int, seed: int = 0) -> list:
+    """Samples `n_samples` power grids, skipping sampling errors."""
+    plan = SamplingPlan(default_net, sampling_cfg)
+    nets = []
+    attempt = 0
+    while len(nets) < n_samples:
+        try:
+            nets.append(sample_power_grid(default_net, plan, get_rng(seed, attempt)))
+        except SamplingException:
+            pass
+        attempt += 1
+    return nets
+
+
+def run(nets: list, powerflow_cfg, warm_start: WarmStartStore = None) -> dict:
+    """Runs power flows on copies of `nets`, and returns the average iteration count, divergence rate and time."""
+    iterations, divergences, duration = 0, 0, 0.
+    for net in nets:
+        net = copy.deepcopy(net)
+        start = time.perf_counter()
+        try:
+            run_power_flow(net, powerflow_cfg, warm_start=warm_start)
+        except pp.powerflow.LoadflowNotConverged:
+            divergences += 1
+        duration += time.perf_counter() - start
+        iterations += newton_iterations(net)
+    return {"iterations": iterations / len(nets), "divergence_rate": divergences / len(nets),
+            "time_ms": 1e3 * duration / len(nets)}
+
+
+def main(net_path: str = 'inputs/case60nordic_vanilla.json', n_samples: int = 200, init: str = None) -> None:
+    """Prints the statistics of cold and warm started power flows."""
+    cfg = OmegaConf.load('config/config.yaml')
+    default_net = pp.from_json(net_path)
+    nets = sample_nets(default_net, cfg.sampling, n_samples, cfg.seed)
+    powerflow_cfg = OmegaConf.to_container(cfg.powerflow)
+    if init is not None:
+        powerflow_cfg["init"] = init
+
+    warm_start = WarmStartStore(default_net, cfg.solver.get("warm_start_size", 16) or 16,
+                                cfg.solver.get("warm_start_topologies", 128))
+    results = {"cold": run(nets, powerflow_cfg), "warm": run(nets, powerflow_cfg, warm_start)}
+
+    print("{:<10} {:>12} {:>16} {:>12}".format("start", "iterations", "divergence rate", "time ms"))
+    for name, result in results.items():
+        print("{:<10} {:>12.2f} {:>16.2%} {:>12.2f}".format(name, result["iterations"], result["divergence_rate"],
+                                                          result["time_ms"]))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *[int(n) for n in sys.argv[2:3]], *sys.argv[3:4])
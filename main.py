@@ -21,7 +21,10 @@ def main(cfg: DictConfig) -> None:
     save_path = hydra.core.hydra_config.HydraConfig.get().runtime.output_dir
     shutil.copyfile(cfg.default_net_path, os.path.join(save_path, 'default_net.json'))
     build_datasets(cfg.default_net_path, save_path, log, cfg.n_train, cfg.n_val, cfg.n_test, cfg.keep_reject,
-                   cfg.sampling, cfg.powerflow, cfg.filtering, cfg.seed)
+                   cfg.sampling, cfg.powerflow, cfg.filtering, cfg.seed, cfg.n_workers,
+                   cfg.storage, cfg.solver, cfg.get("shard_index", 0), cfg.get("num_shards", 1),
+                   cfg.get("profiling"), cfg.get("reject_format", "net"), cfg.get("timeout"),
+                   cfg.get("adaptive"))
 
 
 if __name__ == '__main__':
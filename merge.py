@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Merges datasets that were built in shards on several nodes into a single dataset."""
+
+import argparse
+import logging
+import os
+
+from powerdata_gen.merge import merge_datasets
+
+log = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """Merges the output directories of all shards into `--output`."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("shard_paths", nargs="+", help="output directories of the shards")
+    parser.add_argument("--output", required=True, help="output directory of the merged dataset")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs(args.output, exist_ok=True)
+    merge_datasets(args.shard_paths, args.output, log)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
 # -*- coding: utf-8 -*-
 """Samples power grid datasets."""
 
-from powerdata_gen.dataset import build_datasets
+from powerdata_gen.dataset import build_datasets, iter_samples
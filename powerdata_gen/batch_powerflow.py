@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""Solves the AC power flows of many injection scenarios of a single topology at once."""
+
+import copy
+
+import numpy as np
+import pandapower as pp
+from pandapower import pandapowerNet
+from pandapower.auxiliary import _clean_up
+from pandapower.pypower.bustypes import bustypes
+from pandapower.pypower.idx_brch import F_BUS, PF, PT, QF, QT, T_BUS
+from pandapower.pypower.idx_bus import PD, QD, VA, VM
+from pandapower.pypower.idx_gen import GEN_BUS, PG, QG, QMAX, QMIN, SL_FAC, VG
+from pandapower.results import _copy_results_ppci_to_ppc, _extract_results, init_results, verify_results
+from scipy import sparse
+
+from powerdata_gen.powerflow import INTERNAL_KEYS, PowerFlowCache, run_power_flow, topology_key
+from powerdata_gen.powergrid.core import clone_net
+
+SCENARIO_COLUMNS = {"load": ["p_mw", "q_mvar"], "sgen": ["p_mw", "q_mvar"], "gen": ["p_mw", "vm_pu"],
+                    "ext_grid": ["vm_pu"]}
+EPS = np.finfo(float).eps
+
+
+class BatchPowerFlow:
+    """Newton-Raphson AC power flow solver for a batch of injection scenarios that share the topology of `net`.
+
+    The admittance matrices, bus types and pandapower to PPC lookups are built once, by a regular power flow on a
+    copy of `net`, whose solution is also the starting point of all scenarios. If `cache` is provided, this power
+    flow reuses the structures it holds for the topology of `net`, or stores them. Scenarios only differ by the
+    columns of `SCENARIO_COLUMNS`, given as arrays of shape (n_scenarios, n_elements) keyed by `<table>/<column>` as
+    returned by `sample_scenarios` : other keys are ignored, and missing ones keep the values of `net`.
+    Mismatches and Jacobians of all scenarios are evaluated together using dense matrices, which suits grids of up to
+    a few hundred buses. If `enforce_q_lims` is set, generators that violate their reactive power limits are switched
+    to PQ as in pandapower, and the affected scenarios are solved again.
+    """
+
+    def __init__(self, net: pandapowerNet, cache: PowerFlowCache = None, **powerflow_kwargs):
+        template = clone_net(net)
+        try:
+            run_power_flow(template, powerflow_kwargs, cache)
+        except pp.powerflow.LoadflowNotConverged:
+            pass
+        options = template._options
+        if options["algorithm"] != "nr" or options["distributed_slack"]:
+            raise ValueError("Only the Newton-Raphson algorithm without distributed slack is supported")
+        voltage_dependent = (net.load.const_z_percent != 0) | (net.load.const_i_percent != 0)
+        if options["voltage_depend_loads"] and voltage_dependent.any():
+            raise ValueError("Voltage dependent loads are not supported")
+        self.max_iteration = options["max_iteration"]
+        self.tolerance = options["tolerance_mva"]
+        self.enforce_q_lims = bool(options["enforce_q_lims"])
+        self.topology = topology_key(net)
+        self.internals = {key: template[key] for key in INTERNAL_KEYS}
+
+        ppci = template._ppc["internal"]
+        self.base_mva = ppci["baseMVA"]
+        self.bus, self.gen, self.branch = ppci["bus"], ppci["gen"], ppci["branch"]
+        self.ybus = ppci["Ybus"].toarray()
+        self.yf, self.yt = ppci["Yf"].tocsr(), ppci["Yt"].tocsr()
+        n_bus, n_gen = len(self.bus), len(self.gen)
+        self.gen_bus = self.gen[:, GEN_BUS].real.astype(np.int64)
+        # Bus types are not read from the PPC, where pandapower may leave buses of limited generators as PQ.
+        self.ref, _, _ = bustypes(self.bus, self.gen)
+        self.non_ref = np.setdiff1d(np.arange(n_bus), self.ref)
+        self.is_pv = np.isin(np.arange(n_bus), np.setdiff1d(self.gen_bus, self.ref))
+        self.is_ref_gen = np.isin(np.arange(n_gen), ppci["ref_gens"])
+        self.cg = np.zeros((n_gen, n_bus))
+        self.cg[np.arange(n_gen), self.gen_bus] = 1.
+        if template.converged:
+            self.v0 = ppci["V"].copy()
+        else:
+            self.v0 = np.ones(n_bus, dtype=complex)
+            self.v0[self.ref] = np.exp(1j * np.angle(ppci["V"][self.ref]))
+
+        # Loads and static generators are mapped to the demand of their bus, generators to their internal PPC row.
+        lookups = template._pd2ppc_lookups
+        self.demand_maps = {}
+        for table, sign in [("load", 1.), ("sgen", -1.)]:
+            elements = net[table]
+            positions = lookups["bus"][elements.bus.values] if len(elements) else np.zeros(0, dtype=np.int64)
+            valid = elements.in_service.values.astype(bool) & (positions < n_bus)
+            self.demand_maps[table] = sparse.csr_matrix(
+                (sign * elements.scaling.values[valid], (np.flatnonzero(valid), positions[valid])),
+                shape=(len(elements), n_bus))
+        gen_is = ppci["gen_is"]
+        self.gen_rows = {}
+        for table in ["gen", "ext_grid"]:
+            if table not in lookups or not len(net[table]):
+                continue
+            rows = lookups[table][net[table].index.values]
+            valid = rows >= 0
+            valid[valid] = gen_is[rows[valid]]
+            self.gen_rows[table] = (np.flatnonzero(valid), np.cumsum(gen_is)[rows[valid]] - 1)
+        self.values = {"{}/{}".format(table, column): net[table][column].values.astype(float)
+                       for table, columns in SCENARIO_COLUMNS.items() for column in columns}
+        self.gen_scaling = net.gen.scaling.values
+
+    def injections(self, scenarios: dict[str, np.ndarray], n_scenarios: int) -> tuple:
+        """Returns the bus demands, generator active powers and voltage set points of all scenarios, in *MW*, *MVAr*
+        and *p.u.*, in the order of the internal PPC."""
+        pd_mw = np.tile(self.bus[:, PD], (n_scenarios, 1))
+        qd_mvar = np.tile(self.bus[:, QD], (n_scenarios, 1))
+        pg_mw = np.tile(self.gen[:, PG], (n_scenarios, 1))
+        vg_pu = np.tile(self.gen[:, VG], (n_scenarios, 1))
+        for key, values in scenarios.items():
+            if key not in self.values:
+                continue
+            table, column = key.split("/")
+            if table in self.demand_maps:
+                demand = pd_mw if column == "p_mw" else qd_mvar
+                demand += self.demand_maps[table].T.dot((values - self.values[key]).T).T
+            elif table in self.gen_rows:
+                positions, rows = self.gen_rows[table]
+                if column == "p_mw":
+                    pg_mw[:, rows] = values[:, positions] * self.gen_scaling[positions]
+                else:
+                    vg_pu[:, rows] = values[:, positions]
+        return pd_mw, qd_mvar, pg_mw, vg_pu
+
+    def solve(self, scenarios: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        """Solves the power flows of all scenarios.
+
+        Returns the complex bus voltages `v`, the bus demands `pd_mw` and `qd_mvar`, the generator set points and
+        results `vg_pu`, `pg_mw` and `qg_mvar`, in the order of the internal PPC, along with the `converged` mask,
+        the amount of Newton-Raphson `iterations` of the last round, and the mask of generators `limited` to their
+        reactive power limits, for each scenario.
+        """
+        n_scenarios = next(len(values) for key, values in scenarios.items() if key in self.values)
+        pd_mw, qd_mvar, pg_mw, vg_pu = self.injections(scenarios, n_scenarios)
+        v = np.tile(self.v0, (n_scenarios, 1))
+        limited = np.zeros(pg_mw.shape, dtype=bool)
+        fixed_q = np.zeros(pg_mw.shape)
+        qg_mvar = np.zeros(pg_mw.shape)
+        converged = np.zeros(n_scenarios, dtype=bool)
+        iterations = np.zeros(n_scenarios, dtype=int)
+        q_min, q_max = self.gen[:, QMIN], self.gen[:, QMAX]
+
+        # Each round solves the scenarios whose generators violated their limits in the previous one, from its solution.
+        active = np.arange(n_scenarios)
+        while len(active):
+            on = ~limited[active]
+            q_fixed = np.where(on, 0., fixed_q[active])
+            pv = self.is_pv & ~(limited[active] @ self.cg > 0)
+            s_bus = ((pg_mw[active] + 1j * np.where(on, qg_mvar[active], q_fixed)) @ self.cg -
+                     (pd_mw[active] + 1j * qd_mvar[active])) / self.base_mva
+            v0 = self.initial_voltages(v[active], vg_pu[active], on)
+            v[active], converged[active], iterations[active] = self.newton(v0, s_bus, pv)
+            s_calc = v[active] * np.conj(v[active] @ self.ybus.T)
+            qg_mvar[active] = self.distribute_q(s_calc, qd_mvar[active] - q_fixed @ self.cg, on)
+            if not self.enforce_q_lims:
+                break
+            above = on & ~self.is_ref_gen & (qg_mvar[active] > q_max)
+            below = on & ~self.is_ref_gen & (qg_mvar[active] < q_min)
+            fixed_q[active] = np.where(above, q_max, np.where(below, q_min, fixed_q[active]))
+            limited[active] |= above | below
+            active = active[(above | below).any(axis=1)]
+
+        qg_mvar = np.where(limited, fixed_q, qg_mvar)
+        s_calc = v * np.conj(v @ self.ybus.T)
+        pg_mw = self.slack_power(s_calc, pd_mw, pg_mw)
+        return {"v": v, "pd_mw": pd_mw, "qd_mvar": qd_mvar, "vg_pu": vg_pu, "pg_mw": pg_mw, "qg_mvar": qg_mvar,
+                "converged": converged, "iterations": iterations, "limited": limited}
+
+    def initial_voltages(self, v: np.ndarray, vg_pu: np.ndarray, on: np.ndarray) -> np.ndarray:
+        """Returns the voltages `v` with the magnitudes of the buses of generators that are `on` set to their set
+        points. As in pandapower, the last generator of a bus sets its voltage."""
+        vm = np.abs(v)
+        for g, bus in enumerate(self.gen_bus):
+            vm[:, bus] = np.where(on[:, g], vg_pu[:, g], vm[:, bus])
+        return vm * np.exp(1j * np.angle(v))
+
+    def mismatch(self, v: np.ndarray, s_bus: np.ndarray, pq: np.ndarray) -> np.ndarray:
+        """Returns the active power mismatches of non-reference buses, followed by their reactive power mismatches,
+        which are zero for PV buses, in *p.u.*."""
+        mis = (v * np.conj(v @ self.ybus.T) - s_bus)[:, self.non_ref]
+        return np.concatenate([mis.real, np.where(pq, mis.imag, 0.)], axis=1)
+
+    def newton(self, v: np.ndarray, s_bus: np.ndarray, pv: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Runs the Newton-Raphson iterations of all scenarios from the voltages `v`, where `pv` masks the PV buses.
+
+        Voltage angles and magnitudes of all non-reference buses are unknowns, so that the Jacobians of all scenarios
+        have the same size : the reactive power equation of a PV bus is replaced by a fixed magnitude.
+        Returns the voltages, the convergence mask and the amount of iterations of each scenario.
+        """
+        v = v.copy()
+        idx = self.non_ref
+        m = len(idx)
+        y = self.ybus[np.ix_(idx, idx)]
+        pq = ~pv[:, idx]
+        diagonal = np.arange(m)
+        f = self.mismatch(v, s_bus, pq)
+        converged = np.abs(f).max(axis=1, initial=0.) < self.tolerance
+        iterations = np.zeros(len(v), dtype=int)
+        active = np.flatnonzero(~converged)
+        for i in range(1, self.max_iteration + 1):
+            if not len(active):
+                break
+            v_a = v[active][:, idx]
+            i_bus = (v[active] @ self.ybus.T)[:, idx]
+            v_norm = v_a / np.abs(v_a)
+            ds_dva = -1j * v_a[:, :, None] * np.conj(y[None] * v_a[:, None, :])
+            ds_dva[:, diagonal, diagonal] += 1j * v_a * np.conj(i_bus)
+            ds_dvm = v_a[:, :, None] * np.conj(y[None] * v_norm[:, None, :])
+            ds_dvm[:, diagonal, diagonal] += np.conj(i_bus) * v_norm
+            jacobian = np.concatenate([np.concatenate([ds_dva.real, ds_dvm.real], axis=2),
+                                       np.concatenate([ds_dva.imag, ds_dvm.imag], axis=2)], axis=1)
+            jacobian[:, m:, :] *= pq[active][:, :, None]
+            rows, buses = np.nonzero(~pq[active])
+            jacobian[rows, m + buses, m + buses] = 1.
+            dx, solved = solve_batch(jacobian, -f[active])
+
+            va, vm = np.angle(v[active]), np.abs(v[active])
+            va[:, idx] += dx[:, :m]
+            vm[:, idx] += dx[:, m:]
+            v[active] = vm * np.exp(1j * va)
+            f[active] = self.mismatch(v[active], s_bus[active], pq[active])
+            iterations[active] = i
+            done = solved & (np.abs(f[active]).max(axis=1, initial=0.) < self.tolerance)
+            converged[active[done]] = True
+            active = active[~done & solved]
+        return v, converged, iterations
+
+    def distribute_q(self, s_calc: np.ndarray, qd_mvar: np.ndarray, on: np.ndarray) -> np.ndarray:
+        """Returns the reactive power of generators that are `on`, given the bus injections `s_calc` and demands
+        `qd_mvar`. As in pandapower, the reactive power of a bus is split among its generators in proportion to their
+        reactive power ranges, or equally if the total range is zero."""
+        q_bus = s_calc.imag * self.base_mva + qd_mvar
+        n_gen_bus = (on @ self.cg)[:, self.gen_bus]
+        q_min_bus = ((on * self.gen[:, QMIN]) @ self.cg)[:, self.gen_bus]
+        q_max_bus = ((on * self.gen[:, QMAX]) @ self.cg)[:, self.gen_bus]
+        q_gen = q_bus[:, self.gen_bus] / np.maximum(n_gen_bus, 1.)
+        proportional = (n_gen_bus > 1) & (q_min_bus != q_max_bus)
+        if proportional.any():
+            q_range = self.gen[:, QMAX] - self.gen[:, QMIN]
+            q_split = self.gen[:, QMIN] + (q_bus[:, self.gen_bus] - q_min_bus) / (q_max_bus - q_min_bus + EPS) * q_range
+            q_gen = np.where(proportional, q_split, q_gen)
+        return np.where(on, q_gen, 0.)
+
+    def slack_power(self, s_calc: np.ndarray, pd_mw: np.ndarray, pg_mw: np.ndarray) -> np.ndarray:
+        """Returns the generator active powers `pg_mw`, where those of reference generators are set to balance their
+        bus. As in pandapower, other generators of a reference bus keep their set point, and the rest is split among
+        its reference generators according to their slack weights."""
+        pg_mw = pg_mw.copy()
+        for bus in self.ref:
+            gens = np.flatnonzero(self.gen_bus == bus)
+            if not len(gens):
+                continue
+            p_bus = s_calc[:, bus].real * self.base_mva + pd_mw[:, bus]
+            if len(gens) == 1:
+                pg_mw[:, gens[0]] = p_bus
+                continue
+            ref_gens, other_gens = gens[self.is_ref_gen[gens]], gens[~self.is_ref_gen[gens]]
+            p_ref = p_bus - pg_mw[:, other_gens].sum(axis=1)
+            weights = self.gen[ref_gens, SL_FAC]
+            if weights.sum() > 0:
+                pg_mw[:, ref_gens] += (p_ref - pg_mw[:, ref_gens].sum(axis=1))[:, None] * weights / weights.sum()
+            else:
+                pg_mw[:, ref_gens] = p_ref[:, None] / len(ref_gens)
+        return pg_mw
+
+    def write_results(self, net: pandapowerNet, solution: dict[str, np.ndarray], k: int) -> None:
+        """Writes the solution of the scenario `k` into the result tables of `net`, as `pp.runpp` would.
+
+        `net` should share the topology of the solver and hold the injections of the scenario `k`.
+        Raises `pp.powerflow.LoadflowNotConverged` if the power flow of this scenario diverged.
+        """
+        for key in INTERNAL_KEYS:
+            if key != "_ppc":
+                net[key] = copy.deepcopy(self.internals[key])
+        if not solution["converged"][k]:
+            net["converged"] = False
+            raise pp.powerflow.LoadflowNotConverged("Power Flow nr did not converge after {} iterations!".format(
+                self.max_iteration))
+
+        v = solution["v"][k]
+        bus, gen, branch = self.bus.copy(), self.gen.copy(), self.branch.copy()
+        bus[:, VM], bus[:, VA] = np.abs(v), np.angle(v, deg=True)
+        bus[:, PD], bus[:, QD] = solution["pd_mw"][k], solution["qd_mvar"][k]
+        gen[:, PG], gen[:, QG], gen[:, VG] = solution["pg_mw"][k], solution["qg_mvar"][k], solution["vg_pu"][k]
+        s_from = v[branch[:, F_BUS].real.astype(np.int64)] * np.conj(self.yf @ v) * self.base_mva
+        s_to = v[branch[:, T_BUS].real.astype(np.int64)] * np.conj(self.yt @ v) * self.base_mva
+        branch[:, PF], branch[:, QF], branch[:, PT], branch[:, QT] = s_from.real, s_from.imag, s_to.real, s_to.imag
+
+        template = self.internals["_ppc"]
+        internal = dict(template["internal"], bus=bus, gen=gen, branch=branch, V=v)
+        result = {"bus": bus, "gen": gen, "branch": branch, "svc": internal["svc"], "tcsc": internal["tcsc"],
+                  "internal": internal, "success": True, "et": 0., "iterations": int(solution["iterations"][k])}
+        ppc = dict(template, internal=dict(template["internal"]),
+                   **{key: template[key].copy() for key in ["bus", "gen", "branch", "svc", "tcsc"]})
+        net["_ppc"] = _copy_results_ppci_to_ppc(result, ppc, net._options["mode"])
+        net["converged"] = True
+        if net._options["init_results"]:
+            verify_results(net)
+        else:
+            init_results(net)
+        _extract_results(net, net["_ppc"])
+        _clean_up(net)
+
+
+def solve_batch(jacobian: np.ndarray, f: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Solves the linear systems `jacobian @ dx = f` of all scenarios, and returns the solutions along with the mask
+    of scenarios whose Jacobian is not singular."""
+    try:
+        return np.linalg.solve(jacobian, f[..., None])[..., 0], np.ones(len(f), dtype=bool)
+    except np.linalg.LinAlgError:
+        dx, solved = np.zeros(f.shape), np.ones(len(f), dtype=bool)
+        for k in range(len(f)):
+            try:
+                dx[k] = np.linalg.solve(jacobian[k], f[k])
+            except np.linalg.LinAlgError:
+                solved[k] = False
+        return dx, solved
+
+
+def stack_scenarios(nets: list[pandapowerNet]) -> dict[str, np.ndarray]:
+    """Returns the columns of `SCENARIO_COLUMNS` of power grids that share the same topology, as scenarios."""
+    return {"{}/{}".format(table, column): np.stack([net[table][column].values.astype(float) for net in nets])
+            for table, columns in SCENARIO_COLUMNS.items() for column in columns}
+
+
+def run_power_flows(nets: list[pandapowerNet], powerflow_kwargs: dict, cache: PowerFlowCache = None) -> np.ndarray:
+    """Runs the AC power flows of power grids that share the same topology at once, and writes their results.
+
+    Returns the mask of converged power flows. Divergent power grids have their `converged` flag set to False.
+    Raises a `ValueError` if the power grids do not share the same topology.
+    """
+    solver = BatchPowerFlow(nets[0], cache, **powerflow_kwargs)
+    if any(topology_key(net) != solver.topology for net in nets[1:]):
+        raise ValueError("All power grids of a batch should share the same topology")
+    solution = solver.solve(stack_scenarios(nets))
+    for k, net in enumerate(nets):
+        try:
+            solver.write_results(net, solution, k)
+        except pp.powerflow.LoadflowNotConverged:
+            continue
+    return solution["converged"]
@@ -1,107 +1,937 @@
 # -*- coding: utf-8 -*-
 """Samples power grid datasets."""
 
+import contextlib
+import itertools
+import json
 import logging
+import multiprocessing
 import os
+import time
+from collections import deque
+from typing import Iterable, Iterator
 
 import numpy as np
 import pandapower as pp
-import pandapower.topology as top
 import tqdm
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 from pandapower import pandapowerNet
 
-from powerdata_gen.powergrid.core import sample_power_grid
-from powerdata_gen.utils import SamplingException
+from powerdata_gen.batch_powerflow import BatchPowerFlow, stack_scenarios
+from powerdata_gen.graph import share_outage_sets, shared_outage_sets, unsupplied_buses
+from powerdata_gen.powerflow import (DCScreen, PowerFlowCache, WarmStartStore, compile_powerflow, compile_recovery,
+                                     newton_iterations, recover_power_flow, run_power_flow, structure_key,
+                                     topology_key)
+from powerdata_gen.powergrid.active_generation import dc_opf_loading_limit
+from powerdata_gen.powergrid.core import (SamplingPlan, compile_sampling, sample_power_grid_injections,
+                                          sample_power_grid_topology)
+from powerdata_gen.profiling import PipelineProfiler, SampleProfile, running, timed
+from powerdata_gen.proposal import AdaptiveProposal, ProposalTable, Thinned
+from powerdata_gen.storage import (ADAPTIVE_RECORDS_FILE, RECOVERY_RECORDS_FILE, TIMEOUT_RECORDS_FILE, RecordWriter,
+                                   extract_features, get_writer, load_manifest, load_reject_records, name_width,
+                                   pad_file_names, save_manifest, submit)
+from powerdata_gen.utils import SamplingException, bind, get_rng
+from powerdata_gen.watchdog import AttemptTimeout, Watchdog, attempt_budget, get_watchdog
+
+REJECT_FORMATS = ["net", "seed"]
+# Minimum amount of attempts of a topology whose power flows are solved together.
+MIN_BATCH_SIZE = 2
+# Minimum amount of newly stored samples before the manifest is saved again while sampling.
+CHECKPOINT_INTERVAL = 100
 
 
 def build_datasets(net_path: pandapowerNet, save_path: str, log: logging.Logger, n_train: int, n_val: int, n_test: int,
                    keep_reject: bool, sampling_cfg: DictConfig, powerflow_cfg: DictConfig, filtering_cfg: DictConfig,
-                   seed=None) -> None:
-    """Builds train, val and test sets."""
-    if seed is not None:
-        np.random.seed(seed)
+                   seed=None, n_workers: int = 1, storage_cfg: DictConfig = None, solver_cfg: DictConfig = None,
+                   shard_index: int = 0, num_shards: int = 1, profiling_cfg: DictConfig = None,
+                   reject_format: str = "net", timeout_cfg: DictConfig = None,
+                   adaptive_cfg: DictConfig = None) -> None:
+    """Builds train, val and test sets.
+
+    Each sampling attempt draws from its own random stream, derived from `seed`, the dataset and the sample index,
+    so that the generated datasets do not depend on `n_workers`. Datasets that already exist in `save_path` are
+    resumed or extended, cf. `build_one_dataset`. If no seed is provided, the one of existing datasets is reused.
+    If `num_shards` > 1, only the slice `shard_index` of each dataset is built, cf. `shard_range`. Shards built
+    independently with the same seed can be combined using `powerdata_gen.merge.merge_datasets`.
+    If `keep_reject` is True, rejected attempts are stored in the format `reject_format`, cf. `build_one_dataset`.
+    Attempts that exceed the time budgets of `timeout_cfg` are aborted, cf. `watchdog.Watchdog`.
+    If enabled in `adaptive_cfg`, attempts are proposed adaptively, cf. `proposal.AdaptiveProposal`.
+    """
+    split_names = ['train', 'val', 'test']
+    if seed is None:
+        manifests = [load_manifest(os.path.join(save_path, name)) for name in split_names
+                     if os.path.isdir(os.path.join(save_path, name))]
+        manifests = [manifest for manifest in manifests if manifest is not None]
+        if manifests:
+            seed = manifests[0]["seed"]
+            log.info("No seed provided, using seed {} of the existing datasets".format(seed))
+        else:
+            if num_shards > 1:
+                raise ValueError("A seed should be provided to build shards, so that they share the same one")
+            seed = np.random.SeedSequence().entropy
+            log.info("No seed provided, using seed {}".format(seed))
     default_net = pp.from_json(net_path)
     log.info("Building the train set...")
     build_one_dataset(default_net, os.path.join(save_path, 'train'), log, n_train, keep_reject, sampling_cfg,
-                      powerflow_cfg, filtering_cfg)
+                      powerflow_cfg, filtering_cfg, seed, 0, n_workers, storage_cfg, solver_cfg, shard_index,
+                      num_shards, profiling_cfg, reject_format, timeout_cfg, adaptive_cfg)
     log.info("Building the validation set...")
     build_one_dataset(default_net, os.path.join(save_path, 'val'), log, n_val, keep_reject, sampling_cfg, powerflow_cfg,
-                      filtering_cfg)
+                      filtering_cfg, seed, 1, n_workers, storage_cfg, solver_cfg, shard_index, num_shards,
+                      profiling_cfg, reject_format, timeout_cfg, adaptive_cfg)
     log.info("Building the test set...")
     build_one_dataset(default_net, os.path.join(save_path, 'test'), log, n_test, keep_reject, sampling_cfg,
-                      powerflow_cfg, filtering_cfg)
+                      powerflow_cfg, filtering_cfg, seed, 2, n_workers, storage_cfg, solver_cfg, shard_index,
+                      num_shards, profiling_cfg, reject_format, timeout_cfg, adaptive_cfg)
+
+
+def shard_range(n_files: int, shard_index: int = 0, num_shards: int = 1) -> range:
+    """Returns the contiguous slice of the sample indices of a dataset of `n_files` samples, that is built by the
+    shard `shard_index` out of `num_shards`. Slices are disjoint, cover all indices, and differ in size by at most 1.
+    """
+    if not 0 <= shard_index < num_shards:
+        raise ValueError("shard_index should be in [0, {}), got {}".format(num_shards, shard_index))
+    return range(shard_index * n_files // num_shards, (shard_index + 1) * n_files // num_shards)
 
 
 def build_one_dataset(default_net: pandapowerNet, path: str, log: logging.Logger, n_files: int, keep_reject: bool,
-                      sampling_cfg: DictConfig, powerflow_cfg: DictConfig, filtering_cfg: DictConfig) -> None:
-    """Builds a single dataset."""
+                      sampling_cfg: DictConfig, powerflow_cfg: DictConfig, filtering_cfg: DictConfig, seed: int = None,
+                      dataset_id: int = 0, n_workers: int = 1, storage_cfg: DictConfig = None,
+                      solver_cfg: DictConfig = None, shard_index: int = 0, num_shards: int = 1,
+                      profiling_cfg: DictConfig = None, reject_format: str = "net",
+                      timeout_cfg: DictConfig = None, adaptive_cfg: DictConfig = None) -> None:
+    """Builds a single dataset, possibly sampling in `n_workers` parallel processes.
+
+    If `num_shards` > 1, only the samples of `shard_range(n_files, shard_index, num_shards)` are built, and keep their
+    index in the whole dataset. Sharded datasets can be resumed, but not extended.
+
+    Progress is checkpointed into a `manifest.json` file, which records the amount of stored samples and the running
+    statistics, along with the seed and the configuration, every `CHECKPOINT_INTERVAL` stored samples and when the
+    sampling stops. If `path` already contains a manifest, the dataset is resumed from its last checkpoint, or
+    extended up to `n_files` samples if it is already complete. Since each sample only depends on the seed and its
+    index, resumed datasets are the same as uninterrupted ones (up to the power flow tolerance when the solver cache
+    or warm start is used). Resuming with a different seed or
+    configuration raises a `ValueError`, and a non-empty `path` without a manifest raises a `FileExistsError`.
+
+    If profiling is enabled in `profiling_cfg`, the time spent in each stage is reported into `path/profile`, cf.
+    `PipelineProfiler.save`. The report only covers the samples built by this call.
+
+    If `keep_reject` is True, rejected attempts are stored as full pandapower .json files in `path/divergence` and
+    `path/rejection` if `reject_format` is `net`, or as compact records in `path/rejected_attempts.jsonl` if it is
+    `seed`, including sampling errors, cf. `reject_record`. Recorded attempts can be regenerated with
+    `powerdata_gen.replay.replay_attempt`.
+
+    If `timeout_cfg` sets time budgets, attempts that exceed them are aborted and counted as timeouts, and their
+    records are always stored in `path/timeouts.jsonl`, along with the exceeded budget and the stage it was exceeded in.
+    As budgets are measured in wall-clock time, samples whose attempts time out depend on the speed of the machine.
+
+    If the `powerflow` configuration has a `recovery` chain, the power flows that do not converge are tried again with
+    its steps before the attempt is counted as a divergence, and the records of the recovered attempts are always
+    stored in `path/recoveries.jsonl`, along with the step that recovered them, cf. `powerflow.compile_recovery`.
+
+    If enabled in `adaptive_cfg`, samples are built by epochs, and the attempts of each epoch are thinned out
+    according to the acceptance rates of the outage sets and total load bins of the previous ones, cf.
+    `proposal.AdaptiveProposal`. The weight of each sample and its completed attempts are stored in
+    `path/adaptive.jsonl`, and weighting samples by it corrects for the thinning. Adaptive datasets cannot be sharded.
 
-    net = None
-    os.mkdir(path)
-    if keep_reject:
+    The sampling, power flow and filtering configurations are compiled before anything is written, so that invalid
+    methods or parameters raise a `ValueError` right away, cf. `sampling_context`.
+    """
+    context = sampling_context(default_net, keep_reject, sampling_cfg, powerflow_cfg, filtering_cfg, seed, dataset_id,
+                               solver_cfg, reject_format, timeout_cfg)
+    proposal = None
+    if adaptive_cfg is not None and adaptive_cfg.get("enabled", False):
+        if num_shards > 1:
+            raise ValueError("Adaptive proposals depend on all the previous samples, and cannot be sharded")
+        params = {k: v for k, v in _to_container(adaptive_cfg).items() if k != "enabled"}
+        proposal = bind(AdaptiveProposal, 0, params, "the adaptive proposal")()
+
+    # The queue size of the storage does not change the samples, and can differ when resuming.
+    storage_config = _to_container(storage_cfg)
+    if storage_config is not None:
+        storage_config = {k: v for k, v in storage_config.items() if k != "queue_size"}
+    config = json.loads(json.dumps({
+        "keep_reject": keep_reject, "sampling": _to_container(sampling_cfg), "powerflow": _to_container(powerflow_cfg),
+        "filtering": _to_container(filtering_cfg), "storage": storage_config}))
+    if reject_format != "net":
+        config["reject_format"] = reject_format
+    if proposal is not None:
+        config["adaptive"] = _to_container(adaptive_cfg)
+    manifest = load_manifest(path) if os.path.isdir(path) else None
+    if manifest is None:
+        if os.path.isdir(path) and os.listdir(path):
+            raise FileExistsError("{} is not empty and has no manifest to resume from".format(path))
+        os.makedirs(path, exist_ok=True)
+        manifest = {"seed": seed, "dataset_id": dataset_id, "config": config, "shard_index": shard_index,
+                    "num_shards": num_shards, "n_files": n_files, "n_completed": 0, "counts": {},
+                    "filtering_info": {}, "cache_info": {}}
+        save_manifest(path, manifest)
+    else:
+        for key, value in [("seed", seed), ("dataset_id", dataset_id), ("config", config),
+                           ("shard_index", shard_index), ("num_shards", num_shards)]:
+            if manifest[key] != value:
+                raise ValueError("The {} differs from the one of the existing dataset {}, which cannot be resumed "
+                                 "or extended".format(key, path))
+        if num_shards > 1 and manifest["n_files"] != n_files:
+            raise ValueError("The shard {} was built for {} samples, sharded datasets cannot be extended".format(
+                path, manifest["n_files"]))
+        log.info("Resuming {} from sample {} out of {}".format(path, manifest["n_completed"], n_files))
+    indices = shard_range(n_files, shard_index, num_shards)
+    start = indices.start + manifest["n_completed"]
+    n_characters = name_width(n_files)
+    pad_file_names(path, 'sample_', n_characters)
+    records = None
+    if keep_reject and reject_format == "seed":
+        records = RecordWriter(path, start)
+    elif keep_reject:
         divergence_path = os.path.join(path, "divergence")
-        os.mkdir(divergence_path)
+        os.makedirs(divergence_path, exist_ok=True)
+        pad_file_names(divergence_path, 'divergence_sample_', n_characters)
         reject_path = os.path.join(path, "rejection")
-        os.mkdir(reject_path)
+        os.makedirs(reject_path, exist_ok=True)
+        pad_file_names(reject_path, 'rejection_sample_', n_characters)
+    # Records that are stored whatever `keep_reject`, by outcome.
+    record_writers = {}
+    for outcome, file_name, enabled in [("timeout", TIMEOUT_RECORDS_FILE, "watchdog" in context),
+                                        ("recovery", RECOVERY_RECORDS_FILE, "recovery" in context),
+                                        ("adaptive", ADAPTIVE_RECORDS_FILE, proposal is not None)]:
+        if enabled or os.path.exists(os.path.join(path, file_name)):
+            record_writers[outcome] = RecordWriter(path, start, file_name)
+    if proposal is not None:
+        # The proposal of the remaining samples depends on the statistics of the stored ones.
+        for record in load_reject_records(path, ADAPTIVE_RECORDS_FILE):
+            proposal.update(record)
 
-    n_characters = np.ceil(np.log10(n_files)).astype(int)
-    pbar = tqdm.tqdm(range(n_files))
+    writer = get_writer(path, default_net, n_files, storage_cfg, start)
+    if profiling_cfg is None:
+        profiling_cfg = {}
+    profiler = None
+    if profiling_cfg.get("enabled", False):
+        profiler = PipelineProfiler(profiling_cfg.get("n_slowest", 0))
+        context.update(profile=True, cprofile=profiler.n_slowest > 0)
+    if proposal is None:
+        samples = imap_samples(range(start, indices.stop), n_workers, **context)
+    else:
+        samples = imap_adaptive(range(start, indices.stop), proposal, n_workers, **context)
+    pbar = tqdm.tqdm(samples,
+                     initial=min(start, indices.stop) - indices.start, total=len(indices))
 
-    sample_count, sampling_error_count, divergence_count, filtering_count = 0, 0, 0, 0
-    filtering_info = {}
-    for i in pbar:
-        success = False
-        while not success:
-            sample_count += 1
-
-            # Sampling a power grid.
-            try:
-                net = sample_power_grid(default_net, sampling_cfg)
-            except SamplingException:
-                sampling_error_count += 1
-                continue
-
-            # Running a Power Flow
-            try:
-                pp.runpp(net, **powerflow_cfg)
-            except pp.powerflow.LoadflowNotConverged:
-                divergence_count += 1
-                if keep_reject:
-                    file_name = 'divergence_sample_' + str(divergence_count).rjust(n_characters, '0') + '.json'
+    totals = {key: manifest["counts"].get(key, 0)
+              for key in ["sample", "sampling_error", "divergence", "filtering", "timeout", "recovered", "thinned",
+                          "newton_iterations"]}
+    filtering_info, cache_info = manifest["filtering_info"], manifest["cache_info"]
+    # Statistics up to each sample that is not durably stored yet, as (index + 1, totals, filtering_info, cache_info).
+    pending = deque()
+    try:
+        for i, (net, counts, info, rejected_nets, sample_profile) in enumerate(pbar, start):
+            cache_info = {k: cache_info.get(k, 0) + counts.get(k, 0) for k in cache_info | counts
+                          if k.startswith(("cache_", "warm_start_"))}
+            filtering_info = {k: filtering_info.get(k, 0) + info.get(k, 0) for k in filtering_info | info}
+
+            n_divergence, n_rejection = totals["divergence"], totals["filtering"]
+            for outcome, rejected_net in rejected_nets:
+                if outcome in record_writers:
+                    with timed(profiler, "rejected_storage"):
+                        record_writers[outcome].write(rejected_net)
+                    continue
+                if records is not None:
+                    with timed(profiler, "rejected_storage"):
+                        records.write(rejected_net)
+                    continue
+                if outcome == "divergence":
+                    n_divergence += 1
+                    file_name = 'divergence_sample_' + str(n_divergence).rjust(n_characters, '0') + '.json'
                     file_path = os.path.join(divergence_path, file_name)
-                    pp.to_json(net, file_path)
-                continue
-
-            # Checking the sanity of the sample.
-            reject, info = filter_sample(net, **filtering_cfg)
-            if reject:
-                filtering_count += 1
-                filtering_info = {k: filtering_info.get(k, 0) + info.get(k, 0) for k in filtering_info | info}
-                if keep_reject:
-                    file_name = 'rejection_sample_' + str(filtering_count).rjust(n_characters, '0') + '.json'
+                else:
+                    n_rejection += 1
+                    file_name = 'rejection_sample_' + str(n_rejection).rjust(n_characters, '0') + '.json'
                     file_path = os.path.join(reject_path, file_name)
-                    pp.to_json(net, file_path)
-                continue
+                with timed(profiler, "rejected_storage"):
+                    submit(writer, pp.to_json, rejected_net, file_path)
+            totals = {k: v + counts[k] for k, v in totals.items()}
+
+            with timed(profiler, "storage"):
+                writer.write(i, net)
+            if profiler is not None:
+                profiler.add(i, sample_profile)
+            pending.append((i + 1, totals, filtering_info, cache_info))
+            checkpoint(path, manifest, writer.n_stored, pending, indices.start, CHECKPOINT_INTERVAL)
+
+            pbar.set_description(
+                "Sample count = {}, Sampling issues = {}, Divergences = {}, Rejections = {}, Timeouts = {} ".format(
+                    totals["sample"], totals["sampling_error"], totals["divergence"], totals["filtering"],
+                    totals["timeout"]))
+    except BaseException:
+        # Storing the samples that were handed to the writer, so that they are not sampled again when resuming.
+        with contextlib.suppress(Exception):
+            writer.close()
+        for record_writer in [records, *record_writers.values()]:
+            if record_writer is not None:
+                record_writer.close()
+        checkpoint(path, manifest, writer.n_stored, pending, indices.start)
+        raise
+    with timed(profiler, "storage"):
+        writer.close()
+    for record_writer in [records, *record_writers.values()]:
+        if record_writer is not None:
+            record_writer.close()
+    if profiler is not None:
+        profiler.save(os.path.join(path, "profile"))
+        log.info("Profiling report written into {}".format(os.path.join(path, "profile")))
+    manifest.update(n_files=max(n_files, manifest["n_files"]), n_completed=max(indices.stop, start) - indices.start,
+                    counts=totals, filtering_info=filtering_info, cache_info=cache_info)
+    save_manifest(path, manifest)
+    log_statistics(log, totals, filtering_info, cache_info)
 
-            success = True
 
-        file_name = 'sample_' + str(i).rjust(n_characters, '0') + '.json'
-        file_path = os.path.join(path, file_name)
-        pp.to_json(net, file_path)
+def checkpoint(path: str, manifest: dict, n_stored: int, pending: deque, first_index: int = 0,
+               interval: int = 1) -> None:
+    """Saves into the manifest the statistics of the last sample of `pending` whose index is below `n_stored`, i.e.
+    that is durably stored along with all previous ones, and removes the statistics of stored samples from `pending`.
+    Nothing is done until at least `interval` samples were stored since the manifest was last saved.
+    """
+    # Pending statistics are those of consecutive samples.
+    if not pending or min(n_stored, pending[-1][0]) - first_index - manifest["n_completed"] < interval:
+        return
+    stats = None
+    while pending and pending[0][0] <= n_stored:
+        stats = pending.popleft()
+    if stats is not None:
+        n_completed, totals, filtering_info, cache_info = stats
+        manifest.update(n_completed=n_completed - first_index, counts=totals, filtering_info=filtering_info,
+                        cache_info=cache_info)
+        save_manifest(path, manifest)
 
-        pbar.set_description(
-            "Sample count = {}, Sampling issues = {}, Divergences = {}, Rejections = {} ".format(sample_count,
-                                                                                                 sampling_error_count,
-                                                                                                 divergence_count,
-                                                                                                 filtering_count))
 
-    log.info("Sample count : {}".format(sample_count))
-    log.info("Sampling issues : {}".format(sampling_error_count))
-    log.info("Divergences : {}".format(divergence_count))
-    log.info("Rejections : {}".format(filtering_count))
+def log_statistics(log: logging.Logger, totals: dict, filtering_info: dict, cache_info: dict) -> None:
+    """Logs the sampling statistics of a dataset."""
+    log.info("Sample count : {}".format(totals["sample"]))
+    log.info("Sampling issues : {}".format(totals["sampling_error"]))
+    log.info("Divergences : {}".format(totals["divergence"]))
+    log.info("Rejections : {}".format(totals["filtering"]))
+    log.info("Timeouts : {}".format(totals.get("timeout", 0)))
+    log.info("Recovered power flows : {}".format(totals.get("recovered", 0)))
+    log.info("Thinned attempts : {}".format(totals.get("thinned", 0)))
+    n_power_flows = totals["sample"] - totals["sampling_error"] - filtering_info.get("dc_screening_hit", 0)
+    if n_power_flows > 0:
+        log.info("Average Newton iterations : {:.2f}".format(totals["newton_iterations"] / n_power_flows))
+        log.info("Divergence rate : {:.2%}".format(totals["divergence"] / n_power_flows))
     for k, v in filtering_info.items():
         log.info("    {} : {}".format(k, v))
+    if "cache_hit" in cache_info:
+        n_lookups = max(cache_info["cache_hit"] + cache_info["cache_miss"], 1)
+        log.info("Power flow cache : {} hits, {} misses, {} evictions, hit rate {:.2%}".format(
+            cache_info["cache_hit"], cache_info["cache_miss"], cache_info["cache_eviction"],
+            cache_info["cache_hit"] / n_lookups))
+    if "warm_start_hit" in cache_info:
+        log.info("Warm start : {} warm started power flows, {} fallbacks to the configured initialization".format(
+            cache_info["warm_start_hit"], cache_info["warm_start_fallback"]))
+
+
+def _to_container(cfg: DictConfig):
+    """Converts a configuration into plain Python containers, leaving None unchanged."""
+    if isinstance(cfg, DictConfig):
+        return OmegaConf.to_container(cfg, resolve=True)
+    return cfg
+
+
+def sample_one(index: int, default_net: pandapowerNet, keep_reject: bool, sampling_cfg: DictConfig | SamplingPlan,
+               powerflow_cfg: DictConfig | dict, filtering_cfg: DictConfig | dict, seed: int = None,
+               dataset_id: int = 0, powerflow_cache: PowerFlowCache = None, warm_start: WarmStartStore = None,
+               dc_screen: DCScreen = None, profile: bool = False, cprofile: bool = False, reject_format: str = "net",
+               watchdog: Watchdog = None, recovery: list = None,
+               proposal: ProposalTable = None) -> tuple[pandapowerNet, dict, dict, list, SampleProfile]:
+    """Samples power grids until one is accepted, and returns it along with the statistics of the rejected attempts.
+
+    The attempt `a` of the sample `index` only depends on the random stream keyed by (`dataset_id`, `index`, `a`).
+    Configurations are best compiled beforehand, cf. `sampling_context`.
+    Rejected power grids are only returned if `keep_reject` is True, as a list of (outcome, net) pairs, or of
+    (outcome, record) pairs including sampling errors if `reject_format` is `seed`, cf. `reject_record`.
+    If `powerflow_cache` is provided, its hit, miss and eviction counts during this call are added to the counts.
+    Power flows start from the closest solution of `warm_start` if provided, and its counts of warm started power
+    flows and of fallbacks to `powerflow_cfg` initialization are added as well. If `dc_screen` is provided, samples
+    whose DC loading is too high are rejected before the power flow (`dc_screening_hit`), and samples that passed
+    the screening but overflow are counted as `dc_screening_miss`.
+    If `profile` is True, the time spent in each stage and on each outcome is returned as a `SampleProfile` (None
+    otherwise), which also holds the cProfile statistics of the whole sample if `cprofile` is True.
+    If `watchdog` is provided, attempts that exceed its time budgets are aborted and counted as `timeout`, and their
+    records are returned among the rejected power grids whatever `keep_reject`, cf. `keep_timeout`. The same goes for
+    the attempts whose power flow converged thanks to a step of the `recovery` chain, cf. `keep_recovery`.
+    If `proposal` is provided, attempts are thinned out according to its keep probabilities and counted as `thinned`,
+    and the record of the sample, including its weight, is returned among the rejected power grids, cf.
+    `proposal.ProposalTable`.
+    """
+    sampling_cfg = compile_sampling(default_net, sampling_cfg)
+    counts = {"sample": 0, "sampling_error": 0, "divergence": 0, "filtering": 0, "timeout": 0, "recovered": 0,
+              "thinned": 0, "newton_iterations": 0}
+    filtering_info = {}
+    rejected_nets = []
+    # Outage set, load bin and acceptance of the attempts that were not thinned out, if `proposal` is provided.
+    attempts = []
+    sample_profile = SampleProfile(cprofile) if profile else None
+    if sample_profile is not None:
+        sample_profile.start()
+    while True:
+        key = (dataset_id, index, counts["sample"])
+        reject_key = key if keep_reject and reject_format == "seed" else None
+        rng = get_rng(seed, *key)
+        counts["sample"] += 1
+
+        net, state = None, None
+        try:
+            with attempt_budget(watchdog):
+                # Sampling a power grid, which the adaptive proposal may thin out before its expensive steps.
+                net = sample_power_grid_topology(default_net, sampling_cfg, rng, sample_profile, watchdog)
+                if proposal is not None:
+                    state = proposal.propose(key)
+                    proposal.thin_topology(state, net)
+                sample_power_grid_injections(net, default_net, sampling_cfg, rng, sample_profile, watchdog)
+                if proposal is not None:
+                    proposal.thin_load(state, net)
+                accepted = run_attempt(net, counts, filtering_info, rejected_nets, sample_profile, keep_reject,
+                                       powerflow_cfg, filtering_cfg, powerflow_cache, warm_start, dc_screen,
+                                       reject_key, watchdog, recovery, key)
+        except Thinned:
+            counts["thinned"] += 1
+            if sample_profile is not None:
+                sample_profile.end_attempt("thinned")
+            continue
+        except SamplingException:
+            counts["sampling_error"] += 1
+            if reject_key is not None:
+                rejected_nets.append(("sampling_error", reject_record(reject_key, "sampling_error")))
+            if sample_profile is not None:
+                sample_profile.end_attempt("sampling_error")
+            accepted = False
+        except AttemptTimeout as timeout:
+            keep_timeout(rejected_nets, counts, sample_profile, key, timeout, net)
+            accepted = False
+        if state is not None and state["outages"] is not None:
+            attempts.append((state["outages"], state["load_bin"], accepted))
+
+        if accepted:
+            if proposal is not None:
+                rejected_nets.append(("adaptive", proposal.record(key, state, attempts)))
+            if sample_profile is not None:
+                sample_profile.stop()
+            return net, counts, filtering_info, rejected_nets, sample_profile
+
+
+def run_attempt(net: pandapowerNet, counts: dict, filtering_info: dict, rejected_nets: list,
+                sample_profile: SampleProfile, keep_reject: bool, powerflow_cfg: DictConfig, filtering_cfg: DictConfig,
+                powerflow_cache: PowerFlowCache = None, warm_start: WarmStartStore = None,
+                dc_screen: DCScreen = None, reject_key: tuple = None, watchdog: Watchdog = None,
+                recovery: list = None, key: tuple = None, screened: bool = False, batch: tuple = None) -> bool:
+    """Screens, solves and filters the sampled power grid `net`, and returns True if it is accepted.
+
+    The statistics of its sample, i.e. `counts`, `filtering_info` and `rejected_nets`, are updated in place, cf.
+    `sample_one`. If `reject_key` is provided, rejected attempts are kept as records under this key instead of nets.
+    Each stage is bounded by the time budgets of `watchdog` if provided, which raises `AttemptTimeout`. Power flows
+    that do not converge go through the steps of `recovery` if provided, cf. `powerflow.recover_power_flow`, and the
+    attempts they recover are recorded under `key`.
+    If `screened` is True, `net` already passed `screen_attempt`. If `batch` = (solver, solution, k) is provided, the
+    power flow of `net` is the scenario `k` of the `batch_powerflow.BatchPowerFlow` solution, and is only run again,
+    along with the recovery chain, if this scenario did not converge.
+    """
+    stats = solver_stats(powerflow_cache, warm_start)
+
+    if not screened and screen_attempt(net, counts, filtering_info, rejected_nets, sample_profile, keep_reject,
+                                       dc_screen, reject_key, watchdog):
+        return False
+
+    # Running a Power Flow, unless it was solved along with other attempts of its topology.
+    try:
+        with timed(sample_profile, "power_flow", watchdog):
+            if batch is not None and batch[1]["converged"][batch[2]]:
+                batch[0].write_results(net, batch[1], batch[2])
+                if warm_start is not None:
+                    warm_start.store(net)
+            else:
+                run_power_flow(net, powerflow_cfg, powerflow_cache, warm_start)
+        diverged = False
+    except pp.powerflow.LoadflowNotConverged:
+        diverged = True
+    finally:
+        counts.update({k: counts.get(k, 0) + v - stats[k]
+                       for k, v in solver_stats(powerflow_cache, warm_start).items()})
+    recovered = None
+    if diverged and recovery:
+        with timed(sample_profile, "recovery", watchdog):
+            recovered = recover_power_flow(net, powerflow_cfg, recovery, warm_start)
+        if recovered is not None:
+            diverged = False
+            counts["recovered"] += 1
+    counts["newton_iterations"] += newton_iterations(net)
+    if diverged:
+        counts["divergence"] += 1
+        if keep_reject:
+            keep_rejected(rejected_nets, "divergence", net, reject_key)
+        if sample_profile is not None:
+            sample_profile.end_attempt("divergence", newton_iterations(net))
+        return False
+
+    # Checking the sanity of the sample.
+    with timed(sample_profile, "filtering", watchdog):
+        reject, info = filter_sample(net, **filtering_cfg)
+    if dc_screen is not None:
+        info["dc_screening_miss"] = info["overflow"]
+    if reject:
+        counts["filtering"] += 1
+        for k, v in info.items():
+            filtering_info[k] = filtering_info.get(k, 0) + v
+        if keep_reject:
+            keep_rejected(rejected_nets, "rejection", net, reject_key, info, solved=True)
+        if recovered is not None:
+            keep_recovery(rejected_nets, key, "rejection", net, info, recovery, recovered)
+        if sample_profile is not None:
+            sample_profile.end_attempt("filtering", newton_iterations(net))
+        return False
+
+    if recovered is not None:
+        keep_recovery(rejected_nets, key, "accepted", net, info, recovery, recovered)
+    if sample_profile is not None:
+        sample_profile.end_attempt("accepted", newton_iterations(net))
+    return True
+
+
+def solver_stats(powerflow_cache: PowerFlowCache = None, warm_start: WarmStartStore = None) -> dict:
+    """Returns the statistics of `powerflow_cache` and `warm_start` that are provided."""
+    stats = {}
+    for solver in [powerflow_cache, warm_start]:
+        if solver is not None:
+            stats.update(solver.stats())
+    return stats
+
+
+def screen_attempt(net: pandapowerNet, counts: dict, filtering_info: dict, rejected_nets: list,
+                   sample_profile: SampleProfile, keep_reject: bool, dc_screen: DCScreen = None,
+                   reject_key: tuple = None, watchdog: Watchdog = None) -> bool:
+    """Screens out the overflows of `net` using the DC approximation of `dc_screen` if provided, and returns True if
+    it is rejected, updating the statistics of its sample as `run_attempt`."""
+    if dc_screen is None:
+        return False
+    with timed(sample_profile, "dc_screening", watchdog):
+        screened = dc_screen.reject(net)
+    if screened:
+        counts["filtering"] += 1
+        filtering_info["dc_screening_hit"] = filtering_info.get("dc_screening_hit", 0) + 1
+        if keep_reject:
+            keep_rejected(rejected_nets, "rejection", net, reject_key, {"dc_screening_hit": 1})
+        if sample_profile is not None:
+            sample_profile.end_attempt("filtering")
+    return screened
+
+
+def keep_rejected(rejected_nets: list, outcome: str, net: pandapowerNet, reject_key: tuple = None, info: dict = None,
+                  solved: bool = False) -> None:
+    """Appends the rejected attempt `net` to `rejected_nets`, or its record if `reject_key` is provided."""
+    if reject_key is None:
+        rejected_nets.append((outcome, net))
+    else:
+        rejected_nets.append((outcome, reject_record(reject_key, outcome, net, info, solved)))
+
+
+def keep_timeout(rejected_nets: list, counts: dict, sample_profile: SampleProfile, key: tuple,
+                 timeout: AttemptTimeout, net: pandapowerNet = None) -> None:
+    """Counts the attempt `key` aborted by `timeout`, and appends its record to `rejected_nets`, along with the
+    exceeded budget and the stage it was exceeded in. `net` is the sampled power grid, if sampling completed."""
+    counts["timeout"] += 1
+    record = reject_record(key, "timeout", net)
+    record.update(budget=timeout.budget, budget_s=timeout.budget_s, stage=timeout.stage)
+    rejected_nets.append(("timeout", record))
+    if sample_profile is not None:
+        sample_profile.end_attempt("timeout")
+
+
+def keep_recovery(rejected_nets: list, key: tuple, outcome: str, net: pandapowerNet, info: dict, recovery: list,
+                  step: int) -> None:
+    """Appends to `rejected_nets` the record of the attempt `key`, whose power flow converged at the step `step` of
+    `recovery`, and whose `outcome` is then `accepted` or `rejection`."""
+    record = reject_record(key, outcome, net, info, solved=True)
+    record.update(recovery=recovery[step][0], recovery_step=step)
+    rejected_nets.append(("recovery", record))
+
+
+def reject_record(key: tuple, outcome: str, net: pandapowerNet = None, info: dict = None,
+                  solved: bool = False) -> dict:
+    """Returns the compact record of a rejected attempt, from which `replay.replay_attempt` regenerates it.
+
+    The record holds the random stream key (dataset_id, index, attempt) of the attempt, its outcome and its filtering
+    info. If the power grid `net` was sampled, its total load and Newton-Raphson iterations are added, along with its
+    extreme bus voltages and branch loadings if its power flow is `solved`.
+    """
+    record = {"key": [int(k) for k in key], "outcome": outcome,
+              "filtering_info": {k: int(v) for k, v in (info or {}).items()}}
+    if net is not None:
+        record["total_load_mw"] = float(net.load.p_mw.values[net.load.in_service.values.astype(bool)].sum())
+        record["newton_iterations"] = newton_iterations(net)
+    if solved:
+        record["min_vm_pu"] = float(net.res_bus.vm_pu.min())
+        record["max_vm_pu"] = float(net.res_bus.vm_pu.max())
+        record["max_loading_percent"] = float(max(net.res_line.loading_percent.max(),
+                                                  net.res_trafo.loading_percent.max()))
+    return record
+
+
+def sample_block(indices: list[int], default_net: pandapowerNet, keep_reject: bool,
+                 sampling_cfg: DictConfig | SamplingPlan, powerflow_cfg: DictConfig | dict,
+                 filtering_cfg: DictConfig | dict, seed: int = None, dataset_id: int = 0,
+                 powerflow_cache: PowerFlowCache = None, warm_start: WarmStartStore = None,
+                 dc_screen: DCScreen = None, profile: bool = False, cprofile: bool = False,
+                 reject_format: str = "net", watchdog: Watchdog = None, recovery: list = None,
+                 proposal: ProposalTable = None, batch_powerflow: bool = False) -> list[tuple]:
+    """Samples the power grids `indices` together, and returns the result of `sample_one` for each of them, in order.
+
+    Each round draws the topology of the next attempt of every sample that is not accepted yet, and then completes
+    these attempts grouped by topology, so that the solver structures and DC-OPF models cached per topology are
+    reused by consecutive attempts. Topologies are compared by `structure_key`, which generator commitments of the
+    active generation (e.g. `dc_opf_disconnect`) do not change, hence groups match the keys of `PowerFlowCache`.
+    Attempts draw from the same random streams as in `sample_one`, hence samples are the same (up to the power flow
+    tolerance when the solver cache or warm start is used). The attempt budget of `watchdog` covers both halves of
+    each attempt.
+
+    If `batch_powerflow` is True, the attempts of a topology that pass the DC screening have their power flows solved
+    together, cf. `solve_attempts`. Those that do not converge are solved again one by one, and then go through the
+    `recovery` chain, so that divergences are counted as usual.
+    """
+    sampling_cfg = compile_sampling(default_net, sampling_cfg)
+    states = {}
+    for index in indices:
+        sample_profile = SampleProfile(cprofile) if profile else None
+        if sample_profile is not None:
+            sample_profile.start()
+            sample_profile.suspend()
+        counts = {"sample": 0, "sampling_error": 0, "divergence": 0, "filtering": 0, "timeout": 0, "recovered": 0,
+                  "thinned": 0, "newton_iterations": 0}
+        states[index] = counts, {}, [], sample_profile, []
+    results = {}
+    pending = list(indices)
+    while pending:
+        # Drawing the topologies of the next attempts.
+        groups, retry = {}, []
+        for index in pending:
+            counts, _, rejected_nets, sample_profile, _ = states[index]
+            key = (dataset_id, index, counts["sample"])
+            reject_key = key if keep_reject and reject_format == "seed" else None
+            rng = get_rng(seed, *key)
+            counts["sample"] += 1
+            with running(sample_profile):
+                start, state = time.perf_counter(), None
+                try:
+                    with attempt_budget(watchdog):
+                        net = sample_power_grid_topology(default_net, sampling_cfg, rng, sample_profile, watchdog)
+                        if proposal is not None:
+                            state = proposal.propose(key)
+                            proposal.thin_topology(state, net)
+                except Thinned:
+                    counts["thinned"] += 1
+                    if sample_profile is not None:
+                        sample_profile.end_attempt("thinned")
+                    retry.append(index)
+                    continue
+                except SamplingException:
+                    counts["sampling_error"] += 1
+                    if reject_key is not None:
+                        rejected_nets.append(("sampling_error", reject_record(reject_key, "sampling_error")))
+                    if sample_profile is not None:
+                        sample_profile.end_attempt("sampling_error")
+                    retry.append(index)
+                    continue
+                except AttemptTimeout as timeout:
+                    keep_timeout(rejected_nets, counts, sample_profile, key, timeout)
+                    retry.append(index)
+                    continue
+            groups.setdefault(structure_key(net), []).append(
+                (index, net, rng, key, reject_key, state, time.perf_counter() - start))
+
+        # Completing the attempts, one topology after the other.
+        for group in groups.values():
+            # Screened attempts whose power flows are solved together if `batch_powerflow` is True, by topology as
+            # sampling injections may disconnect generators.
+            ready = {}
+            for index, net, rng, key, reject_key, state, elapsed_s in group:
+                counts, filtering_info, rejected_nets, sample_profile, attempts = states[index]
+                with running(sample_profile):
+                    start = time.perf_counter()
+                    try:
+                        with attempt_budget(watchdog, elapsed_s):
+                            sample_power_grid_injections(net, default_net, sampling_cfg, rng, sample_profile,
+                                                         watchdog)
+                            if proposal is not None:
+                                proposal.thin_load(state, net)
+                            if not batch_powerflow:
+                                accepted = run_attempt(net, counts, filtering_info, rejected_nets, sample_profile,
+                                                       keep_reject, powerflow_cfg, filtering_cfg, powerflow_cache,
+                                                       warm_start, dc_screen, reject_key, watchdog, recovery, key)
+                            elif screen_attempt(net, counts, filtering_info, rejected_nets, sample_profile,
+                                                keep_reject, dc_screen, reject_key, watchdog):
+                                accepted = False
+                            else:
+                                accepted = None
+                    except Thinned:
+                        counts["thinned"] += 1
+                        if sample_profile is not None:
+                            sample_profile.end_attempt("thinned")
+                        retry.append(index)
+                        continue
+                    except SamplingException:
+                        counts["sampling_error"] += 1
+                        if reject_key is not None:
+                            rejected_nets.append(("sampling_error", reject_record(reject_key, "sampling_error")))
+                        if sample_profile is not None:
+                            sample_profile.end_attempt("sampling_error")
+                        accepted = False
+                    except AttemptTimeout as timeout:
+                        keep_timeout(rejected_nets, counts, sample_profile, key, timeout, net)
+                        accepted = False
+                if accepted is None:
+                    ready.setdefault(topology_key(net), []).append(
+                        (index, net, key, reject_key, state, elapsed_s + time.perf_counter() - start))
+                    continue
+                end_block_attempt(states, results, retry, index, net, key, state, accepted, proposal)
+
+            # Solving the power flows of the screened attempts together, and completing them one by one.
+            for batch_group in ready.values():
+                start = time.perf_counter()
+                batch = solve_attempts([net for _, net, *_ in batch_group], powerflow_cfg, powerflow_cache, watchdog)
+                for index, *_ in batch_group if batch is not None else []:
+                    if states[index][3] is not None:
+                        states[index][3].record("power_flow", (time.perf_counter() - start) / len(batch_group))
+                for k, (index, net, key, reject_key, state, elapsed_s) in enumerate(batch_group):
+                    counts, filtering_info, rejected_nets, sample_profile, attempts = states[index]
+                    with running(sample_profile):
+                        try:
+                            with attempt_budget(watchdog, elapsed_s):
+                                accepted = run_attempt(net, counts, filtering_info, rejected_nets, sample_profile,
+                                                       keep_reject, powerflow_cfg, filtering_cfg, powerflow_cache,
+                                                       warm_start, dc_screen, reject_key, watchdog, recovery, key,
+                                                       screened=True, batch=None if batch is None else (*batch, k))
+                        except AttemptTimeout as timeout:
+                            keep_timeout(rejected_nets, counts, sample_profile, key, timeout, net)
+                            accepted = False
+                    end_block_attempt(states, results, retry, index, net, key, state, accepted, proposal)
+        pending = sorted(retry)
+    return [results[index] for index in indices]
+
+
+def end_block_attempt(states: dict, results: dict, retry: list, index: int, net: pandapowerNet, key: tuple,
+                      state: dict, accepted: bool, proposal: ProposalTable = None) -> None:
+    """Ends the attempt `key` of the sample `index` of a block, storing its result if it is `accepted`, or adding
+    `index` to the samples to `retry` otherwise, cf. `sample_block`."""
+    counts, filtering_info, rejected_nets, sample_profile, attempts = states[index]
+    if state is not None:
+        attempts.append((state["outages"], state["load_bin"], accepted))
+    if not accepted:
+        retry.append(index)
+        return
+    if proposal is not None:
+        rejected_nets.append(("adaptive", proposal.record(key, state, attempts)))
+    if sample_profile is not None:
+        sample_profile.resume()
+        sample_profile.stop()
+    results[index] = net, counts, filtering_info, rejected_nets, sample_profile
+
+
+def solve_attempts(nets: list[pandapowerNet], powerflow_cfg: dict, powerflow_cache: PowerFlowCache = None,
+                   watchdog: Watchdog = None) -> tuple[BatchPowerFlow, dict] | None:
+    """Solves the power flows of the screened attempts `nets` of a single topology at once, and returns the
+    `batch_powerflow.BatchPowerFlow` solver and its solution, or None if there are less than `MIN_BATCH_SIZE` of them
+    or if the `power_flow` budget of `watchdog` is exceeded, so that they are solved one by one."""
+    if len(nets) < MIN_BATCH_SIZE:
+        return None
+    try:
+        with timed(None, "power_flow", watchdog):
+            solver = BatchPowerFlow(nets[0], powerflow_cache, **powerflow_cfg)
+            return solver, solver.solve(stack_scenarios(nets))
+    except AttemptTimeout:
+        return None
+
+
+def sampling_context(default_net: pandapowerNet, keep_reject: bool, sampling_cfg: DictConfig,
+                     powerflow_cfg: DictConfig, filtering_cfg: DictConfig, seed: int = None, dataset_id: int = 0,
+                     solver_cfg: DictConfig = None, reject_format: str = "net", timeout_cfg: DictConfig = None) -> dict:
+    """Returns the keyword arguments of `imap_samples`, including the solver structures enabled in `solver_cfg`, the
+    `watchdog.Watchdog` of the time budgets of `timeout_cfg` and the power flow recovery chain of `powerflow_cfg`.
+
+    The sampling configuration is compiled into a `SamplingPlan`, and the power flow and filtering configurations into
+    plain dictionaries, so that sampling attempts do not look up configurations. Invalid methods, parameters or
+    options, and an invalid `reject_format` or time budget, raise a `ValueError`, as well as power flow options that
+    the batched solver does not support if `batch_powerflow` is set in `solver_cfg`, and a DC screening that the
+    DC-OPF of the active generation makes useless, cf. `active_generation.dc_opf_loading_limit`.
+    """
+    if reject_format not in REJECT_FORMATS:
+        raise ValueError("{} is not a valid rejected sample format".format(reject_format) + ", choose from {}".format(
+            REJECT_FORMATS))
+    filtering_cfg = compile_filtering(filtering_cfg)
+    context = dict(default_net=default_net, keep_reject=keep_reject,
+                   sampling_cfg=compile_sampling(default_net, sampling_cfg),
+                   powerflow_cfg=compile_powerflow(powerflow_cfg), filtering_cfg=filtering_cfg, seed=seed,
+                   dataset_id=dataset_id)
+    if solver_cfg is None:
+        solver_cfg = {}
+    if solver_cfg.get("cache_size", 0) > 0:
+        context["powerflow_cache"] = PowerFlowCache(solver_cfg.cache_size)
+    if solver_cfg.get("warm_start_size", 0) > 0:
+        context["warm_start"] = WarmStartStore(default_net, solver_cfg.warm_start_size,
+                                               solver_cfg.get("warm_start_topologies", 128))
+    if solver_cfg.get("dc_screening_margin", None) is not None and filtering_cfg.get("max_loading_percent") is not None:
+        max_loading_percent = filtering_cfg["max_loading_percent"] + solver_cfg.dc_screening_margin
+        # Samples whose dispatch is limited by a DC-OPF below the threshold would never be rejected.
+        if not isinstance(sampling_cfg, SamplingPlan):
+            limit = dc_opf_loading_limit(default_net, sampling_cfg.active_gen)
+            if limit is not None and limit <= max_loading_percent:
+                raise ValueError("The {} method limits DC branch loadings to {}%, hence the DC screening at {}% cannot "
+                                 "reject samples, unset dc_screening_margin".format(
+                                     sampling_cfg.active_gen.method, limit, max_loading_percent))
+        context["dc_screen"] = DCScreen(max_loading_percent)
+    if solver_cfg.get("schedule_block", 0) > 0:
+        context["block_size"] = solver_cfg.schedule_block
+    if solver_cfg.get("batch_powerflow", False):
+        if "block_size" not in context:
+            raise ValueError("batch_powerflow requires samples to be scheduled by blocks, set schedule_block")
+        # Checking that the power flow options are supported by the batched solver.
+        BatchPowerFlow(default_net, **context["powerflow_cfg"])
+        context["batch_powerflow"] = True
+    if reject_format != "net":
+        context["reject_format"] = reject_format
+    watchdog = get_watchdog(timeout_cfg)
+    if watchdog is not None:
+        context["watchdog"] = watchdog
+    recovery = compile_recovery(powerflow_cfg)
+    if recovery:
+        context["recovery"] = recovery
+    return context
+
+
+def iter_samples(default_net: pandapowerNet, sampling_cfg: DictConfig, powerflow_cfg: DictConfig,
+                 filtering_cfg: DictConfig, seed: int, dataset_id: int = 0, start: int = 0, stop: int = None,
+                 output: str = "net", n_workers: int = 1, prefetch: int = 0,
+                 solver_cfg: DictConfig = None,
+                 timeout_cfg: DictConfig = None) -> Iterator[pandapowerNet | dict[str, np.ndarray]]:
+    """Lazily yields the accepted samples `start`, `start` + 1, ... up to `stop` (excluded, or endlessly if None).
+
+    Samples are the same as the ones `build_datasets` stores for the same seed, `dataset_id` being 0, 1 and 2 for the
+    train, val and test sets. Depending on `output`, samples are yielded as power grids (`net`), which share their
+    static tables with `default_net` and should not be modified in place, or as the dense feature arrays of
+    `storage.extract_features` (`features`).
+    If `prefetch` > 0, samples are generated ahead of the consumer in `n_workers` background processes, with at most
+    `prefetch` of them waiting to be consumed. Otherwise, they are generated in the calling process when requested.
+    If `schedule_block` is set in `solver_cfg`, samples are generated by blocks, cf. `sample_block`. Attempts that
+    exceed the time budgets of `timeout_cfg` are skipped, which requires samples to be generated in the main thread of
+    a process, or in background processes.
+    """
+    output_dict = {"net": lambda net: net, "features": lambda net: extract_features(net, default_net)}
+
+    if output not in output_dict:
+        raise ValueError("{} is not a valid sample output".format(output) + ", choose from {}".format(
+            list(output_dict.keys())))
+    context = sampling_context(default_net, False, sampling_cfg, powerflow_cfg, filtering_cfg, seed, dataset_id,
+                               solver_cfg, timeout_cfg=timeout_cfg)
+    indices = itertools.count(start) if stop is None else range(start, stop)
+    if prefetch > 0:
+        results = prefetch_samples(indices, max(n_workers, 1), prefetch, **context)
+    else:
+        results = imap_samples(indices, **context)
+    for net, *_ in results:
+        yield output_dict[output](net)
+
+
+_worker_context = {}
+
+
+def _init_worker(context: dict, outage_sets: dict = None) -> None:
+    """Stores the sampling context in a worker process, so that it is only transferred once, along with the secure
+    outage sets it refers to, cf. `graph.OutageSets`."""
+    if outage_sets:
+        share_outage_sets(outage_sets)
+    _worker_context.update(context)
+
+
+def _sample_one_in_worker(index: int) -> tuple[pandapowerNet, dict, dict, list, SampleProfile]:
+    """Samples the power grid `index` using the context of the worker process."""
+    return sample_one(index, **_worker_context)
+
+
+def _sample_block_in_worker(indices: list[int]) -> list[tuple]:
+    """Samples the power grids `indices` together using the context of the worker process."""
+    return sample_block(indices, **_worker_context)
+
+
+def iter_blocks(indices: Iterable[int], block_size: int) -> Iterator[list[int]]:
+    """Lazily splits `indices` into consecutive blocks of `block_size` indices, the last one being possibly shorter."""
+    indices = iter(indices)
+    while block := list(itertools.islice(indices, block_size)):
+        yield block
+
+
+def imap_samples(indices: Iterable[int], n_workers: int = 1, block_size: int = 0, **context) -> Iterator[tuple]:
+    """Lazily yields the results of `sample_one` over `indices`, in order, using `n_workers` processes.
+
+    If `block_size` > 0, consecutive blocks of indices are sampled together by `sample_block`, each in a single process.
+    """
+    if block_size > 0:
+        blocks = iter_blocks(indices, block_size)
+        if n_workers <= 1:
+            for block in blocks:
+                yield from sample_block(block, **context)
+        else:
+            with multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                      initargs=(context, shared_outage_sets())) as pool:
+                for results in pool.imap(_sample_block_in_worker, blocks):
+                    yield from results
+    elif n_workers <= 1:
+        for index in indices:
+            yield sample_one(index, **context)
+    else:
+        with multiprocessing.Pool(n_workers, initializer=_init_worker,
+                                  initargs=(context, shared_outage_sets())) as pool:
+            yield from pool.imap(_sample_one_in_worker, indices)
+
+
+def imap_adaptive(indices: range, proposal: AdaptiveProposal, n_workers: int = 1, **context) -> Iterator[tuple]:
+    """Lazily yields the results of `sample_one` over `indices`, in order, proposing the attempts of each epoch of
+    `proposal` with the keep probabilities derived from the records of the previous epochs, cf. `imap_samples`."""
+    start = indices.start
+    while start < indices.stop:
+        epoch_start = start // proposal.epoch * proposal.epoch
+        stop = min(epoch_start + proposal.epoch, indices.stop)
+        table = proposal.table(context["default_net"], context["seed"], epoch_start)
+        for result in imap_samples(range(start, stop), n_workers, proposal=table, **context):
+            for outcome, record in result[3]:
+                if outcome == "adaptive":
+                    proposal.update(record)
+            yield result
+        start = stop
+
+
+def prefetch_samples(indices: Iterable[int], n_workers: int = 1, prefetch: int = 1, block_size: int = 0,
+                     **context) -> Iterator[tuple]:
+    """Lazily yields the results of `sample_one` over `indices`, in order, sampling ahead in `n_workers` processes.
+
+    Contrary to `imap_samples`, at most `prefetch` results are pending at once, so that `indices` may be endless.
+    If `block_size` > 0, blocks of indices are sampled together, and at most `prefetch` blocks are pending.
+    Worker processes are terminated when the generator is closed.
+    """
+    if block_size > 0:
+        tasks, function = iter_blocks(indices, block_size), _sample_block_in_worker
+    else:
+        tasks, function = indices, _sample_one_in_worker
+    with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=(context, shared_outage_sets())) as pool:
+        pending = deque()
+        for task in tasks:
+            if len(pending) == prefetch:
+                result = pending.popleft().get()
+                yield from result if block_size > 0 else [result]
+            pending.append(pool.apply_async(function, (task,)))
+        while pending:
+            result = pending.popleft().get()
+            yield from result if block_size > 0 else [result]
+
+
+def compile_filtering(filtering_cfg: DictConfig | dict | None) -> dict:
+    """Returns the filtering options of `filtering_cfg` as a plain dictionary, checking that `filter_sample` accepts
+    them."""
+    return bind(filter_sample, 1, filtering_cfg, "filter_sample").keywords
 
 
 def filter_sample(net: pandapowerNet, max_loading_percent: float = None, max_count_voltage_violation: int = None,
@@ -122,7 +952,7 @@ def filter_sample(net: pandapowerNet, max_loading_percent: float = None, max_cou
 
     info["disconnected_bus"] = 0
     if not allow_disconnected_bus:
-        if top.unsupplied_buses(net):
+        if unsupplied_buses(net):
             reject = True
             info["disconnected_bus"] = 1
 
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Analyses the connectivity of power grids using sparse graphs."""
+
+import hashlib
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from pandapower import pandapowerNet
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+BRANCH_COLUMNS = {"line": [("from_bus", "to_bus")], "impedance": [("from_bus", "to_bus")],
+                  "tcsc": [("from_bus", "to_bus")], "dcline": [("from_bus", "to_bus")],
+                  "trafo": [("hv_bus", "lv_bus")],
+                  "trafo3w": [("hv_bus", "mv_bus"), ("hv_bus", "lv_bus"), ("mv_bus", "lv_bus")]}
+SWITCH_ELEMENTS = {"line": "l", "trafo": "t"}
+MAX_CACHE_SIZE = 1024
+# Secure outage sets are only cached for a few power grids, as there can be millions of them.
+MAX_OUTAGE_CACHE_SIZE = 8
+# Each secure set of k lines takes 8 k bytes, i.e. up to 320 MB for 10 million sets of 4 lines, which are held once
+# per process, cf. `OutageSets`.
+MAX_OUTAGE_SETS = 10_000_000
+
+_unsupplied_buses_cache = OrderedDict()
+_secure_outage_sets_cache = OrderedDict()
+# Outage sets held in this process, and those shared by the parent process, by key, cf. `OutageSets`.
+_outage_sets = weakref.WeakValueDictionary()
+_shared_outage_sets = {}
+
+
+class OutageSets:
+    """Secure outage sets of `secure_outage_sets` by amount of lines, identified by a digest of their content.
+
+    Only the digest is pickled, so that sampling plans that hold the sets do not carry them to worker processes,
+    which get them once from `shared_outage_sets` through `share_outage_sets` instead. Unpickled sets are resolved on
+    first access, as worker processes may unpickle them before the sets are shared, and accessing sets that are
+    neither held nor shared in the process raises a `ValueError`.
+    """
+
+    def __init__(self, sets: dict[int, np.ndarray]):
+        digest = hashlib.sha1()
+        for k, k_sets in sorted(sets.items()):
+            digest.update(np.int64(k).tobytes())
+            digest.update(np.ascontiguousarray(k_sets, dtype=np.int64).tobytes())
+        self.key = digest.hexdigest()
+        self._sets = sets
+        _outage_sets.setdefault(self.key, self)
+
+    @property
+    def sets(self) -> dict[int, np.ndarray]:
+        if self._sets is None:
+            if self.key in _outage_sets:
+                self._sets = _outage_sets[self.key].sets
+            elif self.key in _shared_outage_sets:
+                self._sets = _shared_outage_sets[self.key]
+            else:
+                raise ValueError("The secure outage sets {} are not shared with this process, cf. "
+                                 "share_outage_sets".format(self.key))
+            _outage_sets.setdefault(self.key, self)
+        return self._sets
+
+    def __getitem__(self, n_outages: int) -> np.ndarray:
+        return self.sets[n_outages]
+
+    def __getstate__(self) -> dict:
+        return {"key": self.key}
+
+    def __setstate__(self, state: dict) -> None:
+        self.key = state["key"]
+        self._sets = None
+
+
+def shared_outage_sets() -> dict[str, dict[int, np.ndarray]]:
+    """Returns the sets of the `OutageSets` held in this process by key, to be passed once to worker processes."""
+    return {key: outage_sets.sets for key, outage_sets in _outage_sets.items()}
+
+
+def share_outage_sets(shared: dict[str, dict[int, np.ndarray]]) -> None:
+    """Makes the outage sets `shared` by the parent process, cf. `shared_outage_sets`, available to the `OutageSets`
+    unpickled in this process."""
+    _shared_outage_sets.update(shared)
+
+
+def branch_edges(net: pandapowerNet, removed_lines: np.ndarray = None) -> np.ndarray:
+    """Returns the (from bus, to bus) pairs of in service branches and closed bus-bus switches, as an (n, 2) array.
+
+    Branches are the same as in `pandapower.topology.create_nxgraph` with its default options, i.e. branches with an
+    open switch are discarded, and so are the sides of three winding transformers with an open switch. Lines at the
+    positions `removed_lines` are discarded as well.
+    """
+    switch_et = net.switch.et.values
+    switch_element = net.switch.element.values
+    open_switch = ~net.switch.closed.values.astype(bool)
+    edges = []
+    for table, column_pairs in BRANCH_COLUMNS.items():
+        if table not in net or len(net[table]) == 0:
+            continue
+        index = net[table].index.values
+        in_service = net[table].in_service.values.astype(bool)
+        if table in SWITCH_ELEMENTS and open_switch.any():
+            open_elements = switch_element[(switch_et == SWITCH_ELEMENTS[table]) & open_switch]
+            in_service &= ~np.isin(index, open_elements)
+        if table == "line" and removed_lines is not None:
+            in_service[removed_lines] = False
+        for from_column, to_column in column_pairs:
+            mask = in_service.copy()
+            if table == "trafo3w" and open_switch.any():
+                open_sides = (switch_et == "t3") & open_switch
+                for column in [from_column, to_column]:
+                    mask &= ~np.isin(index + 1j * net[table][column].values,
+                                     switch_element[open_sides] + 1j * net.switch.bus.values[open_sides])
+            edges.append(np.stack([net[table][from_column].values[mask], net[table][to_column].values[mask]], axis=1))
+    bus_switch = (switch_et == "b") & ~open_switch
+    edges.append(np.stack([net.switch.bus.values[bus_switch], switch_element[bus_switch]], axis=1))
+    return np.concatenate(edges).astype(np.int64)
+
+
+def slack_buses(net: pandapowerNet) -> np.ndarray:
+    """Returns the buses of in service external grids and slack generators."""
+    ext_grid_buses = net.ext_grid.bus.values[net.ext_grid.in_service.values.astype(bool)]
+    gen_buses = net.gen.bus.values[net.gen.in_service.values.astype(bool) & net.gen.slack.values.astype(bool)]
+    return np.unique(np.concatenate([ext_grid_buses, gen_buses]).astype(np.int64))
+
+
+def unsupplied_buses(net: pandapowerNet) -> set:
+    """Returns the buses that are not connected to an external grid or a slack generator.
+
+    The result is the same as the one of `pandapower.topology.unsupplied_buses`, which also includes buses that do
+    not exist in `net.bus` but are still referenced by a branch. Results are cached by topology.
+    """
+    edges = branch_edges(net)
+    slacks = slack_buses(net)
+    buses = net.bus.index.values.astype(np.int64)
+    in_service = net.bus.in_service.values.astype(bool)
+    key = (buses.tobytes(), in_service.tobytes(), edges.tobytes(), slacks.tobytes())
+    if key in _unsupplied_buses_cache:
+        _unsupplied_buses_cache.move_to_end(key)
+        return set(_unsupplied_buses_cache[key])
+
+    # Out of service buses are removed from the graph, along with their branches.
+    nodes = np.setdiff1d(np.union1d(buses, edges.ravel()), buses[~in_service])
+    edges = edges[np.isin(edges, nodes).all(axis=1)]
+    edge_positions = np.searchsorted(nodes, edges)
+    adjacency = coo_matrix((np.ones(len(edges)), (edge_positions[:, 0], edge_positions[:, 1])),
+                           shape=(len(nodes), len(nodes)))
+    _, labels = connected_components(adjacency, directed=False)
+    supplied_labels = labels[np.searchsorted(nodes, slacks[np.isin(slacks, nodes)])]
+    result = frozenset(nodes[~np.isin(labels, supplied_labels)].tolist())
+
+    _unsupplied_buses_cache[key] = result
+    if len(_unsupplied_buses_cache) > MAX_CACHE_SIZE:
+        _unsupplied_buses_cache.popitem(last=False)
+    return set(result)
+
+
+def closed_lines(net: pandapowerNet) -> np.ndarray:
+    """Returns the mask of the lines of `net` that are in service and have no open switch, cf. `branch_edges`."""
+    open_switch = (net.switch.et.values == SWITCH_ELEMENTS["line"]) & ~net.switch.closed.values.astype(bool)
+    return net.line.in_service.values.astype(bool) & ~np.isin(net.line.index.values,
+                                                              net.switch.element.values[open_switch])
+
+
+def secure_outage_sets(net: pandapowerNet, lines: np.ndarray, max_outages: int) -> list[np.ndarray]:
+    """Returns, for each amount k from 0 to `max_outages`, the (n_k, k) array of the sets of k lines, among the
+    positions `lines` of `net.line`, whose outage does not leave any supplied bus of `net` unsupplied, cf.
+    `unsupplied_buses`. Sets are sorted, and listed in lexicographic order.
+
+    Supersets of insecure sets are insecure, hence secure sets are enumerated by extending secure sets with the lines
+    that are not bridges of the remaining graph, the bridges being found once per set. Results are cached by topology
+    and candidate lines. Raises a `ValueError` if there are more than `MAX_OUTAGE_SETS` secure sets.
+    """
+    lines = np.unique(np.asarray(lines, dtype=np.int64))
+    edges = branch_edges(net, lines)
+    slacks = slack_buses(net)
+    buses = net.bus.index.values.astype(np.int64)
+    in_service = net.bus.in_service.values.astype(bool)
+    closed = closed_lines(net)[lines]
+    line_edges = np.stack([net.line.from_bus.values[lines], net.line.to_bus.values[lines]], axis=1).astype(np.int64)
+    key = (buses.tobytes(), in_service.tobytes(), edges.tobytes(), slacks.tobytes(), lines.tobytes(),
+           closed.tobytes(), line_edges.tobytes(), max_outages)
+    if key in _secure_outage_sets_cache:
+        _secure_outage_sets_cache.move_to_end(key)
+        return _secure_outage_sets_cache[key]
+
+    # Graph of the in service buses, where slacks are connected to an extra root node, the candidate lines being the
+    # last edges. Candidate lines that are not part of the graph can always be disconnected.
+    nodes = np.setdiff1d(np.union1d(np.union1d(buses, edges.ravel()), line_edges.ravel()), buses[~in_service])
+    root = len(nodes)
+    slack_positions = np.searchsorted(nodes, slacks[np.isin(slacks, nodes)])
+    in_graph = closed & np.isin(line_edges, nodes).all(axis=1)
+    all_edges = np.concatenate([np.searchsorted(nodes, edges[np.isin(edges, nodes).all(axis=1)]),
+                                np.stack([slack_positions, np.full(len(slack_positions), root)], axis=1),
+                                np.searchsorted(nodes, line_edges[in_graph])])
+    adjacency = [[] for _ in range(root + 1)]
+    for edge, (from_node, to_node) in enumerate(all_edges.tolist()):
+        adjacency[from_node].append((to_node, edge))
+        adjacency[to_node].append((from_node, edge))
+    candidate_edges = np.full(len(lines), -1)
+    candidate_edges[in_graph] = np.arange(len(all_edges) - in_graph.sum(), len(all_edges))
+    candidate_edges = candidate_edges.tolist()
+
+    sets = [[] for _ in range(max_outages + 1)]
+    pending = [((), frozenset(), 0)]
+    n_sets = 0
+    while pending:
+        chosen, removed, first = pending.pop()
+        sets[len(chosen)].append(chosen)
+        n_sets += 1
+        if n_sets > MAX_OUTAGE_SETS:
+            raise ValueError("There are more than {} secure outage sets of up to {} lines, consider a black "
+                             "list".format(MAX_OUTAGE_SETS, max_outages))
+        if len(chosen) == max_outages:
+            continue
+        bridges = _bridges(adjacency, root, removed)
+        # Pushed in reverse order, so that sets are listed in lexicographic order.
+        for position in range(len(lines) - 1, first - 1, -1):
+            edge = candidate_edges[position]
+            if edge not in bridges:
+                pending.append((chosen + (position,), removed | {edge}, position + 1))
+    result = [lines[np.array(k_sets, dtype=np.int64).reshape(len(k_sets), k)] for k, k_sets in enumerate(sets)]
+
+    _secure_outage_sets_cache[key] = result
+    if len(_secure_outage_sets_cache) > MAX_OUTAGE_CACHE_SIZE:
+        _secure_outage_sets_cache.popitem(last=False)
+    return result
+
+
+def _bridges(adjacency: list[list[tuple]], root: int, removed: frozenset) -> set:
+    """Returns the edges whose removal disconnects nodes from `root`, in the graph of `adjacency` (lists of
+    (neighbor, edge) per node) without the edges `removed`, using Tarjan's algorithm."""
+    discovery = [-1] * len(adjacency)
+    low = [0] * len(adjacency)
+    discovery[root] = 0
+    time = 1
+    bridges = set()
+    stack = [(root, -1, iter(adjacency[root]))]
+    while stack:
+        node, parent_edge, neighbors = stack[-1]
+        for neighbor, edge in neighbors:
+            if edge == parent_edge or edge in removed:
+                continue
+            if discovery[neighbor] == -1:
+                discovery[neighbor] = low[neighbor] = time
+                time += 1
+                stack.append((neighbor, edge, iter(adjacency[neighbor])))
+                break
+            low[node] = min(low[node], discovery[neighbor])
+        else:
+            stack.pop()
+            if stack:
+                parent = stack[-1][0]
+                low[parent] = min(low[parent], low[node])
+                if low[node] > discovery[parent]:
+                    bridges.add(parent_edge)
+    return bridges
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Merges datasets that were built in shards, cf. the `shard_index` and `num_shards` options of `build_datasets`."""
+
+import glob
+import logging
+import os
+import shutil
+
+from powerdata_gen.dataset import log_statistics, shard_range
+from powerdata_gen.storage import (RECOVERY_RECORDS_FILE, REJECT_RECORDS_FILE, TIMEOUT_RECORDS_FILE, RecordWriter,
+                                   concatenate_shards, list_shards, load_manifest, load_reject_records, save_manifest,
+                                   write_split_index)
+
+SPLITS = ["train", "val", "test"]
+REJECTED_DIRS = {"divergence": "divergence", "filtering": "rejection"}
+
+
+def merge_datasets(shard_paths: list[str], save_path: str, log: logging.Logger) -> None:
+    """Merges the train, val and test sets built by several shards into `save_path`.
+
+    The merged datasets are the same as if they had been built at once with the same seed : samples keep their index,
+    divergent and rejected samples are renumbered in the order of the shards, and statistics are summed.
+    """
+    for split in SPLITS:
+        split_paths = [os.path.join(shard_path, split) for shard_path in shard_paths]
+        split_paths = [split_path for split_path in split_paths if os.path.isdir(split_path)]
+        if not split_paths:
+            continue
+        log.info("Merging the {} set...".format(split))
+        merge_one_dataset(split_paths, os.path.join(save_path, split), log)
+    default_net_path = os.path.join(shard_paths[0], 'default_net.json')
+    if os.path.exists(default_net_path):
+        shutil.copyfile(default_net_path, os.path.join(save_path, 'default_net.json'))
+
+
+def merge_one_dataset(shard_paths: list[str], path: str, log: logging.Logger) -> None:
+    """Merges the shards of a single dataset into `path`.
+
+    Raises a `ValueError` if the shards were not built with the same seed and configuration, if a shard is missing or
+    duplicated, or if a shard is incomplete.
+    """
+    manifests = [load_manifest(shard_path) for shard_path in shard_paths]
+    if any(manifest is None for manifest in manifests):
+        raise ValueError("Every shard should have a manifest, got {}".format(shard_paths))
+    for key in ["seed", "dataset_id", "config", "num_shards", "n_files"]:
+        if len(set(str(manifest[key]) for manifest in manifests)) > 1:
+            raise ValueError("Shards of {} do not share the same {}".format(path, key))
+    num_shards, n_files = manifests[0]["num_shards"], manifests[0]["n_files"]
+    if sorted(manifest["shard_index"] for manifest in manifests) != list(range(num_shards)):
+        raise ValueError("Expected shards {} of {}, got {}".format(
+            list(range(num_shards)), path, [manifest["shard_index"] for manifest in manifests]))
+    order = sorted(range(len(manifests)), key=lambda k: manifests[k]["shard_index"])
+    shard_paths, manifests = [shard_paths[k] for k in order], [manifests[k] for k in order]
+    for shard_path, manifest in zip(shard_paths, manifests):
+        n_expected = len(shard_range(n_files, manifest["shard_index"], num_shards))
+        if manifest["n_completed"] < n_expected:
+            raise ValueError("The shard {} is incomplete, with {} out of {} samples".format(
+                shard_path, manifest["n_completed"], n_expected))
+
+    if os.path.isdir(path) and os.listdir(path):
+        raise FileExistsError("{} is not empty".format(path))
+    os.makedirs(path, exist_ok=True)
+
+    # Accepted samples keep their index, and HDF5 shards that were split between nodes are joined back.
+    shard_files = {}
+    for shard_path in shard_paths:
+        for file_path in glob.glob(os.path.join(shard_path, 'sample_*')):
+            shutil.copyfile(file_path, os.path.join(path, os.path.basename(file_path)))
+        for file_path in list_shards(shard_path):
+            shard_files.setdefault(os.path.basename(file_path), []).append(file_path)
+    for file_name, file_paths in shard_files.items():
+        concatenate_shards(file_paths, os.path.join(path, file_name))
+    if shard_files:
+        write_split_index(path)
+
+    # Divergent and rejected samples are numbered from 1 in the order they were met, which continues across shards.
+    totals = {}
+    for shard_path, manifest in zip(shard_paths, manifests):
+        for outcome, dir_name in REJECTED_DIRS.items():
+            if not os.path.isdir(os.path.join(shard_path, dir_name)):
+                continue
+            os.makedirs(os.path.join(path, dir_name), exist_ok=True)
+            prefix = dir_name + '_sample_'
+            for file_path in glob.glob(os.path.join(shard_path, dir_name, prefix + '*')):
+                index, extension = os.path.basename(file_path)[len(prefix):].split('.', 1)
+                index = str(int(index) + totals.get(outcome, 0)).rjust(len(index), '0')
+                shutil.copyfile(file_path, os.path.join(path, dir_name, prefix + index + '.' + extension))
+        totals = {k: totals.get(k, 0) + manifest["counts"].get(k, 0) for k in totals | manifest["counts"]}
+
+    # Records of rejected, timed out and recovered attempts are keyed by sample index, and are concatenated in the order
+    # of the shards.
+    for file_name in [REJECT_RECORDS_FILE, TIMEOUT_RECORDS_FILE, RECOVERY_RECORDS_FILE]:
+        if any(os.path.exists(os.path.join(shard_path, file_name)) for shard_path in shard_paths):
+            writer = RecordWriter(path, file_name=file_name)
+            for shard_path in shard_paths:
+                for record in load_reject_records(shard_path, file_name):
+                    writer.write(record)
+            writer.close()
+
+    filtering_info, cache_info = {}, {}
+    for manifest in manifests:
+        filtering_info = {k: filtering_info.get(k, 0) + manifest["filtering_info"].get(k, 0)
+                          for k in filtering_info | manifest["filtering_info"]}
+        cache_info = {k: cache_info.get(k, 0) + manifest["cache_info"].get(k, 0)
+                      for k in cache_info | manifest["cache_info"]}
+    manifest = dict(manifests[0], shard_index=0, num_shards=1, n_completed=n_files, counts=totals,
+                    filtering_info=filtering_info, cache_info=cache_info)
+    save_manifest(path, manifest)
+    log_statistics(log, totals, filtering_info, cache_info)
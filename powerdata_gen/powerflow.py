@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""Runs AC power flows on sampled power grids."""
+
+import copy
+import inspect
+from collections import OrderedDict, deque
+from typing import Callable
+
+import numpy as np
+import pandapower as pp
+from omegaconf import DictConfig, OmegaConf
+from pandapower import pandapowerNet
+from pandapower.auxiliary import _select_is_elements_numba
+from pandapower.pypower.idx_bus import BUS_TYPE, PQ, PV, VM
+from pandapower.pypower.makePTDF import makePTDF
+from pandapower.results import init_results, verify_results
+
+from powerdata_gen.powergrid.core import clone_net
+from powerdata_gen.storage import ELEMENT_TABLES, original_index
+from powerdata_gen.utils import bind
+
+BRANCH_TABLES = ["bus", "line", "trafo"]
+# Tables whose non slack elements may be taken out of service without changing the structures of `PowerFlowCache`.
+COMMITMENT_TABLES = ["gen", "sgen"]
+INTERNAL_KEYS = ["_ppc", "_pd2ppc_lookups", "_options", "_is_elements", "_isolated_buses", "_gen_order"]
+RECYCLE = {"bus_pq": True, "gen": True, "trafo": False}
+# Options that `pp.runpp` reads from its keyword arguments, on top of its named parameters.
+RUNPP_KWARGS = ["delta_q", "init_va_degree", "init_vm_pu", "lightsim2grid", "neglect_open_switch_branches", "numba",
+                "only_v_results", "permc_spec", "recycle", "switch_rx_ratio", "tdpf_update_r_theta", "trafo3w_losses",
+                "use_umfpack", "v_debug"]
+# Injection tables that the load scaling continuation scales.
+SCALED_TABLES = ["load", "sgen", "gen"]
+
+
+def compile_powerflow(powerflow_cfg: DictConfig | dict | None) -> dict:
+    """Returns the power flow options of `powerflow_cfg` as a plain dictionary, leaving out its `recovery` chain, cf.
+    `compile_recovery`.
+
+    Raises a `ValueError` if an option is not accepted by `pp.runpp`, which silently ignores unknown options.
+    """
+    if powerflow_cfg is None:
+        return {}
+    if isinstance(powerflow_cfg, DictConfig):
+        powerflow_cfg = OmegaConf.to_container(powerflow_cfg, resolve=True)
+    valid_options = [name for name in inspect.signature(pp.runpp).parameters if name not in ["net", "kwargs"]]
+    valid_options += RUNPP_KWARGS
+    for option in powerflow_cfg:
+        if option not in valid_options + ["recovery"]:
+            raise ValueError("{} is not a valid power flow option, choose from {}".format(option, valid_options))
+    return {option: value for option, value in powerflow_cfg.items() if option != "recovery"}
+
+
+def compile_recovery(powerflow_cfg: DictConfig | dict | None) -> list[tuple[str, Callable]]:
+    """Returns the steps of the `recovery` chain of `powerflow_cfg`, as (method, function of (net, options)) pairs.
+
+    Each step is a `method` along with its `params`. Steps are tried in order on power grids whose power flow did not
+    converge, cf. `recover_power_flow`. Invalid methods or parameters raise a `ValueError`.
+    """
+
+    function_dict = {
+        "flat_start": recover_flat_start, "dc_init": recover_dc_init, "iwamoto_nr": recover_iwamoto_nr,
+        "load_scaling": recover_load_scaling, "options": recover_with_options}
+
+    if powerflow_cfg is None:
+        return []
+    if isinstance(powerflow_cfg, DictConfig):
+        powerflow_cfg = OmegaConf.to_container(powerflow_cfg, resolve=True)
+    steps = []
+    for step in powerflow_cfg.get("recovery") or []:
+        method, params = step.get("method"), step.get("params")
+        if method not in function_dict:
+            raise ValueError("{} is not a valid power flow recovery method".format(method) + ", choose from {}".format(
+                list(function_dict.keys())))
+        if method == "options":
+            params = compile_powerflow(params)
+        steps.append((method, bind(function_dict[method], 2, params, "the {} recovery method".format(method))))
+    return steps
+
+
+def recover_power_flow(net: pandapowerNet, powerflow_cfg: dict, recovery: list[tuple[str, Callable]],
+                       warm_start: "WarmStartStore" = None) -> int | None:
+    """Tries the steps of `recovery` in order on `net`, whose power flow did not converge with `powerflow_cfg`, and
+    returns the position of the step that converged, or None if none did.
+
+    The solution is stored into `warm_start` if provided and a step converged.
+    """
+    for k, (_, step) in enumerate(recovery):
+        try:
+            step(net, powerflow_cfg)
+        except pp.powerflow.LoadflowNotConverged:
+            continue
+        if warm_start is not None:
+            warm_start.store(net)
+        return k
+    return None
+
+
+def recover_flat_start(net: pandapowerNet, powerflow_cfg: dict, max_iteration: int | str = "auto") -> None:
+    """Runs the power flow again from a flat start, i.e. all voltages at 1 p.u. and 0 degree."""
+    pp.runpp(net, **dict(powerflow_cfg, init="flat", max_iteration=max_iteration))
+
+
+def recover_dc_init(net: pandapowerNet, powerflow_cfg: dict, max_iteration: int | str = "auto") -> None:
+    """Runs the power flow again, starting from the voltage angles of a DC power flow."""
+    pp.runpp(net, **dict(powerflow_cfg, init="dc", max_iteration=max_iteration))
+
+
+def recover_iwamoto_nr(net: pandapowerNet, powerflow_cfg: dict, init: str = "dc",
+                       max_iteration: int | str = "auto") -> None:
+    """Runs the power flow again with the Newton-Raphson method damped by the Iwamoto multiplier."""
+    pp.runpp(net, **dict(powerflow_cfg, algorithm="iwamoto_nr", init=init, max_iteration=max_iteration))
+
+
+def recover_load_scaling(net: pandapowerNet, powerflow_cfg: dict, min_factor: float = 0.5, n_steps: int = 4) -> None:
+    """Runs the power flow again by continuation : loads and generation are scaled by `n_steps` factors evenly spaced
+    from `min_factor` up to 1, each power flow starting from the solution of the previous one. The 1st one starts
+    from a DC power flow, and the last one solves the original power grid."""
+    scaling = {table: net[table].scaling.values.copy() for table in SCALED_TABLES}
+    try:
+        for k, factor in enumerate(np.linspace(min_factor, 1., n_steps)):
+            for table in SCALED_TABLES:
+                net[table]["scaling"] = scaling[table] * factor
+            pp.runpp(net, **dict(powerflow_cfg, init="dc" if k == 0 else "results"))
+    finally:
+        for table in SCALED_TABLES:
+            net[table]["scaling"] = scaling[table]
+
+
+def recover_with_options(net: pandapowerNet, powerflow_cfg: dict, **options) -> None:
+    """Runs the power flow again, with `options` on top of the power flow options."""
+    pp.runpp(net, **dict(powerflow_cfg, **options))
+
+
+def run_power_flow(net: pandapowerNet, powerflow_cfg: dict, cache: "PowerFlowCache" = None,
+                   warm_start: "WarmStartStore" = None) -> None:
+    """Runs an AC power flow on `net`, reusing the structures of `cache` and the solutions of `warm_start` if provided.
+
+    A warm started power flow that diverges is run again once from the `init` of `powerflow_cfg`, so that the warm
+    start does not lose power flows that converge without it. Raises `pp.powerflow.LoadflowNotConverged` if the power
+    flow diverges.
+    """
+    vm_init = warm_start.nearest(net) if warm_start is not None else None
+    run = runpp if cache is None else cache.runpp
+    try:
+        run(net, vm_init, **powerflow_cfg)
+    except pp.powerflow.LoadflowNotConverged:
+        if vm_init is None:
+            raise
+        warm_start.fallbacks += 1
+        run(net, None, **powerflow_cfg)
+    if warm_start is not None:
+        warm_start.store(net)
+
+
+def runpp(net: pandapowerNet, vm_init: np.ndarray = None, **powerflow_kwargs) -> None:
+    """Runs an AC power flow, initialized from the bus voltage magnitudes `vm_init` and DC angles if provided."""
+    if vm_init is not None:
+        powerflow_kwargs = {key: value for key, value in powerflow_kwargs.items() if key != "init"}
+        powerflow_kwargs.update(init_vm_pu=vm_init, init_va_degree="dc")
+    pp.runpp(net, **powerflow_kwargs)
+
+
+def newton_iterations(net: pandapowerNet) -> int:
+    """Returns the amount of Newton-Raphson iterations of the last power flow run on `net`."""
+    if net["_ppc"] is None:
+        return 0
+    return int(net["_ppc"].get("iterations", 0))
+
+
+def topology_key(net: pandapowerNet, tables: list[str] = None) -> tuple:
+    """Returns a hashable key that identifies the set of elements of `tables` that are present and in service."""
+    if tables is None:
+        tables = ELEMENT_TABLES
+    key = []
+    for table in tables:
+        labels = np.asarray(original_index(net[table]), dtype=np.int64)
+        index = np.asarray(net[table].index, dtype=np.int64)
+        in_service = net[table].in_service.values.astype(bool)
+        key.append((table, labels.tobytes(), index.tobytes(), in_service.tobytes()))
+    return tuple(key)
+
+
+def structure_key(net: pandapowerNet) -> tuple:
+    """Returns the key of `topology_key`, except that the non slack elements of `COMMITMENT_TABLES` are identified
+    whether they are in service or not, as the structures of `PowerFlowCache` do not depend on them."""
+    key = topology_key(net, [table for table in ELEMENT_TABLES if table not in COMMITMENT_TABLES])
+    for table in COMMITMENT_TABLES:
+        labels = np.asarray(original_index(net[table]), dtype=np.int64)
+        index = np.asarray(net[table].index, dtype=np.int64)
+        slack = net[table].slack.values.astype(bool) if "slack" in net[table] else np.zeros(len(net[table]), bool)
+        in_service = net[table].in_service.values.astype(bool) & slack
+        key += ((table, labels.tobytes(), index.tobytes(), in_service.tobytes()),)
+    return key
+
+
+def injection_vector(net: pandapowerNet) -> np.ndarray:
+    """Returns the active and reactive power injections and voltage set points of in service elements, per bus.
+
+    The vector has the same size for all samples of a power grid, whichever generators and loads were removed.
+    """
+    n_bus = len(net.bus)
+    p_mw, q_mvar, vm_pu = np.zeros(n_bus), np.zeros(n_bus), np.zeros(n_bus)
+    for table, sign in [("load", -1.), ("sgen", 1.), ("gen", 1.), ("ext_grid", 1.)]:
+        elements = net[table][net[table].in_service.values.astype(bool)]
+        positions = net.bus.index.get_indexer(elements.bus.values)
+        if "p_mw" in elements:
+            np.add.at(p_mw, positions, sign * elements.p_mw.values)
+        if "q_mvar" in elements:
+            np.add.at(q_mvar, positions, sign * elements.q_mvar.values)
+        if "vm_pu" in elements:
+            vm_pu[positions] = elements.vm_pu.values
+    return np.concatenate([p_mw, q_mvar, vm_pu])
+
+
+class PowerFlowCache:
+    """LRU cache of the structures that pandapower builds before a power flow, keyed by topology.
+
+    Each entry holds the internal PPC (including Ybus, Yf, Yt and the bus ordering) and the pandapower to PPC lookups
+    of the first converged power flow of a topology. Power grids that share this topology then only update their
+    injections and voltage set points, and start the Newton-Raphson from the stored solution. Topologies are
+    identified by `structure_key`, hence generators may be committed differently : the in service elements and the
+    PV buses of a hit are derived again from the power grid. All power flows run through the same cache should use
+    the same options.
+    """
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def runpp(self, net: pandapowerNet, vm_init: np.ndarray = None, **powerflow_kwargs) -> None:
+        """Runs an AC power flow on `net`, and caches its structures if its topology has not been seen yet."""
+        key = structure_key(net)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            for internal_key, value in self.entries[key].items():
+                net[internal_key] = copy.deepcopy(value)
+            # PV buses are set again by the recycled power flow, from the generators that are in service.
+            net["_is_elements"] = _select_is_elements_numba(net, net["_isolated_buses"])
+            bus_types = net._ppc["bus"][:, BUS_TYPE]
+            bus_types[bus_types == PV] = PQ
+            # Result tables are prepared as in a regular power flow, which the recycled power flow skips.
+            if net._options["init_results"]:
+                verify_results(net)
+            else:
+                init_results(net)
+            # The recycled power flow starts from the voltages stored in the PPC.
+            if vm_init is not None:
+                net._ppc["bus"][net._pd2ppc_lookups["bus"][net.bus.index.values], VM] = vm_init
+            pp.runpp(net, recycle=RECYCLE)
+        else:
+            self.misses += 1
+            runpp(net, vm_init, **powerflow_kwargs)
+            self.store(key, net)
+
+    def store(self, key: tuple, net: pandapowerNet) -> None:
+        """Stores the structures of the converged power grid `net`, evicting the least recently used entry if full."""
+        if self.max_size <= 0:
+            return
+        self.entries[key] = {internal_key: copy.deepcopy(net[internal_key]) for internal_key in INTERNAL_KEYS}
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Returns the hit, miss and eviction counts."""
+        return {"cache_hit": self.hits, "cache_miss": self.misses, "cache_eviction": self.evictions}
+
+
+class WarmStartStore:
+    """Bounded store of converged bus voltage magnitudes, used to initialize the power flows of later samples.
+
+    Solutions are grouped by branch topology (i.e. the sets of buses, lines and transformers), and the `max_size` most
+    recent solutions of each topology are kept along with their injection vectors, aligned with the buses of
+    `default_net`. A power flow starts from the magnitudes of the solution whose injections are the closest to its
+    own, in Euclidean distance, among the solutions of its topology if any, or else among all stored solutions.
+    Voltage angles mostly depend on the active power dispatch, and are better initialized by a DC power flow.
+    Only the `max_topologies` most recently used topologies are kept. The solution of `default_net` is stored if
+    available. The amounts of warm started power flows, and of those that diverged and were run again from the
+    configured initialization, cf. `run_power_flow`, are counted.
+    """
+
+    def __init__(self, default_net: pandapowerNet, max_size: int = 16, max_topologies: int = 128):
+        self.bus_labels = default_net.bus.index
+        self.max_size = max_size
+        self.max_topologies = max_topologies
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.fallbacks = 0
+        if default_net.converged:
+            self.store(default_net)
+
+    def nearest(self, net: pandapowerNet) -> np.ndarray | None:
+        """Returns the bus voltage magnitudes of the closest stored solution, or None if there is none.
+
+        Buses of `net` that were removed from the closest solution start from a magnitude of 1 p.u.
+        """
+        key = topology_key(net, BRANCH_TABLES)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            solutions = self.entries[key]
+        else:
+            solutions = [solution for solutions in self.entries.values() for solution in solutions]
+        if not solutions:
+            return None
+        self.hits += 1
+        positions = self.bus_labels.get_indexer(original_index(net.bus))
+        x = self.align(injection_vector(net).reshape(3, -1), positions, fill_value=0.).ravel()
+        distances = np.linalg.norm(np.stack([x_ for x_, _ in solutions]) - x, axis=1)
+        _, vm_pu = solutions[np.argmin(distances)]
+        return np.nan_to_num(vm_pu[positions], nan=1.)
+
+    def store(self, net: pandapowerNet) -> None:
+        """Stores the solution of the converged power grid `net`."""
+        if self.max_size <= 0 or self.max_topologies <= 0:
+            return
+        key = topology_key(net, BRANCH_TABLES)
+        if key not in self.entries:
+            self.entries[key] = deque(maxlen=self.max_size)
+            if len(self.entries) > self.max_topologies:
+                self.entries.popitem(last=False)
+        self.entries.move_to_end(key)
+        positions = self.bus_labels.get_indexer(original_index(net.bus))
+        res_bus = net.res_bus.reindex(net.bus.index)
+        x = self.align(injection_vector(net).reshape(3, -1), positions, fill_value=0.).ravel()
+        self.entries[key].append((x, self.align(res_bus.vm_pu.values, positions)))
+
+    def stats(self) -> dict:
+        """Returns the amounts of warm started power flows and of fallbacks to the configured initialization."""
+        return {"warm_start_hit": self.hits, "warm_start_fallback": self.fallbacks}
+
+    def align(self, values: np.ndarray, positions: np.ndarray, fill_value: float = np.nan) -> np.ndarray:
+        """Scatters `values`, defined over the buses at `positions`, onto the buses of the default power grid."""
+        aligned = np.full(values.shape[:-1] + (len(self.bus_labels),), fill_value)
+        aligned[..., positions] = values
+        return aligned
+
+
+class DCScreen:
+    """Estimates branch loadings with a DC approximation, to reject overflowing samples before the AC power flow.
+
+    The PTDF matrix, bus ordering and branch ratings of each topology are computed once using a pandapower DC power
+    flow, and stored in an LRU cache of `max_size` topologies. Loadings then only require a matrix-vector product.
+    Samples are rejected if a branch loading exceeds `max_loading_percent`.
+    """
+
+    def __init__(self, max_loading_percent: float, max_size: int = 128):
+        self.max_loading_percent = max_loading_percent
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def reject(self, net: pandapowerNet) -> bool:
+        """Checks if the DC loading of a branch of `net` exceeds `max_loading_percent`."""
+        loading_percent = self.loading_percent(net)
+        return len(loading_percent) > 0 and loading_percent.max() > self.max_loading_percent
+
+    def loading_percent(self, net: pandapowerNet) -> np.ndarray:
+        """Returns the DC loading of in service lines and transformers, in the order of the pandapower internal PPC."""
+        key = topology_key(net, BRANCH_TABLES + ["ext_grid"])
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = self.build(net)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        entry = self.entries[key]
+
+        p_mw = np.zeros(entry["n_bus"])
+        for table, column, sign in [("load", "p_mw", -1.), ("sgen", "p_mw", 1.), ("gen", "p_mw", 1.),
+                                    ("shunt", "p_mw", -1.)]:
+            elements = net[table][net[table].in_service.values.astype(bool)]
+            factor = elements.step.values if table == "shunt" else elements.scaling.values
+            np.add.at(p_mw, entry["bus_lookup"][elements.bus.values], sign * factor * elements[column].values)
+        p_bus = p_mw[:entry["ptdf"].shape[1]] / entry["base_mva"] - entry["p_bus_inj"]
+        flows_mw = (entry["ptdf"] @ p_bus + entry["p_f_inj"]) * entry["base_mva"]
+        return 100. * np.abs(flows_mw) / entry["rating_mw"]
+
+    @staticmethod
+    def build(net: pandapowerNet) -> dict:
+        """Computes the PTDF matrix, the bus lookup and the branch ratings of the topology of `net`."""
+        dc_net = clone_net(net)
+        pp.rundcpp(dc_net)
+        ppci = dc_net._ppc["internal"]
+        lookups = dc_net._pd2ppc_lookups
+
+        rating_mw = np.full(len(dc_net._ppc["branch"]), np.inf)
+        if "line" in lookups["branch"]:
+            f, t = lookups["branch"]["line"]
+            line = net.line
+            rating_mw[f:t] = (np.sqrt(3) * net.bus.vn_kv.loc[line.from_bus].values * line.max_i_ka.values *
+                              line.df.values * line.parallel.values)
+        if "trafo" in lookups["branch"]:
+            f, t = lookups["branch"]["trafo"]
+            trafo = net.trafo
+            rating_mw[f:t] = (trafo.sn_mva.values * trafo.df.values * trafo.parallel.values *
+                              net.bus.vn_kv.loc[trafo.hv_bus].values / trafo.vn_hv_kv.values)
+
+        return {"ptdf": makePTDF(ppci["baseMVA"], ppci["bus"], ppci["branch"], using_sparse_solver=True),
+                "bus_lookup": lookups["bus"].copy(), "n_bus": len(dc_net._ppc["bus"]), "base_mva": ppci["baseMVA"],
+                "p_bus_inj": ppci["Pbusinj"], "p_f_inj": ppci["Pfinj"], "rating_mw": rating_mw[ppci["branch_is"]]}
@@ -1,17 +1,30 @@
 # -*- coding: utf-8 -*-
 """Samples active generation."""
 
+from typing import Callable
+
 import numpy as np
 import pandapower as pp
 from omegaconf import DictConfig
 from pandapower import pandapowerNet
 
-from powerdata_gen.utils import SamplingException, sample_normal_simplex, sample_uniform_simplex
+from powerdata_gen.powergrid import dc_opf
+from powerdata_gen.utils import SamplingException, bind, sample_normal_simplex, sample_uniform_simplex
+
+# Generators are only disconnected if the DC-OPF dispatches them below their minimum active power by more than this
+# amount (in MW), so that the decision does not depend on the tolerance of the DC-OPF backend.
+DISCONNECT_TOLERANCE_MW = 1e-3
 
 
 def sample_active_generation(net: pandapowerNet, default_net: pandapowerNet, total_load: float,
-                             cfg: DictConfig) -> None:
+                             rng: np.random.Generator, cfg: DictConfig) -> None:
     """Samples active gen while respecting the total load."""
+    compile_active_generation(cfg)(net, default_net, total_load, rng)
+
+
+def compile_active_generation(cfg: DictConfig) -> Callable:
+    """Returns the active generation sampling method of `cfg` as a function of (net, default_net, total_load, rng), with
+    its parameters validated and bound."""
     function_dict = {
         "homothetic": apply_homothetic_transform, "uniform_independent_factor": sample_uniform_independent_factor,
         "normal_independent_factor": sample_normal_independent_factor,
@@ -20,14 +33,15 @@ def sample_active_generation(net: pandapowerNet, default_net: pandapowerNet, tot
         "dc_opf_disconnect": sample_dc_opf_disconnect}
 
     if cfg.method in function_dict:
-        function_dict[cfg.method](net, default_net, total_load, **cfg.params)
+        return bind(function_dict[cfg.method], 4, cfg.get("params"),
+                    "the {} active generation sampling method".format(cfg.method))
     else:
         raise ValueError(
             "{} is not a valid active generation sampling method".format(cfg.method) + ", choose from {}".format(
                 list(function_dict.keys())))
 
 
-def apply_homothetic_transform(net: pandapowerNet, default_net: pandapowerNet, total_load: float,
+def apply_homothetic_transform(net: pandapowerNet, default_net: pandapowerNet, total_load: float, _,
                                gen_to_load_ratio: float = 1.02) -> None:
     """Homothetically transforms active loads to respect total_load, while adjusting approximately for Joule losses."""
     active_gen = net.gen.in_service
@@ -39,7 +53,8 @@ def apply_homothetic_transform(net: pandapowerNet, default_net: pandapowerNet, t
 
 
 def sample_uniform_independent_factor(net: pandapowerNet, default_net: pandapowerNet, total_load: float,
-                                      gen_to_load_ratio: float = 1.02, beta: float = 1.) -> None:
+                                      rng: np.random.Generator, gen_to_load_ratio: float = 1.02,
+                                      beta: float = 1.) -> None:
     """Samples uniformly around the default active generation, while respecting the total_load and Joule losses."""
     active_gen = net.gen.in_service
     active_sgen = net.sgen.in_service
@@ -49,13 +64,14 @@ def sample_uniform_independent_factor(net: pandapowerNet, default_net: pandapowe
     total_gen = total_load * gen_to_load_ratio
     gen_default_value = (default_net.gen.p_mw.loc[active_gen]) / default_total_gen
     sgen_default_value = (default_net.sgen.p_mw.loc[active_sgen]) / default_total_gen
-    factor = sample_uniform_simplex(beta=beta, size=n_gen + n_sgen, center_around_zero=True)
+    factor = sample_uniform_simplex(rng, beta=beta, size=n_gen + n_sgen, center_around_zero=True)
     net.gen.p_mw.loc[active_gen] = (factor[:n_gen] + gen_default_value) * total_gen
     net.sgen.p_mw.loc[active_sgen] = (factor[n_gen:] + sgen_default_value) * total_gen
 
 
 def sample_normal_independent_factor(net: pandapowerNet, default_net: pandapowerNet, total_load: float,
-                                     gen_to_load_ratio: float = 1.02, std: float = 0.) -> None:
+                                     rng: np.random.Generator, gen_to_load_ratio: float = 1.02,
+                                     std: float = 0.) -> None:
     """Samples normally around the default active generation, while respecting the total_load and Joule losses."""
     active_gen = net.gen.in_service * (net.gen.p_mw != 0.)
     inactive_gen = ~active_gen
@@ -67,119 +83,296 @@ def sample_normal_independent_factor(net: pandapowerNet, default_net: pandapower
     total_gen = total_load * gen_to_load_ratio
     gen_default_value = (default_net.gen.p_mw.loc[active_gen]) / default_total_gen
     sgen_default_value = (default_net.sgen.p_mw.loc[active_sgen]) / default_total_gen
-    factor = sample_normal_simplex(std=std, size=n_gen + n_sgen, center_around_zero=True)
+    factor = sample_normal_simplex(rng, std=std, size=n_gen + n_sgen, center_around_zero=True)
     net.gen.p_mw.loc[active_gen] = (factor[:n_gen] + gen_default_value) * total_gen
     net.gen.p_mw.loc[inactive_gen] = 0.
     net.sgen.p_mw.loc[active_sgen] = (factor[n_gen:] + sgen_default_value) * total_gen
     net.sgen.p_mw.loc[inactive_sgen] = 0.
 
 
-def sample_uniform_independent_values(net: pandapowerNet, _, total_load: float, gen_to_load_ratio: float = 1.02,
-                                      beta: float = 1.) -> None:
+def sample_uniform_independent_values(net: pandapowerNet, _, total_load: float, rng: np.random.Generator,
+                                      gen_to_load_ratio: float = 1.02, beta: float = 1.) -> None:
     """Samples independent active generation uniformly, while respecting total_load."""
     active_gen = net.gen.in_service
     active_sgen = net.sgen.in_service
     n_gen = active_gen.sum()
     n_sgen = active_sgen.sum()
     total_gen = total_load * gen_to_load_ratio
-    factor = sample_uniform_simplex(beta=beta, size=n_gen + n_sgen)
+    factor = sample_uniform_simplex(rng, beta=beta, size=n_gen + n_sgen)
     net.gen.p_mw.loc[active_gen] = factor[:n_gen] * total_gen
     net.sgen.p_mw.loc[active_sgen] = factor[n_gen:] * total_gen
 
 
-def sample_normal_independent_values(net: pandapowerNet, _, total_load: float, gen_to_load_ratio: float = 1.02,
-                                     std: float = 0.) -> None:
+def sample_normal_independent_values(net: pandapowerNet, _, total_load: float, rng: np.random.Generator,
+                                     gen_to_load_ratio: float = 1.02, std: float = 0.) -> None:
     """Samples independent active generation normally, while respecting total_load."""
     active_gen = net.gen.in_service
     active_sgen = net.sgen.in_service
     n_gen = active_gen.sum()
     n_sgen = active_sgen.sum()
     total_gen = total_load * gen_to_load_ratio
-    factor = sample_normal_simplex(std=std, size=n_gen + n_sgen)
+    factor = sample_normal_simplex(rng, std=std, size=n_gen + n_sgen)
     net.gen.p_mw.loc[active_gen] = factor[:n_gen] * total_gen
     net.sgen.p_mw.loc[active_sgen] = factor[n_gen:] * total_gen
 
 
-def sample_dc_opf(net: pandapowerNet, *_, min_cp0: float = 0., max_cp0: float = 0., min_cp1: float = 0.,
-                  max_cp1: float = 0., min_cp2: float = 0., max_cp2: float = 0.) -> None:
+def sample_dc_opf(net: pandapowerNet, _, __, rng: np.random.Generator, min_cp0: float = 0., max_cp0: float = 0.,
+                  min_cp1: float = 0., max_cp1: float = 0., min_cp2: float = 0., max_cp2: float = 0.,
+                  backend: str = "pandapower") -> None:
     """Samples random costs function coefficients for generators and solves the DC-OPF for active power dispatch."""
+    sample_cost_coefficients(net, rng, min_cp0, max_cp0, min_cp1, max_cp1, min_cp2, max_cp2)
+    solve_dc_opf(net, backend)
 
-    # Sample random cost coefficients
-    net.poly_cost.cp0_eur = np.random.uniform(min_cp0, max_cp0, size=[len(net.poly_cost)])
-    net.poly_cost.cp1_eur_per_mw = np.random.uniform(min_cp1, max_cp1, size=[len(net.poly_cost)])
-    net.poly_cost.cp2_eur_per_mw2 = np.random.uniform(min_cp2, max_cp2, size=[len(net.poly_cost)])
 
-    # DC OPF
-    try:
-        pp.rundcopp(net)
-    except pp.OPFNotConverged:
-        raise SamplingException
+def sample_dc_opf_disconnect(net: pandapowerNet, _, __, rng: np.random.Generator, max_loading_percent: float = 85.,
+                             min_cp0: float = 0., max_cp0: float = 0., min_cp1: float = 0., max_cp1: float = 0.,
+                             min_cp2: float = 0., max_cp2: float = 0., backend: str = "pandapower") -> None:
+    """Samples random linear costs for generators and solves the DC-OPF for active power dispatch."""
+    sample_cost_coefficients(net, rng, min_cp0, max_cp0, min_cp1, max_cp1, min_cp2, max_cp2)
+    solve_dc_opf_disconnect(net, max_loading_percent, backend)
+
+
+def sample_cost_coefficients(net: pandapowerNet, rng: np.random.Generator, min_cp0: float = 0., max_cp0: float = 0.,
+                             min_cp1: float = 0., max_cp1: float = 0., min_cp2: float = 0.,
+                             max_cp2: float = 0.) -> None:
+    """Samples random polynomial cost coefficients for generators."""
+    net.poly_cost.cp0_eur = rng.uniform(min_cp0, max_cp0, size=[len(net.poly_cost)])
+    net.poly_cost.cp1_eur_per_mw = rng.uniform(min_cp1, max_cp1, size=[len(net.poly_cost)])
+    net.poly_cost.cp2_eur_per_mw2 = rng.uniform(min_cp2, max_cp2, size=[len(net.poly_cost)])
+
+
+def solve_dc_opf(net: pandapowerNet, backend: str = "pandapower") -> None:
+    """Solves the DC-OPF for active power dispatch, using the current cost coefficients."""
+    dispatch = run_dc_opf(net, backend)
 
     # Store OPF results into generators
-    net.gen.p_mw = net.res_gen.p_mw
-    net.sgen.p_mw = net.res_sgen.p_mw
+    net.gen.p_mw = dispatch["gen"]
+    net.sgen.p_mw = dispatch["sgen"]
 
 
-def sample_dc_opf_disconnect(net: pandapowerNet, *_, max_loading_percent: float = 85., min_cp0: float = 0.,
-                             max_cp0: float = 0., min_cp1: float = 0., max_cp1: float = 0., min_cp2: float = 0.,
-                             max_cp2: float = 0.) -> None:
-    """Samples random linear costs for generators and solves the DC-OPF for active power dispatch."""
+def run_dc_opf(net: pandapowerNet, backend: str = "pandapower") -> dict[str, np.ndarray]:
+    """Solves the DC-OPF using the current cost coefficients, and returns the active power of `gen` and `sgen`.
 
-    # Set min_p_mw to 0.
-    old_gen_min_p_mw = net.gen.min_p_mw.values
-    net.gen.min_p_mw = 0.
-    old_sgen_min_p_mw = net.sgen.min_p_mw.values
-    net.sgen.min_p_mw = 0.
+    Raises `SamplingException` if the DC-OPF does not converge.
+    """
+    function_dict = {"pandapower": run_pandapower_dc_opf, "highs": run_highs_dc_opf}
 
-    # Sample random cost coefficients.
-    net.poly_cost.cp0_eur = np.random.uniform(min_cp0, max_cp0, size=[len(net.poly_cost)])
-    net.poly_cost.cp1_eur_per_mw = np.random.uniform(min_cp1, max_cp1, size=[len(net.poly_cost)])
-    net.poly_cost.cp2_eur_per_mw2 = np.random.uniform(min_cp2, max_cp2, size=[len(net.poly_cost)])
+    if backend in function_dict:
+        return function_dict[backend](net)
+    else:
+        raise ValueError(
+            "{} is not a valid DC-OPF backend".format(backend) + ", choose from {}".format(list(function_dict.keys())))
 
-    # Change branch maximum loading percent for the DC-OPF.
-    net.line.max_loading_percent = max_loading_percent
-    net.trafo.max_loading_percent = max_loading_percent
 
-    # 1st OPF to decide which generators to disconnect.
+def run_pandapower_dc_opf(net: pandapowerNet) -> dict[str, np.ndarray]:
+    """Solves the DC-OPF with `pp.rundcopp`, which also stores its results in `net`."""
     try:
-        pp.rundcpp(net)
         pp.rundcopp(net)
     except pp.OPFNotConverged:
         raise SamplingException
+    return {"gen": net.res_gen.p_mw.values, "sgen": net.res_sgen.p_mw.values}
 
-    # Disconnect generators below their initial min_p_mw.
-    net.gen.reset_index(inplace=True)
-    net.res_gen.reset_index(inplace=True)
-    gen_disconnect = net.res_gen.p_mw < old_gen_min_p_mw
-    gen_disconnect_id = net.gen.loc[gen_disconnect].index
-    gen_bus_id = net.bus.loc[net.gen.loc[gen_disconnect].bus].index
-    for i, trafo in net.trafo.iterrows():
-        if trafo['lv_bus'] in gen_bus_id.to_list():
-            net.trafo.drop(i, inplace=True)
-    net.bus.drop(gen_bus_id, inplace=True)
-    net.gen.drop(gen_disconnect_id, inplace=True)
-
-    net.sgen.reset_index(inplace=True)
-    net.res_sgen.reset_index(inplace=True)
-    sgen_disconnect = net.res_sgen.p_mw < old_sgen_min_p_mw
-    sgen_disconnect_id = net.sgen.loc[sgen_disconnect].index
-    net.sgen.drop(sgen_disconnect_id, inplace=True)
-
-    # Reset min_p_mw for connected generators.
-    net.gen.min_p_mw = np.delete(old_gen_min_p_mw, gen_disconnect_id)
-    net.sgen.min_p_mw = np.delete(old_sgen_min_p_mw, sgen_disconnect_id)
-
-    # 2nd OPF without disconnected generators.
-    try:
-        pp.rundcpp(net)
-        pp.rundcopp(net)
-    except pp.OPFNotConverged:
-        raise SamplingException
 
-    # Store OPF results into generators.
-    net.gen.p_mw = net.res_gen.p_mw
-    net.sgen.p_mw = net.res_sgen.p_mw
+def run_highs_dc_opf(net: pandapowerNet) -> dict[str, np.ndarray]:
+    """Solves the DC-OPF as a linear program with HiGHS, whose structure is cached by topology.
+
+    Falls back to `pp.rundcopp` if the DC-OPF is not a linear program, e.g. if a quadratic cost is non-zero.
+    """
+    if not dc_opf.is_supported(net):
+        return run_pandapower_dc_opf(net)
+    return dc_opf.solve(net)
+
+
+def solve_dc_opf_disconnect(net: pandapowerNet, max_loading_percent: float = 85., backend: str = "pandapower") -> None:
+    """Solves the DC-OPF for active power dispatch using the current cost coefficients, disconnects generators that
+    fall below their minimum active power, and solves the DC-OPF again.
+
+    The 2nd DC-OPF is solved on the same topology as the 1st one, with the active power of disconnected generators
+    fixed to 0, so that the `highs` backend reuses its cached problem structure. Disconnected generators are then
+    taken out of service, while their buses and step-up transformers stay in service, so that the admittance matrix
+    does not depend on the dispatch. Without load, these transformers carry no current, unless they have
+    magnetizing losses.
+    """
+
+    # Change branch maximum loading percent for the DC-OPF.
+    net.line.max_loading_percent = max_loading_percent
+    net.trafo.max_loading_percent = max_loading_percent
+
+    # 1st OPF with min_p_mw set to 0, to decide which generators to disconnect.
+    limits = {table: (net[table].min_p_mw.values.copy(), net[table].max_p_mw.values.copy())
+              for table in ["gen", "sgen"]}
+    net.gen.min_p_mw = 0.
+    net.sgen.min_p_mw = 0.
+    dispatch = run_dc_opf(net, backend)
+    disconnect = {table: dispatch[table] < min_p_mw - DISCONNECT_TOLERANCE_MW
+                  for table, (min_p_mw, _) in limits.items()}
+
+    # 2nd OPF with disconnected generators fixed to 0, whose results are stored into generators.
+    for table, (min_p_mw, max_p_mw) in limits.items():
+        net[table].min_p_mw = np.where(disconnect[table], 0., min_p_mw)
+        net[table].max_p_mw = np.where(disconnect[table], 0., max_p_mw)
+    solve_dc_opf(net, backend)
+    for table, (min_p_mw, max_p_mw) in limits.items():
+        net[table].min_p_mw = min_p_mw
+        net[table].max_p_mw = max_p_mw
 
     # Reset branch maximum loading percent.
     net.line.max_loading_percent = 100.
     net.trafo.max_loading_percent = 100.
+
+    # Take disconnected generators out of service.
+    for table in ["gen", "sgen"]:
+        net[table]["in_service"] = net[table].in_service.values & ~disconnect[table]
+
+
+def dc_opf_loading_limit(default_net: pandapowerNet, cfg: DictConfig) -> float | None:
+    """Returns the DC branch loading percent that the active generation sampling method of `cfg` never exceeds on the
+    power grids sampled from `default_net`, or None if it is not based on a DC-OPF or some branch is not limited."""
+    if cfg.method == "dc_opf_disconnect":
+        return (cfg.get("params") or {}).get("max_loading_percent", 85.)
+    if cfg.method == "dc_opf":
+        limits = [default_net[table].max_loading_percent.values for table in ["line", "trafo"]
+                  if len(default_net[table]) > 0 and "max_loading_percent" in default_net[table]]
+        if len(limits) < 2:
+            return None
+        limits = np.concatenate(limits).astype(float)
+        return None if np.isnan(limits).any() else float(limits.max())
+    return None
+
+
+def sample_active_generation_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                   rng: np.random.Generator, cfg: DictConfig) -> dict[str, np.ndarray]:
+    """Samples active generation for each value of `total_load` at once.
+
+    Returns a dictionary of arrays of shape (n_samples, n_elements), keyed by `<table>/<column>`. Methods based on a
+    DC-OPF only draw cost coefficients, and the DC-OPF is solved by `apply_active_generation`.
+    """
+    function_dict = {
+        "homothetic": apply_homothetic_transform_batch,
+        "uniform_independent_factor": sample_uniform_independent_factor_batch,
+        "normal_independent_factor": sample_normal_independent_factor_batch,
+        "uniform_independent_values": sample_uniform_independent_values_batch,
+        "normal_independent_values": sample_normal_independent_values_batch, "dc_opf": sample_dc_opf_batch,
+        "dc_opf_disconnect": sample_dc_opf_disconnect_batch}
+
+    if cfg.method in function_dict:
+        return bind(function_dict[cfg.method], 4, cfg.get("params"),
+                    "the {} active generation sampling method".format(cfg.method))(net, default_net, total_load, rng)
+    else:
+        raise ValueError(
+            "{} is not a valid active generation sampling method".format(cfg.method) + ", choose from {}".format(
+                list(function_dict.keys())))
+
+
+def apply_active_generation(net: pandapowerNet, values: dict[str, np.ndarray], cfg: DictConfig) -> None:
+    """Writes one of the samples returned by `sample_active_generation_batch` into `net`.
+
+    `values` maps each `<table>/<column>` to a single row. For methods based on a DC-OPF, the DC-OPF is solved.
+    """
+    for key, value in values.items():
+        table, column = key.split("/")
+        net[table][column] = value
+    params = cfg.get("params") or {}
+    backend = params.get("backend", "pandapower")
+    if cfg.method == "dc_opf":
+        solve_dc_opf(net, backend)
+    elif cfg.method == "dc_opf_disconnect":
+        solve_dc_opf_disconnect(net, params.get("max_loading_percent", 85.), backend)
+
+
+def _tile(values: np.ndarray, n_samples: int) -> np.ndarray:
+    """Repeats `values` along a new first axis of size `n_samples`."""
+    return np.tile(values, (n_samples, 1))
+
+
+def apply_homothetic_transform_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray, _,
+                                     gen_to_load_ratio: float = 1.02) -> dict[str, np.ndarray]:
+    """Batched version of `apply_homothetic_transform`."""
+    values = {}
+    for table in ["gen", "sgen"]:
+        active = net[table].in_service.values
+        default_p_mw = default_net[table].p_mw.reindex(net[table].index).values[active]
+        p_mw = np.full([len(total_load), len(net[table])], np.nan)
+        p_mw[:, active] = total_load[:, None] * gen_to_load_ratio * default_p_mw / default_p_mw.sum()
+        values[table + "/p_mw"] = p_mw
+    return values
+
+
+def sample_uniform_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                            rng: np.random.Generator, gen_to_load_ratio: float = 1.02,
+                                            beta: float = 1.) -> dict[str, np.ndarray]:
+    """Batched version of `sample_uniform_independent_factor`."""
+    active_gen, active_sgen = net.gen.in_service.values, net.sgen.in_service.values
+    default_gen = default_net.gen.p_mw.reindex(net.gen.index).values[active_gen]
+    default_sgen = default_net.sgen.p_mw.reindex(net.sgen.index).values[active_sgen]
+    default_total_gen = default_gen.sum() + default_sgen.sum()
+    n_gen, n_sgen = len(default_gen), len(default_sgen)
+    total_gen = total_load[:, None] * gen_to_load_ratio
+    factor = sample_uniform_simplex(rng, beta=beta, size=n_gen + n_sgen, center_around_zero=True,
+                                    n_samples=len(total_load))
+    gen_p_mw, sgen_p_mw = _tile(net.gen.p_mw.values, len(total_load)), _tile(net.sgen.p_mw.values, len(total_load))
+    gen_p_mw[:, active_gen] = (factor[:, :n_gen] + default_gen / default_total_gen) * total_gen
+    sgen_p_mw[:, active_sgen] = (factor[:, n_gen:] + default_sgen / default_total_gen) * total_gen
+    return {"gen/p_mw": gen_p_mw, "sgen/p_mw": sgen_p_mw}
+
+
+def sample_normal_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                           rng: np.random.Generator, gen_to_load_ratio: float = 1.02,
+                                           std: float = 0.) -> dict[str, np.ndarray]:
+    """Batched version of `sample_normal_independent_factor`."""
+    active_gen = net.gen.in_service.values * (net.gen.p_mw.values != 0.)
+    active_sgen = net.sgen.in_service.values * (net.sgen.p_mw.values != 0.)
+    default_gen = default_net.gen.p_mw.reindex(net.gen.index).values[active_gen]
+    default_sgen = default_net.sgen.p_mw.reindex(net.sgen.index).values[active_sgen]
+    default_total_gen = default_gen.sum() + default_sgen.sum()
+    n_gen, n_sgen = len(default_gen), len(default_sgen)
+    total_gen = total_load[:, None] * gen_to_load_ratio
+    factor = sample_normal_simplex(rng, std=std, size=n_gen + n_sgen, center_around_zero=True,
+                                   n_samples=len(total_load))
+    gen_p_mw, sgen_p_mw = np.zeros([len(total_load), len(net.gen)]), np.zeros([len(total_load), len(net.sgen)])
+    gen_p_mw[:, active_gen] = (factor[:, :n_gen] + default_gen / default_total_gen) * total_gen
+    sgen_p_mw[:, active_sgen] = (factor[:, n_gen:] + default_sgen / default_total_gen) * total_gen
+    return {"gen/p_mw": gen_p_mw, "sgen/p_mw": sgen_p_mw}
+
+
+def sample_uniform_independent_values_batch(net: pandapowerNet, _, total_load: np.ndarray, rng: np.random.Generator,
+                                            gen_to_load_ratio: float = 1.02, beta: float = 1.) -> dict[str, np.ndarray]:
+    """Batched version of `sample_uniform_independent_values`."""
+    active_gen, active_sgen = net.gen.in_service.values, net.sgen.in_service.values
+    n_gen = active_gen.sum()
+    total_gen = total_load[:, None] * gen_to_load_ratio
+    factor = sample_uniform_simplex(rng, beta=beta, size=n_gen + active_sgen.sum(), n_samples=len(total_load))
+    gen_p_mw, sgen_p_mw = _tile(net.gen.p_mw.values, len(total_load)), _tile(net.sgen.p_mw.values, len(total_load))
+    gen_p_mw[:, active_gen] = factor[:, :n_gen] * total_gen
+    sgen_p_mw[:, active_sgen] = factor[:, n_gen:] * total_gen
+    return {"gen/p_mw": gen_p_mw, "sgen/p_mw": sgen_p_mw}
+
+
+def sample_normal_independent_values_batch(net: pandapowerNet, _, total_load: np.ndarray, rng: np.random.Generator,
+                                           gen_to_load_ratio: float = 1.02, std: float = 0.) -> dict[str, np.ndarray]:
+    """Batched version of `sample_normal_independent_values`."""
+    active_gen, active_sgen = net.gen.in_service.values, net.sgen.in_service.values
+    n_gen = active_gen.sum()
+    total_gen = total_load[:, None] * gen_to_load_ratio
+    factor = sample_normal_simplex(rng, std=std, size=n_gen + active_sgen.sum(), n_samples=len(total_load))
+    gen_p_mw, sgen_p_mw = _tile(net.gen.p_mw.values, len(total_load)), _tile(net.sgen.p_mw.values, len(total_load))
+    gen_p_mw[:, active_gen] = factor[:, :n_gen] * total_gen
+    sgen_p_mw[:, active_sgen] = factor[:, n_gen:] * total_gen
+    return {"gen/p_mw": gen_p_mw, "sgen/p_mw": sgen_p_mw}
+
+
+def sample_dc_opf_batch(net: pandapowerNet, _, total_load: np.ndarray, rng: np.random.Generator, min_cp0: float = 0.,
+                        max_cp0: float = 0., min_cp1: float = 0., max_cp1: float = 0., min_cp2: float = 0.,
+                        max_cp2: float = 0., backend: str = "pandapower") -> dict[str, np.ndarray]:
+    """Batched version of `sample_dc_opf`, that only draws cost coefficients."""
+    size = [len(total_load), len(net.poly_cost)]
+    return {"poly_cost/cp0_eur": rng.uniform(min_cp0, max_cp0, size=size),
+            "poly_cost/cp1_eur_per_mw": rng.uniform(min_cp1, max_cp1, size=size),
+            "poly_cost/cp2_eur_per_mw2": rng.uniform(min_cp2, max_cp2, size=size)}
+
+
+def sample_dc_opf_disconnect_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                   rng: np.random.Generator, max_loading_percent: float = 85.,
+                                   **cost_params) -> dict[str, np.ndarray]:
+    """Batched version of `sample_dc_opf_disconnect`, that only draws cost coefficients."""
+    return sample_dc_opf_batch(net, default_net, total_load, rng, **cost_params)
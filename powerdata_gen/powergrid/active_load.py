@@ -1,15 +1,24 @@
 # -*- coding: utf-8 -*-
 """Samples active loads."""
 
+from typing import Callable
+
+import numpy as np
 from omegaconf import DictConfig
 from pandapower import pandapowerNet
 
-from powerdata_gen.utils import sample_normal_simplex, sample_uniform_simplex
+from powerdata_gen.utils import bind, sample_normal_simplex, sample_uniform_simplex
 
 
-def sample_active_load(net: pandapowerNet, default_net: pandapowerNet, total_load: float, cfg: DictConfig) -> None:
+def sample_active_load(net: pandapowerNet, default_net: pandapowerNet, total_load: float, rng: np.random.Generator,
+                       cfg: DictConfig) -> None:
     """Samples active loads while respecting the total load."""
+    compile_active_load(cfg)(net, default_net, total_load, rng)
+
 
+def compile_active_load(cfg: DictConfig) -> Callable:
+    """Returns the active load sampling method of `cfg` as a function of (net, default_net, total_load, rng), with its
+    parameters validated and bound."""
     function_dict = {
         "homothetic": apply_homothetic_transform, "uniform_independent_factor": sample_uniform_independent_factor,
         "normal_independent_factor": sample_normal_independent_factor,
@@ -17,13 +26,14 @@ def sample_active_load(net: pandapowerNet, default_net: pandapowerNet, total_loa
         "normal_independent_values": sample_normal_independent_values}
 
     if cfg.method in function_dict:
-        function_dict[cfg.method](net, default_net, total_load, **cfg.params)
+        return bind(function_dict[cfg.method], 4, cfg.get("params"),
+                    "the {} active load sampling method".format(cfg.method))
     else:
         raise ValueError("{} is not a valid active load sampling method".format(cfg.method) + ", choose from {}".format(
             list(function_dict.keys())))
 
 
-def apply_homothetic_transform(net: pandapowerNet, default_net: pandapowerNet, total_load: float) -> None:
+def apply_homothetic_transform(net: pandapowerNet, default_net: pandapowerNet, total_load: float, _) -> None:
     """Updates `net` by homothetically transforming active loads to respect total_load."""
     active = net.load.in_service
     factor = total_load / default_net.load.p_mw.loc[active].sum()
@@ -31,38 +41,108 @@ def apply_homothetic_transform(net: pandapowerNet, default_net: pandapowerNet, t
 
 
 def sample_uniform_independent_factor(net: pandapowerNet, default_net: pandapowerNet, total_load: float,
-                                      beta: float = 1.) -> None:
+                                      rng: np.random.Generator, beta: float = 1.) -> None:
     """Updates `net` by sampling uniformly around the default situation, while respecting the total_load."""
     active = net.load.in_service
     n_load = active.sum()
     default_value = default_net.load.p_mw.loc[active] / default_net.load.p_mw.loc[active].sum()
-    factor = sample_uniform_simplex(beta, size=n_load, center_around_zero=True)
+    factor = sample_uniform_simplex(rng, beta, size=n_load, center_around_zero=True)
     net.load.p_mw.loc[active] = (factor + default_value) * total_load
 
 
 def sample_normal_independent_factor(net: pandapowerNet, default_net: pandapowerNet, total_load: float,
-                                     std: float = 0.) -> None:
+                                     rng: np.random.Generator, std: float = 0.) -> None:
     """Updates `net` by sampling normally around the default situation, while respecting the total_load."""
     active = net.load.in_service
     n_load = active.sum()
     default_value = default_net.load.p_mw.loc[active] / default_net.load.p_mw.loc[active].sum()
-    factor = sample_normal_simplex(std, size=n_load, center_around_zero=True)
+    factor = sample_normal_simplex(rng, std, size=n_load, center_around_zero=True)
     net.load.p_mw.loc[active] = (factor + default_value) * total_load
 
 
-def sample_uniform_independent_values(net: pandapowerNet, _, total_load: float,
+def sample_uniform_independent_values(net: pandapowerNet, _, total_load: float, rng: np.random.Generator,
                                       beta: float = 0.) -> None:
     """Updates `net` by sampling independent loads uniformly, while respecting total_load."""
     active = net.load.in_service
     n_load = active.sum()
-    factor = sample_uniform_simplex(beta, size=n_load)
+    factor = sample_uniform_simplex(rng, beta, size=n_load)
     net.load.p_mw.loc[active] = total_load * factor
 
 
-def sample_normal_independent_values(net: pandapowerNet, _, total_load: float,
+def sample_normal_independent_values(net: pandapowerNet, _, total_load: float, rng: np.random.Generator,
                                      std: float = 0.) -> None:
     """Updates `net` by sampling independent loads normally, while respecting total_load."""
     active = net.load.in_service
     n_load = active.sum()
-    factor = sample_normal_simplex(std, size=n_load)
+    factor = sample_normal_simplex(rng, std, size=n_load)
     net.load.p_mw.loc[active] = total_load * factor
+
+
+def sample_active_load_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                             rng: np.random.Generator, cfg: DictConfig) -> np.ndarray:
+    """Samples active loads for each value of `total_load` at once, as an array of shape (n_samples, n_load)."""
+
+    function_dict = {
+        "homothetic": apply_homothetic_transform_batch,
+        "uniform_independent_factor": sample_uniform_independent_factor_batch,
+        "normal_independent_factor": sample_normal_independent_factor_batch,
+        "uniform_independent_values": sample_uniform_independent_values_batch,
+        "normal_independent_values": sample_normal_independent_values_batch}
+
+    if cfg.method in function_dict:
+        return bind(function_dict[cfg.method], 4, cfg.get("params"),
+                    "the {} active load sampling method".format(cfg.method))(net, default_net, total_load, rng)
+    else:
+        raise ValueError("{} is not a valid active load sampling method".format(cfg.method) + ", choose from {}".format(
+            list(function_dict.keys())))
+
+
+def _init_batch(net: pandapowerNet, default_net: pandapowerNet, n_samples: int) -> tuple:
+    """Returns current active loads repeated `n_samples` times, the mask of active loads and their default values."""
+    active = net.load.in_service.values
+    default_p_mw = default_net.load.p_mw.reindex(net.load.index).values[active]
+    return np.tile(net.load.p_mw.values, (n_samples, 1)), active, default_p_mw
+
+
+def apply_homothetic_transform_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                     _) -> np.ndarray:
+    """Batched version of `apply_homothetic_transform`."""
+    p_mw, active, default_p_mw = _init_batch(net, default_net, len(total_load))
+    p_mw[:, active] = (total_load[:, None] / default_p_mw.sum()) * default_p_mw
+    return p_mw
+
+
+def sample_uniform_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                            rng: np.random.Generator, beta: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_independent_factor`."""
+    p_mw, active, default_p_mw = _init_batch(net, default_net, len(total_load))
+    factor = sample_uniform_simplex(rng, beta, size=active.sum(), center_around_zero=True, n_samples=len(total_load))
+    p_mw[:, active] = (factor + default_p_mw / default_p_mw.sum()) * total_load[:, None]
+    return p_mw
+
+
+def sample_normal_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                           rng: np.random.Generator, std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_independent_factor`."""
+    p_mw, active, default_p_mw = _init_batch(net, default_net, len(total_load))
+    factor = sample_normal_simplex(rng, std, size=active.sum(), center_around_zero=True, n_samples=len(total_load))
+    p_mw[:, active] = (factor + default_p_mw / default_p_mw.sum()) * total_load[:, None]
+    return p_mw
+
+
+def sample_uniform_independent_values_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                            rng: np.random.Generator, beta: float = 0.) -> np.ndarray:
+    """Batched version of `sample_uniform_independent_values`."""
+    p_mw, active, _ = _init_batch(net, default_net, len(total_load))
+    factor = sample_uniform_simplex(rng, beta, size=active.sum(), n_samples=len(total_load))
+    p_mw[:, active] = total_load[:, None] * factor
+    return p_mw
+
+
+def sample_normal_independent_values_batch(net: pandapowerNet, default_net: pandapowerNet, total_load: np.ndarray,
+                                           rng: np.random.Generator, std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_independent_values`."""
+    p_mw, active, _ = _init_batch(net, default_net, len(total_load))
+    factor = sample_normal_simplex(rng, std, size=active.sum(), n_samples=len(total_load))
+    p_mw[:, active] = total_load[:, None] * factor
+    return p_mw
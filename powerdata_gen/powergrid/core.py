@@ -1,27 +1,135 @@
 # -*- coding: utf-8 -*-
 """Samples a power grid."""
 
-import copy
-
+import numpy as np
 from omegaconf import DictConfig
 from pandapower import pandapowerNet
 
-from .active_generation import sample_active_generation
-from .active_load import sample_active_load
-from .reactive_load import sample_reactive_load
-from .topology import sample_topology
-from .total_load import sample_total_load
-from .voltage_setpoint import sample_voltage_setpoint
+from powerdata_gen.profiling import SampleProfile, timed
+from powerdata_gen.watchdog import Watchdog
+from .active_generation import apply_active_generation, compile_active_generation, sample_active_generation_batch
+from .active_load import compile_active_load, sample_active_load_batch
+from .reactive_load import compile_reactive_load, sample_reactive_load_batch
+from .topology import compile_topology
+from .total_load import compile_total_load, sample_total_load_batch
+from .voltage_setpoint import compile_voltage_setpoint, sample_voltage_setpoint_batch
+
+MUTABLE_TABLES = ["load", "gen", "sgen", "line", "trafo", "bus", "ext_grid", "poly_cost"]
+SAMPLING_STEPS = ["topology", "total_load", "active_load", "reactive_load", "active_gen", "voltage_setpoint"]
+
+
+class SamplingPlan:
+    """Sampling methods of a sampling configuration, compiled once for the power grids sampled from `default_net`.
+
+    Each step of `SAMPLING_STEPS` is a function whose method is resolved and whose parameters are validated, bound
+    and precomputed, so that sampling does not look up the configuration anymore. Invalid methods, steps or
+    parameters raise a `ValueError`.
+    """
+
+    def __init__(self, default_net: pandapowerNet, sampling_cfg: DictConfig):
+        unknown_steps = [step for step in sampling_cfg.keys() if step not in SAMPLING_STEPS]
+        if unknown_steps:
+            raise ValueError("{} are not valid sampling steps, choose from {}".format(unknown_steps, SAMPLING_STEPS))
+        self.topology = compile_topology(default_net, sampling_cfg.topology)
+        self.total_load = compile_total_load(sampling_cfg.total_load)
+        self.active_load = compile_active_load(sampling_cfg.active_load)
+        self.reactive_load = compile_reactive_load(sampling_cfg.reactive_load)
+        self.active_gen = compile_active_generation(sampling_cfg.active_gen)
+        self.voltage_setpoint = compile_voltage_setpoint(sampling_cfg.voltage_setpoint)
 
 
-def sample_power_grid(default_net: pandapowerNet, sampling_cfg: DictConfig) -> pandapowerNet:
-    """Samples a single power grid instance."""
+def sample_power_grid(default_net: pandapowerNet, sampling_cfg: DictConfig | SamplingPlan, rng: np.random.Generator,
+                      profile: SampleProfile = None, watchdog: Watchdog = None) -> pandapowerNet:
+    """Samples a single power grid instance, drawing all random values from `rng`.
 
-    net = copy.deepcopy(default_net)
-    sample_topology(net, sampling_cfg.topology)
-    total_load = sample_total_load(net, sampling_cfg.total_load)
-    sample_active_load(net, default_net, total_load, sampling_cfg.active_load)
-    sample_reactive_load(net, default_net, sampling_cfg.reactive_load)
-    sample_active_generation(net, default_net, total_load, sampling_cfg.active_gen)
-    sample_voltage_setpoint(net, default_net, sampling_cfg.voltage_setpoint)
+    `sampling_cfg` is compiled into a `SamplingPlan` if it is not one already, which is best done once beforehand when
+    sampling many power grids. If `profile` is provided, the wall time of each sampling step is recorded into it.
+    If `watchdog` is provided, each sampling step is bounded by its time budget.
+    """
+    plan = compile_sampling(default_net, sampling_cfg)
+    net = sample_power_grid_topology(default_net, plan, rng, profile, watchdog)
+    sample_power_grid_injections(net, default_net, plan, rng, profile, watchdog)
     return net
+
+
+def sample_power_grid_topology(default_net: pandapowerNet, sampling_cfg: DictConfig | SamplingPlan,
+                               rng: np.random.Generator, profile: SampleProfile = None,
+                               watchdog: Watchdog = None) -> pandapowerNet:
+    """Returns a copy of `default_net` whose topology is sampled, which is the first step of `sample_power_grid`."""
+    plan = compile_sampling(default_net, sampling_cfg)
+    with timed(profile, "clone", watchdog):
+        net = clone_net(default_net)
+    with timed(profile, "topology", watchdog):
+        plan.topology(net, rng)
+    return net
+
+
+def sample_power_grid_injections(net: pandapowerNet, default_net: pandapowerNet,
+                                 sampling_cfg: DictConfig | SamplingPlan, rng: np.random.Generator,
+                                 profile: SampleProfile = None, watchdog: Watchdog = None) -> None:
+    """Samples the loads, generation and voltage set points of `net`, which are the remaining steps of
+    `sample_power_grid` once the topology is sampled."""
+    plan = compile_sampling(default_net, sampling_cfg)
+    with timed(profile, "total_load", watchdog):
+        total_load = plan.total_load(net, rng)
+    with timed(profile, "active_load", watchdog):
+        plan.active_load(net, default_net, total_load, rng)
+    with timed(profile, "reactive_load", watchdog):
+        plan.reactive_load(net, default_net, rng)
+    with timed(profile, "active_gen", watchdog):
+        plan.active_gen(net, default_net, total_load, rng)
+    with timed(profile, "voltage_setpoint", watchdog):
+        plan.voltage_setpoint(net, default_net, rng)
+
+
+def compile_sampling(default_net: pandapowerNet, sampling_cfg: DictConfig | SamplingPlan) -> SamplingPlan:
+    """Returns the `SamplingPlan` of `sampling_cfg`, or `sampling_cfg` itself if it is already compiled."""
+    if isinstance(sampling_cfg, SamplingPlan):
+        return sampling_cfg
+    return SamplingPlan(default_net, sampling_cfg)
+
+
+def sample_scenarios(net: pandapowerNet, default_net: pandapowerNet, sampling_cfg: DictConfig,
+                     rng: np.random.Generator, n_samples: int) -> dict[str, np.ndarray]:
+    """Samples `n_samples` injection scenarios at once, for the topology of `net`.
+
+    Returns arrays of shape (n_samples, n_elements) keyed by `<table>/<column>`, along with the sampled `total_load`.
+    Scenarios are only written into a power grid by `apply_scenario`.
+    """
+    total_load = sample_total_load_batch(net, rng, sampling_cfg.total_load, n_samples)
+    p_mw = sample_active_load_batch(net, default_net, total_load, rng, sampling_cfg.active_load)
+    q_mvar = sample_reactive_load_batch(net, default_net, p_mw, rng, sampling_cfg.reactive_load)
+    generation = sample_active_generation_batch(net, default_net, total_load, rng, sampling_cfg.active_gen)
+    vm_pu = sample_voltage_setpoint_batch(net, default_net, rng, sampling_cfg.voltage_setpoint, n_samples)
+    return {"total_load": total_load, "load/p_mw": p_mw, "load/q_mvar": q_mvar, **generation,
+            "gen/vm_pu": vm_pu[:, :len(net.gen)], "ext_grid/vm_pu": vm_pu[:, len(net.gen):]}
+
+
+def apply_scenario(net: pandapowerNet, scenarios: dict[str, np.ndarray], k: int, sampling_cfg: DictConfig) -> None:
+    """Writes the `k`-th scenario returned by `sample_scenarios` into `net`, and solves the DC-OPF if needed.
+
+    Voltage set points are written before the active generation, as DC-OPF based methods may remove generators.
+    """
+    injection_keys = ["load/p_mw", "load/q_mvar", "gen/vm_pu", "ext_grid/vm_pu"]
+    for key in injection_keys:
+        table, column = key.split("/")
+        net[table][column] = scenarios[key][k]
+    generation = {key: values[k] for key, values in scenarios.items() if key not in injection_keys + ["total_load"]}
+    apply_active_generation(net, generation, sampling_cfg.active_gen)
+
+
+def clone_net(net: pandapowerNet, tables: list[str] = None) -> pandapowerNet:
+    """Returns a lightweight copy of `net`, where only `tables` and result tables are copied.
+
+    All other entries (std_types, static tables, empty result templates...) are shared with `net`, and should thus
+    not be modified in place. Result tables are copied, because pandapower solvers write into them in place when their
+    index matches the one of the element table.
+    """
+    if tables is None:
+        tables = MUTABLE_TABLES
+    clone = net.__class__.__new__(net.__class__)
+    dict.update(clone, net)
+    clone._setattr('_allow_invalid_attributes', net._allow_invalid_attributes)
+    for key in tables + [key for key in net.keys() if key.startswith("res_")]:
+        clone[key] = net[key].copy()
+    return clone
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Solves the DC-OPF for active power dispatch as a sparse linear program, using SciPy's HiGHS solver."""
+
+import copy
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from pandapower import pandapowerNet
+from pandapower.auxiliary import _init_rundcopp_options
+from pandapower.pd2ppc import _pd2ppc
+from pandapower.pypower.idx_brch import RATE_A
+from pandapower.pypower.makeBdc import makeBdc
+from pandapower.pypower.makePTDF import makePTDF
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix, vstack
+
+from powerdata_gen.utils import SamplingException
+
+KEY_TABLES = ["bus", "line", "trafo", "ext_grid", "gen", "sgen"]
+DISPATCH_TABLES = ["ext_grid", "gen", "sgen"]
+DEFAULT_CONTROLLABLE = {"ext_grid": True, "gen": True, "sgen": False}
+MAX_CACHE_SIZE = 128
+
+_model_cache = OrderedDict()
+
+
+def is_supported(net: pandapowerNet) -> bool:
+    """Checks if the DC-OPF of `net` is a linear program with a single slack, i.e. if all its costs are linear
+    polynomials and it has exactly one in service external grid or slack generator."""
+    n_slack = net.ext_grid.in_service.values.sum() + (net.gen.in_service.values & net.gen.slack.values).sum()
+    return ((net.poly_cost.cp2_eur_per_mw2.values == 0.).all() and ("pwl_cost" not in net or len(net.pwl_cost) == 0)
+            and n_slack == 1)
+
+
+def solve(net: pandapowerNet) -> dict[str, np.ndarray]:
+    """Solves the DC-OPF of `net` with linear costs, and returns the active power of `gen` and `sgen` in *MW*.
+
+    Returned arrays are aligned with the rows of `net.gen` and `net.sgen`, with the same conventions as the results of
+    `pp.rundcopp` : out of service and isolated elements are set to 0, and non controllable elements keep their set
+    point. Raises `SamplingException` if the DC-OPF is infeasible. `net` must be supported, cf. `is_supported`.
+    """
+    model = get_model(net)
+    base_mva = model["base_mva"]
+
+    # Non controllable injections, in MW per internal bus. Fixed generators ignore their scaling, as in pandapower.
+    p_mw = np.zeros(model["n_bus"])
+    for table, column, sign in [("load", "scaling", -1.), ("sgen", "scaling", 1.), ("gen", None, 1.),
+                                ("shunt", "step", -1.)]:
+        mask = net[table].in_service.values.astype(bool)
+        if table in model["variables"]:
+            mask &= ~model["variables"][table]
+        factor = net[table][column].values[mask] if column is not None else 1.
+        np.add.at(p_mw, model["bus_lookup"][net[table].bus.values[mask]], sign * factor * net[table].p_mw.values[mask])
+    p_mw = p_mw[:model["ptdf"].shape[1]]
+    flow_mw = (model["ptdf"] @ (p_mw / base_mva - model["p_bus_inj"]) + model["p_f_inj"]) * base_mva
+
+    # Costs and bounds of dispatchable elements, in the order of `model["variables"]`.
+    costs, bounds = [], []
+    for table, variables in model["variables"].items():
+        poly_cost = net.poly_cost[net.poly_cost.et.values == table]
+        positions = pd.Index(poly_cost.element.values).get_indexer(net[table].index.values[variables])
+        costs.append(np.where(positions >= 0, poly_cost.cp1_eur_per_mw.values[positions], 0.))
+        elements = net[table][variables]
+        min_p_mw = elements.min_p_mw.values if "min_p_mw" in elements else np.full(len(elements), np.nan)
+        max_p_mw = elements.max_p_mw.values if "max_p_mw" in elements else np.full(len(elements), np.nan)
+        bounds.append(np.stack([np.nan_to_num(min_p_mw, nan=-np.inf), np.nan_to_num(max_p_mw, nan=np.inf)], axis=1))
+    bounds = np.concatenate(bounds)
+
+    result = linprog(np.concatenate(costs), A_ub=model["a_ub"],
+                     b_ub=np.concatenate([model["rating_mw"] - flow_mw, model["rating_mw"] + flow_mw]),
+                     A_eq=np.ones([1, len(bounds)]), b_eq=[-p_mw.sum()], bounds=bounds, method="highs")
+    if result.status != 0:
+        raise SamplingException
+
+    dispatch = {table: np.where(net[table].in_service.values.astype(bool), net[table].p_mw.values, 0.)
+                for table in ["gen", "sgen"]}
+    offset = 0
+    for table, variables in model["variables"].items():
+        if table in ["gen", "sgen"]:
+            dispatch[table][model["controllables"][table]] = 0.
+            dispatch[table][variables] = result.x[offset:offset + variables.sum()]
+        offset += variables.sum()
+    return dispatch
+
+
+def get_model(net: pandapowerNet) -> dict:
+    """Returns the linear program structure of the topology of `net`, building it if it is not already cached."""
+    key = tuple((net[table].index.values.tobytes(), net[table].in_service.values.astype(bool).tobytes())
+                for table in KEY_TABLES)
+    key += tuple(net[table].max_loading_percent.values.tobytes() if "max_loading_percent" in net[table] else b""
+                 for table in ["line", "trafo"])
+    key += tuple(controllable(net, table).tobytes() for table in DISPATCH_TABLES)
+    if key in _model_cache:
+        _model_cache.move_to_end(key)
+        return _model_cache[key]
+
+    model = build_model(net)
+    _model_cache[key] = model
+    if len(_model_cache) > MAX_CACHE_SIZE:
+        _model_cache.popitem(last=False)
+    return model
+
+
+def controllable(net: pandapowerNet, table: str) -> np.ndarray:
+    """Returns the mask of the in service elements of `table` that are dispatched by the DC-OPF."""
+    in_service = net[table].in_service.values.astype(bool)
+    if table == "ext_grid" or "controllable" not in net[table]:
+        return in_service & DEFAULT_CONTROLLABLE[table]
+    return in_service & net[table].controllable.fillna(DEFAULT_CONTROLLABLE[table]).values.astype(bool)
+
+
+def build_model(net: pandapowerNet) -> dict:
+    """Builds the PTDF matrix, branch ratings and flow constraints of the DC-OPF of `net`.
+
+    The internal PPC is built by pandapower in OPF mode on a shallow copy of `net`, so that `net` is left untouched.
+    Branches whose rating is 0 or above 1e10 *MVA* are not constrained, as in `pp.rundcopp`.
+    """
+    opf_net = copy.copy(net)
+    _init_rundcopp_options(opf_net, check_connectivity=True, switch_rx_ratio=0.5, delta=1e-10, trafo3w_losses="hv")
+    _, ppci = _pd2ppc(opf_net)
+    base_mva, bus, branch = ppci["baseMVA"], ppci["bus"], ppci["branch"]
+    # The PPC is complex, hence so are the phase shift injections of `makeBdc`, whose imaginary parts are 0.
+    _, _, p_bus_inj, p_f_inj, _ = makeBdc(bus, branch)
+    p_bus_inj, p_f_inj = p_bus_inj.real, p_f_inj.real
+
+    rating_mw = branch[:, RATE_A].real
+    constrained = (rating_mw != 0.) & (rating_mw < 1e10)
+    ptdf = makePTDF(base_mva, bus, branch, using_sparse_solver=True)[constrained]
+    bus_lookup = opf_net._pd2ppc_lookups["bus"].copy()
+
+    # Elements of buses that are isolated from the slack are not dispatched.
+    controllables = {table: controllable(net, table) for table in DISPATCH_TABLES if len(net[table]) > 0}
+    variables = {table: mask & (bus_lookup[net[table].bus.values] < ptdf.shape[1])
+                 for table, mask in controllables.items()}
+    variable_buses = np.concatenate([bus_lookup[net[table].bus.values[mask]] for table, mask in variables.items()])
+    sensitivity = csr_matrix(ptdf[:, variable_buses])
+
+    return {"ptdf": ptdf, "bus_lookup": bus_lookup, "n_bus": bus_lookup.max() + 1, "base_mva": base_mva,
+            "p_bus_inj": p_bus_inj, "p_f_inj": p_f_inj[constrained], "rating_mw": rating_mw[constrained],
+            "controllables": controllables, "variables": variables, "a_ub": vstack([sensitivity, -sensitivity]).tocsr()}
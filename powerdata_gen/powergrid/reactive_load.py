@@ -1,14 +1,24 @@
 # -*- coding: utf-8 -*-
 """Samples reactive loads."""
 
+from typing import Callable
+
 import numpy as np
 from omegaconf import DictConfig
 from pandapower import pandapowerNet
 
+from powerdata_gen.utils import bind
+
 
-def sample_reactive_load(net: pandapowerNet, default_net: pandapowerNet, cfg: DictConfig) -> None:
+def sample_reactive_load(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                         cfg: DictConfig) -> None:
     """Samples reactive loads based on those found in default_net."""
+    compile_reactive_load(cfg)(net, default_net, rng)
+
 
+def compile_reactive_load(cfg: DictConfig) -> Callable:
+    """Returns the reactive load sampling method of `cfg` as a function of (net, default_net, rng), with its parameters
+    validated and bound."""
     function_dict = {
         "constant": sample_constant, "constant_pq_ratio": sample_constant_pq_ratio,
         "uniform_homothetic_factor": sample_uniform_homothetic_factor,
@@ -20,7 +30,8 @@ def sample_reactive_load(net: pandapowerNet, default_net: pandapowerNet, cfg: Di
         "uniform_power_factor": sample_uniform_power_factor}
 
     if cfg.method in function_dict:
-        function_dict[cfg.method](net, default_net, **cfg.params)
+        return bind(function_dict[cfg.method], 3, cfg.get("params"),
+                    "the {} reactive load sampling method".format(cfg.method))
     else:
         raise ValueError(
             "{} is not a valid reactive load sampling method".format(cfg.method) + ", choose from {}".format(
@@ -32,58 +43,60 @@ def sample_constant(*_) -> None:
     pass
 
 
-def sample_constant_pq_ratio(net: pandapowerNet, default_net: pandapowerNet) -> None:
+def sample_constant_pq_ratio(net: pandapowerNet, default_net: pandapowerNet, _) -> None:
     """Modifies the active loads, to have the same P/Q ratio as in the default_net."""
     pq_ratio = default_net.load.p_mw / default_net.load.q_mvar
     net.load.q_mvar = net.load.p_mw / pq_ratio
 
 
-def sample_uniform_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, min_val: float = 1.,
-                                     max_val: float = 1.) -> None:
+def sample_uniform_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                     min_val: float = 1., max_val: float = 1.) -> None:
     """Applies a homothetic transform to default reactive loads, sampled uniformly from U([min_val, max_val])."""
-    factor = np.random.uniform(min_val, max_val)
+    factor = rng.uniform(min_val, max_val)
     net.load.q_mvar = factor * default_net.load.q_mvar
 
 
-def sample_normal_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, mean: float = 1.,
-                                    std: float = 0.) -> None:
+def sample_normal_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                    mean: float = 1., std: float = 0.) -> None:
     """Applies a homothetic transform to default reactive loads, sampled normally from N(mean; std)."""
-    factor = np.random.normal(mean, std)
+    factor = rng.normal(mean, std)
     net.load.q_mvar = factor * default_net.load.q_mvar
 
 
-def sample_uniform_independent_factor(net: pandapowerNet, default_net: pandapowerNet, min_val: float = 1.,
-                                      max_val: float = 1.) -> None:
+def sample_uniform_independent_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                      min_val: float = 1., max_val: float = 1.) -> None:
     """Multiplies reactive loads by independent factors sampled uniformly from U([min_val, max_val])."""
     n_load = len(net.load)
-    factor = np.random.uniform(min_val, max_val, size=n_load)
+    factor = rng.uniform(min_val, max_val, size=n_load)
     net.load.q_mvar = factor * default_net.load.q_mvar
 
 
-def sample_normal_independent_factor(net: pandapowerNet, default_net: pandapowerNet, mean: float = 1.,
-                                     std: float = 0.) -> None:
+def sample_normal_independent_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                     mean: float = 1., std: float = 0.) -> None:
     """Multiplies reactive loads by independent factors sampled normally from N(mean, std)."""
     n_load = len(net.load)
-    factor = np.random.normal(mean, std, size=n_load)
+    factor = rng.normal(mean, std, size=n_load)
     net.load.q_mvar = factor * default_net.load.q_mvar
 
 
-def sample_uniform_independent_values(net: pandapowerNet, _, min_val: float = 1., max_val: float = 1.) -> None:
+def sample_uniform_independent_values(net: pandapowerNet, _, rng: np.random.Generator, min_val: float = 1.,
+                                      max_val: float = 1.) -> None:
     """Samples reactive loads uniformly from U([min_val, max_val])."""
     n_load = len(net.load)
-    values = np.random.uniform(min_val, max_val, size=n_load)
+    values = rng.uniform(min_val, max_val, size=n_load)
     net.load.q_mvar = values
 
 
-def sample_normal_independent_values(net: pandapowerNet, _, mean: float = 1., std: float = 0.) -> None:
+def sample_normal_independent_values(net: pandapowerNet, _, rng: np.random.Generator, mean: float = 1.,
+                                     std: float = 0.) -> None:
     """Samples reactive loads normally from N(mean, std)."""
     n_load = len(net.load)
-    values = np.random.normal(mean, std, size=n_load)
+    values = rng.normal(mean, std, size=n_load)
     net.load.q_mvar = values
 
 
-def sample_uniform_power_factor(net: pandapowerNet, _, pf_min: float = 0.8, pf_max: float = 1.,
-                                flip_prob: float = 0.1) -> None:
+def sample_uniform_power_factor(net: pandapowerNet, _, rng: np.random.Generator, pf_min: float = 0.8,
+                                pf_max: float = 1., flip_prob: float = 0.1) -> None:
     """Samples a uniform power factor, and randomly flips sign.
 
     Follows the strategy exposed in Deep Reinforcement Learning for Electric Transmission Voltage Control
@@ -94,7 +107,96 @@ def sample_uniform_power_factor(net: pandapowerNet, _, pf_min: float = 0.8, pf_m
     Q = sign x P x tan(arccos(power_factor))
     """
     n_load = len(net.load)
-    pf = np.random.uniform(pf_min, pf_max, [n_load])
+    pf = rng.uniform(pf_min, pf_max, [n_load])
     p = net.load.p_mw.values
-    sign = np.random.choice(a=[-1, 1], p=[flip_prob, 1. - flip_prob], size=[n_load])
+    sign = rng.choice(a=[-1, 1], p=[flip_prob, 1. - flip_prob], size=[n_load])
     net.load.q_mvar = sign * p * np.tan(np.arccos(pf))
+
+
+def sample_reactive_load_batch(net: pandapowerNet, default_net: pandapowerNet, p_mw: np.ndarray,
+                               rng: np.random.Generator, cfg: DictConfig) -> np.ndarray:
+    """Samples reactive loads for each row of active loads `p_mw` at once, as an array of shape (n_samples, n_load)."""
+
+    function_dict = {
+        "constant": sample_constant_batch, "constant_pq_ratio": sample_constant_pq_ratio_batch,
+        "uniform_homothetic_factor": sample_uniform_homothetic_factor_batch,
+        "normal_homothetic_factor": sample_normal_homothetic_factor_batch,
+        "uniform_independent_factor": sample_uniform_independent_factor_batch,
+        "normal_independent_factor": sample_normal_independent_factor_batch,
+        "uniform_independent_values": sample_uniform_independent_values_batch,
+        "normal_independent_values": sample_normal_independent_values_batch,
+        "uniform_power_factor": sample_uniform_power_factor_batch}
+
+    if cfg.method in function_dict:
+        return bind(function_dict[cfg.method], 4, cfg.get("params"),
+                    "the {} reactive load sampling method".format(cfg.method))(net, default_net, p_mw, rng)
+    else:
+        raise ValueError(
+            "{} is not a valid reactive load sampling method".format(cfg.method) + ", choose from {}".format(
+                list(function_dict.keys())))
+
+
+def _default_q_mvar(net: pandapowerNet, default_net: pandapowerNet) -> np.ndarray:
+    """Returns the default reactive loads, aligned with the loads of `net`."""
+    return default_net.load.q_mvar.reindex(net.load.index).values
+
+
+def sample_constant_batch(net: pandapowerNet, _, p_mw: np.ndarray, __) -> np.ndarray:
+    """Batched version of `sample_constant`."""
+    return np.tile(net.load.q_mvar.values, (len(p_mw), 1))
+
+
+def sample_constant_pq_ratio_batch(net: pandapowerNet, default_net: pandapowerNet, p_mw: np.ndarray, _) -> np.ndarray:
+    """Batched version of `sample_constant_pq_ratio`."""
+    pq_ratio = default_net.load.p_mw.reindex(net.load.index).values / _default_q_mvar(net, default_net)
+    return p_mw / pq_ratio
+
+
+def sample_uniform_homothetic_factor_batch(net: pandapowerNet, default_net: pandapowerNet, p_mw: np.ndarray,
+                                           rng: np.random.Generator, min_val: float = 1.,
+                                           max_val: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_homothetic_factor`."""
+    factor = rng.uniform(min_val, max_val, size=[len(p_mw), 1])
+    return factor * _default_q_mvar(net, default_net)
+
+
+def sample_normal_homothetic_factor_batch(net: pandapowerNet, default_net: pandapowerNet, p_mw: np.ndarray,
+                                          rng: np.random.Generator, mean: float = 1., std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_homothetic_factor`."""
+    factor = rng.normal(mean, std, size=[len(p_mw), 1])
+    return factor * _default_q_mvar(net, default_net)
+
+
+def sample_uniform_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, p_mw: np.ndarray,
+                                            rng: np.random.Generator, min_val: float = 1.,
+                                            max_val: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_independent_factor`."""
+    factor = rng.uniform(min_val, max_val, size=p_mw.shape)
+    return factor * _default_q_mvar(net, default_net)
+
+
+def sample_normal_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, p_mw: np.ndarray,
+                                           rng: np.random.Generator, mean: float = 1., std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_independent_factor`."""
+    factor = rng.normal(mean, std, size=p_mw.shape)
+    return factor * _default_q_mvar(net, default_net)
+
+
+def sample_uniform_independent_values_batch(_, __, p_mw: np.ndarray, rng: np.random.Generator, min_val: float = 1.,
+                                            max_val: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_independent_values`."""
+    return rng.uniform(min_val, max_val, size=p_mw.shape)
+
+
+def sample_normal_independent_values_batch(_, __, p_mw: np.ndarray, rng: np.random.Generator, mean: float = 1.,
+                                           std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_independent_values`."""
+    return rng.normal(mean, std, size=p_mw.shape)
+
+
+def sample_uniform_power_factor_batch(_, __, p_mw: np.ndarray, rng: np.random.Generator, pf_min: float = 0.8,
+                                      pf_max: float = 1., flip_prob: float = 0.1) -> np.ndarray:
+    """Batched version of `sample_uniform_power_factor`."""
+    pf = rng.uniform(pf_min, pf_max, size=p_mw.shape)
+    sign = rng.choice(a=[-1, 1], p=[flip_prob, 1. - flip_prob], size=p_mw.shape)
+    return sign * p_mw * np.tan(np.arccos(pf))
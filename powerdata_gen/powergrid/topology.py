@@ -1,49 +1,123 @@
 # -*- coding: utf-8 -*-
 """Samples power grid topology."""
 
+import functools
+from typing import Callable
+
 import numpy as np
 from omegaconf import DictConfig
 from pandapower import pandapowerNet
 
+from powerdata_gen.graph import OutageSets, secure_outage_sets
+from powerdata_gen.utils import bind
+
+DEVICE_TABLES = ["gen", "load", "line"]
+
 
-def sample_topology(net: pandapowerNet, cfg: DictConfig) -> None:
+def sample_topology(net: pandapowerNet, rng: np.random.Generator, cfg: DictConfig) -> None:
     """Samples the power grid topology"""
+    compile_topology(net, cfg)(net, rng)
+
+
+def compile_topology(default_net: pandapowerNet, cfg: DictConfig) -> Callable:
+    """Returns the topology sampling method of `cfg` as a function of (net, rng), whose parameters are validated and
+    precomputed for the power grids sampled from `default_net`."""
 
     function_dict = {
-        "constant": apply_constant, "random_disconnection": sample_random_disconnection}
+        "constant": compile_constant, "random_disconnection": compile_random_disconnection}
 
     if cfg.method in function_dict:
-        function_dict[cfg.method](net, **cfg.params)
+        return bind(function_dict[cfg.method], 1, cfg.get("params"),
+                    "the {} topology sampling method".format(cfg.method))(default_net)
     else:
         raise ValueError("{} is not a valid topology sampling method".format(cfg.method) + ", choose from {}".format(
             list(function_dict.keys())))
 
 
+def compile_constant(_) -> Callable:
+    """Returns `apply_constant`."""
+    return apply_constant
+
+
 def apply_constant(*_) -> None:
     """Does nothing."""
     pass
 
 
-def sample_random_disconnection(net: pandapowerNet, gen: DictConfig = None, load: DictConfig = None,
-                                line: DictConfig = None) -> None:
-    """Randomly disconnects generators, loads and lines."""
-    if gen is not None:
-        random_disconnect_devices(net.gen, **gen)
-    if load is not None:
-        random_disconnect_devices(net.load, **load)
-    if line is not None:
-        random_disconnect_devices(net.line, **line)
+def compile_random_disconnection(default_net: pandapowerNet, gen: dict = None, load: dict = None,
+                                 line: dict = None) -> Callable:
+    """Returns `sample_random_disconnection` bound to the disconnection functions of the generators, loads and lines
+    of `default_net`, cf. `eligible_devices`. If `secure` is True in the `line` parameters, lines are disconnected
+    using `secure_lines` instead."""
+    outages = {}
+    for table, params in zip(DEVICE_TABLES, [gen, load, line]):
+        if params is None:
+            continue
+        name = "the random disconnection of {}".format(table)
+        secure = False
+        if table == "line":
+            params = dict(params)
+            secure = params.pop("secure", False)
+        if secure:
+            values, p, outage_sets = bind(secure_lines, 1, params, name)(default_net)
+            outages[table] = functools.partial(random_disconnect_secure_devices, values=values, p=p,
+                                               outage_sets=outage_sets)
+        else:
+            values, p, white_list = bind(eligible_devices, 1, params, name)(len(default_net[table]))
+            outages[table] = functools.partial(random_disconnect_devices, values=values, p=p, white_list=white_list)
+    return functools.partial(sample_random_disconnection, outages=outages)
+
+
+def eligible_devices(n_obj: int, probs: dict, black_list: list = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the possible amounts of disconnected devices, their probabilities, and the positions of the devices
+    that may be disconnected, among `n_obj` devices."""
+    values = np.array([int(v) for v in probs.keys()])
+    p = np.array([p for p in probs.values()], dtype=float)
+    if abs(p.sum() - 1.) > np.sqrt(np.finfo(float).eps):
+        raise ValueError("Disconnection probabilities should sum to 1, got {}".format(p.sum()))
+    white_list = np.setdiff1d(np.arange(n_obj), [] if black_list is None else black_list)
+    if values.max(initial=0) > len(white_list):
+        raise ValueError("Cannot disconnect {} devices out of {} eligible ones".format(values.max(), len(white_list)))
+    return values, p, white_list
 
 
-def random_disconnect_devices(devices: pandapowerNet, probs: DictConfig, black_list: list = None) -> None:
+def secure_lines(default_net: pandapowerNet, probs: dict,
+                 black_list: list = None) -> tuple[np.ndarray, np.ndarray, OutageSets]:
+    """Returns the possible amounts of disconnected lines, their probabilities, and for each amount the sets of
+    positions of the eligible lines of `default_net` whose disconnection does not leave any bus unsupplied, cf.
+    `graph.secure_outage_sets`. Raises a `ValueError` if an amount with a positive probability has no such set."""
+    values, p, white_list = eligible_devices(len(default_net.line), probs, black_list)
+    sets = secure_outage_sets(default_net, white_list, values.max(initial=0))
+    outage_sets = {int(k): sets[k] for k in values}
+    for k, k_p in zip(values, p):
+        if k_p > 0 and len(outage_sets[k]) == 0:
+            raise ValueError("No set of {} eligible lines can be disconnected without leaving buses unsupplied".format(
+                k))
+    return values, p, OutageSets(outage_sets)
+
+
+def sample_random_disconnection(net: pandapowerNet, rng: np.random.Generator, outages: dict) -> None:
+    """Randomly disconnects generators, loads and lines, using the disconnection function of each table of
+    `outages`."""
+    for table, disconnect in outages.items():
+        disconnect(net[table], rng)
+
+
+def random_disconnect_devices(devices: pandapowerNet, rng: np.random.Generator, values: np.ndarray, p: np.ndarray,
+                              white_list: np.ndarray) -> None:
     """Randomly disconnect devices."""
-    values = [int(v) for v in probs.keys()]
-    p = [p for p in probs.values()]
-    n_disconnect = np.random.choice(values, p=p)
-    n_obj = len(devices)
-    if black_list is None:
-        black_list = []
-    white_list = [i for i in range(n_obj) if i not in black_list]
-    disconnected_objects = np.random.choice(white_list, size=n_disconnect, replace=False)
+    n_disconnect = rng.choice(values, p=p)
+    disconnected_objects = rng.choice(white_list, size=n_disconnect, replace=False)
+    devices.reset_index(inplace=True)
+    devices.drop(disconnected_objects, inplace=True)
+
+
+def random_disconnect_secure_devices(devices: pandapowerNet, rng: np.random.Generator, values: np.ndarray,
+                                     p: np.ndarray, outage_sets: OutageSets) -> None:
+    """Randomly disconnect devices, drawing the amount of devices from `values` with the probabilities `p`, and the
+    disconnected devices uniformly among the `outage_sets` of this amount."""
+    n_disconnect = rng.choice(values, p=p)
+    sets = outage_sets[int(n_disconnect)]
+    disconnected_objects = sets[rng.integers(len(sets))]
     devices.reset_index(inplace=True)
     devices.drop(disconnected_objects, inplace=True)
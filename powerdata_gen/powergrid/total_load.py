@@ -1,47 +1,106 @@
 # -*- coding: utf-8 -*-
 """Samples total active load."""
 
+from typing import Callable
+
 import numpy as np
 from omegaconf import DictConfig
 from pandapower import pandapowerNet
 
+from powerdata_gen.utils import bind
+
 
-def sample_total_load(net: pandapowerNet, cfg: DictConfig) -> float:
+def sample_total_load(net: pandapowerNet, rng: np.random.Generator, cfg: DictConfig) -> float:
     """Samples a new value for the total load."""
+    return compile_total_load(cfg)(net, rng)
+
 
+def compile_total_load(cfg: DictConfig) -> Callable:
+    """Returns the total load sampling method of `cfg` as a function of (net, rng), with its parameters validated and
+    bound."""
     function_dict = {
         "constant": sample_constant, "uniform_factor": sample_uniform_factor, "normal_factor": sample_normal_factor,
         "uniform_values": sample_uniform_values, "normal_values": sample_normal_values}
 
     if cfg.method in function_dict:
-        return function_dict[cfg.method](net, **cfg.params)
+        return bind(function_dict[cfg.method], 2, cfg.get("params"),
+                    "the {} total load sampling method".format(cfg.method))
     else:
         raise ValueError("{} is not a valid total load sampling method".format(cfg.method) + ", choose from {}".format(
             list(function_dict.keys())))
 
 
-def sample_constant(net: pandapowerNet) -> float:
+def sample_constant(net: pandapowerNet, _) -> float:
     """Returns the initial total load."""
     return (net.load.p_mw * net.load.in_service).sum()
 
 
-def sample_uniform_factor(net: pandapowerNet, min_val: float = 1., max_val: float = 1.) -> float:
+def sample_uniform_factor(net: pandapowerNet, rng: np.random.Generator, min_val: float = 1.,
+                          max_val: float = 1.) -> float:
     """Returns the initial total load multiplied by a factor sampled uniformly."""
     default_total_load = (net.load.p_mw * net.load.in_service).sum()
-    return default_total_load * np.random.uniform(min_val, max_val)
+    return default_total_load * rng.uniform(min_val, max_val)
 
 
-def sample_normal_factor(net: pandapowerNet, mean: float = 1., std: float = 0.) -> float:
+def sample_normal_factor(net: pandapowerNet, rng: np.random.Generator, mean: float = 1., std: float = 0.) -> float:
     """Returns the initial total load multiplied by a factor sampled from a Normal distribution."""
     default_total_load = (net.load.p_mw * net.load.in_service).sum()
-    return default_total_load * np.random.normal(mean, std)
+    return default_total_load * rng.normal(mean, std)
 
 
-def sample_uniform_values(_, min_val: float = 1., max_val: float = 1.) -> float:
+def sample_uniform_values(_, rng: np.random.Generator, min_val: float = 1., max_val: float = 1.) -> float:
     """Returns a uniformly sampled total load."""
-    return np.random.uniform(min_val, max_val)
+    return rng.uniform(min_val, max_val)
 
 
-def sample_normal_values(_, mean: float = 1., std: float = 0.) -> float:
+def sample_normal_values(_, rng: np.random.Generator, mean: float = 1., std: float = 0.) -> float:
     """Ret a total load from a Normal distribution."""
-    return np.random.normal(mean, std)
+    return rng.normal(mean, std)
+
+
+def sample_total_load_batch(net: pandapowerNet, rng: np.random.Generator, cfg: DictConfig,
+                            n_samples: int) -> np.ndarray:
+    """Samples `n_samples` values for the total load at once, as an array of shape (n_samples,)."""
+
+    function_dict = {
+        "constant": sample_constant_batch, "uniform_factor": sample_uniform_factor_batch,
+        "normal_factor": sample_normal_factor_batch, "uniform_values": sample_uniform_values_batch,
+        "normal_values": sample_normal_values_batch}
+
+    if cfg.method in function_dict:
+        return bind(function_dict[cfg.method], 3, cfg.get("params"),
+                    "the {} total load sampling method".format(cfg.method))(net, rng, n_samples)
+    else:
+        raise ValueError("{} is not a valid total load sampling method".format(cfg.method) + ", choose from {}".format(
+            list(function_dict.keys())))
+
+
+def sample_constant_batch(net: pandapowerNet, _, n_samples: int) -> np.ndarray:
+    """Batched version of `sample_constant`."""
+    return np.full(n_samples, (net.load.p_mw * net.load.in_service).sum())
+
+
+def sample_uniform_factor_batch(net: pandapowerNet, rng: np.random.Generator, n_samples: int, min_val: float = 1.,
+                                max_val: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_factor`."""
+    default_total_load = (net.load.p_mw * net.load.in_service).sum()
+    return default_total_load * rng.uniform(min_val, max_val, size=n_samples)
+
+
+def sample_normal_factor_batch(net: pandapowerNet, rng: np.random.Generator, n_samples: int, mean: float = 1.,
+                               std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_factor`."""
+    default_total_load = (net.load.p_mw * net.load.in_service).sum()
+    return default_total_load * rng.normal(mean, std, size=n_samples)
+
+
+def sample_uniform_values_batch(_, rng: np.random.Generator, n_samples: int, min_val: float = 1.,
+                                max_val: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_values`."""
+    return rng.uniform(min_val, max_val, size=n_samples)
+
+
+def sample_normal_values_batch(_, rng: np.random.Generator, n_samples: int, mean: float = 1.,
+                               std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_values`."""
+    return rng.normal(mean, std, size=n_samples)
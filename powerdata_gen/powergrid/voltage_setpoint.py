@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 """Samples voltage set points."""
 
+from typing import Callable
+
 import numpy as np
 from omegaconf import DictConfig
 from pandapower import pandapowerNet
 
+from powerdata_gen.utils import bind
+
 
-def sample_voltage_setpoint(net: pandapowerNet, default_net: pandapowerNet, cfg: DictConfig) -> None:
+def sample_voltage_setpoint(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                            cfg: DictConfig) -> None:
     """Samples voltage set points based on those found in default_net."""
+    compile_voltage_setpoint(cfg)(net, default_net, rng)
+
+
+def compile_voltage_setpoint(cfg: DictConfig) -> Callable:
+    """Returns the voltage setpoint sampling method of `cfg` as a function of (net, default_net, rng), with its
+    parameters validated and bound."""
     function_dict = {
         "constant": apply_constant, "uniform_homothetic_factor": sample_uniform_homothetic_factor,
         "normal_homothetic_factor": sample_normal_homothetic_factor,
@@ -16,10 +27,9 @@ def sample_voltage_setpoint(net: pandapowerNet, default_net: pandapowerNet, cfg:
         "uniform_independent_values": sample_uniform_independent_values,
         "normal_independent_values": sample_normal_independent_values}
 
-    if (cfg.method in function_dict) and ('params' in cfg):
-        function_dict[cfg.method](net, default_net, **cfg.params)
-    elif (cfg.method in function_dict) and ('params' not in cfg):
-        function_dict[cfg.method](net, default_net)
+    if cfg.method in function_dict:
+        return bind(function_dict[cfg.method], 3, cfg.get("params"),
+                    "the {} voltage setpoint sampling method".format(cfg.method))
     else:
         raise ValueError(
             "{} is not a valid voltage setpoint sampling method".format(cfg.method) + ", choose from {}".format(
@@ -31,51 +41,126 @@ def apply_constant(*_) -> None:
     pass
 
 
-def sample_uniform_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, min_val: float = 0.,
-                                     max_val: float = 1.) -> None:
+def sample_uniform_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                     min_val: float = 0., max_val: float = 1.) -> None:
     """Homothetically multiplies default voltage set points by a factor sampled from U([min_val, max_val])."""
-    factor = np.random.uniform(min_val, max_val)
+    factor = rng.uniform(min_val, max_val)
     net.gen.vm_pu = factor * default_net.gen.vm_pu
     net.ext_grid.vm_pu = factor * default_net.ext_grid.vm_pu
 
 
-def sample_normal_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, mean: float = 1.,
-                                    std: float = 0.) -> None:
+def sample_normal_homothetic_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                    mean: float = 1., std: float = 0.) -> None:
     """Homothetically multiplies default voltage set points by a factor sampled from N(mean; std)."""
-    factor = np.random.normal(mean, std)
+    factor = rng.normal(mean, std)
     net.gen.vm_pu = factor * default_net.gen.vm_pu
     net.ext_grid.vm_pu = factor * default_net.ext_grid.vm_pu
 
 
-def sample_uniform_independent_factor(net: pandapowerNet, default_net: pandapowerNet, min_val: float = 0.,
-                                      max_val: float = 1.) -> None:
+def sample_uniform_independent_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                      min_val: float = 0., max_val: float = 1.) -> None:
     """Independently multiplies default voltage set points by factors sampled uniformly from U([min_val, max_val])."""
     n_gen, n_ext_grid = len(net.gen), len(net.ext_grid)
-    factor = np.random.uniform(min_val, max_val, size=n_gen + n_ext_grid)
+    factor = rng.uniform(min_val, max_val, size=n_gen + n_ext_grid)
     net.gen.vm_pu = factor[:n_gen] * default_net.gen.vm_pu
     net.ext_grid.vm_pu = factor[n_gen:] * default_net.ext_grid.vm_pu
 
 
-def sample_normal_independent_factor(net: pandapowerNet, default_net: pandapowerNet, mean: float = 1.,
-                                     std: float = 0.) -> None:
+def sample_normal_independent_factor(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                     mean: float = 1., std: float = 0.) -> None:
     """Independently multiplies default voltage set points by factors sampled normally from N(mean; std)."""
     n_gen, n_ext_grid = len(net.gen), len(net.ext_grid)
-    factor = np.random.normal(mean, std, size=n_gen + n_ext_grid)
+    factor = rng.normal(mean, std, size=n_gen + n_ext_grid)
     net.gen.vm_pu = factor[:n_gen] * default_net.gen.vm_pu
     net.ext_grid.vm_pu = factor[n_gen:] * default_net.ext_grid.vm_pu
 
 
-def sample_uniform_independent_values(net: pandapowerNet, _, min_val: float = 0.9, max_val: float = 1.1) -> None:
+def sample_uniform_independent_values(net: pandapowerNet, _, rng: np.random.Generator, min_val: float = 0.9,
+                                      max_val: float = 1.1) -> None:
     """Samples voltage set points uniformly from U([min_val, max_val]), expressed in p.u.."""
     n_gen, n_ext_grid = len(net.gen), len(net.ext_grid)
-    values = np.random.uniform(min_val, max_val, size=n_gen + n_ext_grid)
+    values = rng.uniform(min_val, max_val, size=n_gen + n_ext_grid)
     net.gen.vm_pu = values[:n_gen]
     net.ext_grid.vm_pu = values[n_gen:]
 
 
-def sample_normal_independent_values(net: pandapowerNet, _, mean: float = 1., std: float = 0.1) -> None:
+def sample_normal_independent_values(net: pandapowerNet, _, rng: np.random.Generator, mean: float = 1.,
+                                     std: float = 0.1) -> None:
     """Samples voltage set points normally from N(mean; std), expressed in p.u.."""
     n_gen, n_ext_grid = len(net.gen), len(net.ext_grid)
-    values = np.random.normal(mean, std, size=n_gen + n_ext_grid)
+    values = rng.normal(mean, std, size=n_gen + n_ext_grid)
     net.gen.vm_pu = values[:n_gen]
     net.ext_grid.vm_pu = values[n_gen:]
+
+
+def sample_voltage_setpoint_batch(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                  cfg: DictConfig, n_samples: int) -> np.ndarray:
+    """Samples `n_samples` voltage set points at once, as an array of shape (n_samples, n_gen + n_ext_grid)."""
+    function_dict = {
+        "constant": apply_constant_batch, "uniform_homothetic_factor": sample_uniform_homothetic_factor_batch,
+        "normal_homothetic_factor": sample_normal_homothetic_factor_batch,
+        "uniform_independent_factor": sample_uniform_independent_factor_batch,
+        "normal_independent_factor": sample_normal_independent_factor_batch,
+        "uniform_independent_values": sample_uniform_independent_values_batch,
+        "normal_independent_values": sample_normal_independent_values_batch}
+
+    if (cfg.method in function_dict) and ('params' in cfg):
+        return bind(function_dict[cfg.method], 4, cfg.get("params"),
+                    "the {} voltage setpoint sampling method".format(cfg.method))(net, default_net, rng, n_samples)
+    elif (cfg.method in function_dict) and ('params' not in cfg):
+        return function_dict[cfg.method](net, default_net, rng, n_samples)
+    else:
+        raise ValueError(
+            "{} is not a valid voltage setpoint sampling method".format(cfg.method) + ", choose from {}".format(
+                list(function_dict.keys())))
+
+
+def _default_vm_pu(net: pandapowerNet, default_net: pandapowerNet) -> np.ndarray:
+    """Returns the default voltage set points of generators and external grids, aligned with those of `net`."""
+    return np.concatenate([default_net.gen.vm_pu.reindex(net.gen.index).values,
+                           default_net.ext_grid.vm_pu.reindex(net.ext_grid.index).values])
+
+
+def apply_constant_batch(net: pandapowerNet, _, __, n_samples: int) -> np.ndarray:
+    """Batched version of `apply_constant`."""
+    return np.tile(np.concatenate([net.gen.vm_pu.values, net.ext_grid.vm_pu.values]), (n_samples, 1))
+
+
+def sample_uniform_homothetic_factor_batch(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                           n_samples: int, min_val: float = 0., max_val: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_homothetic_factor`."""
+    factor = rng.uniform(min_val, max_val, size=[n_samples, 1])
+    return factor * _default_vm_pu(net, default_net)
+
+
+def sample_normal_homothetic_factor_batch(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                          n_samples: int, mean: float = 1., std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_homothetic_factor`."""
+    factor = rng.normal(mean, std, size=[n_samples, 1])
+    return factor * _default_vm_pu(net, default_net)
+
+
+def sample_uniform_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                            n_samples: int, min_val: float = 0., max_val: float = 1.) -> np.ndarray:
+    """Batched version of `sample_uniform_independent_factor`."""
+    factor = rng.uniform(min_val, max_val, size=[n_samples, len(net.gen) + len(net.ext_grid)])
+    return factor * _default_vm_pu(net, default_net)
+
+
+def sample_normal_independent_factor_batch(net: pandapowerNet, default_net: pandapowerNet, rng: np.random.Generator,
+                                           n_samples: int, mean: float = 1., std: float = 0.) -> np.ndarray:
+    """Batched version of `sample_normal_independent_factor`."""
+    factor = rng.normal(mean, std, size=[n_samples, len(net.gen) + len(net.ext_grid)])
+    return factor * _default_vm_pu(net, default_net)
+
+
+def sample_uniform_independent_values_batch(net: pandapowerNet, _, rng: np.random.Generator, n_samples: int,
+                                            min_val: float = 0.9, max_val: float = 1.1) -> np.ndarray:
+    """Batched version of `sample_uniform_independent_values`."""
+    return rng.uniform(min_val, max_val, size=[n_samples, len(net.gen) + len(net.ext_grid)])
+
+
+def sample_normal_independent_values_batch(net: pandapowerNet, _, rng: np.random.Generator, n_samples: int,
+                                           mean: float = 1., std: float = 0.1) -> np.ndarray:
+    """Batched version of `sample_normal_independent_values`."""
+    return rng.normal(mean, std, size=[n_samples, len(net.gen) + len(net.ext_grid)])
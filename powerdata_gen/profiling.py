@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""Records the time spent in each stage of the sampling pipeline."""
+
+import contextlib
+import cProfile
+import csv
+import heapq
+import json
+import marshal
+import os
+import time
+
+import numpy as np
+
+STAGES = ["clone", "topology", "total_load", "active_load", "reactive_load", "active_gen", "voltage_setpoint",
+          "dc_screening", "power_flow", "recovery", "filtering", "sample", "storage", "rejected_storage"]
+OUTCOMES = ["accepted", "sampling_error", "divergence", "filtering", "timeout", "thinned"]
+HISTOGRAM_EDGES = np.logspace(-6, 3, 37)  # In seconds, 4 bins per decade.
+
+
+class SampleProfile:
+    """Wall time of the stages and CPU time of the outcomes of all attempts of a single sample.
+
+    If `cprofile` is True, the whole sample is also profiled with cProfile, whose statistics are kept in `stats`
+    once `stop` is called. Profiles are picklable once stopped, so that they can be sent back by worker processes.
+    The clocks of samples that are built together can be suspended while other samples are worked on.
+    """
+
+    def __init__(self, cprofile: bool = False):
+        self.durations = []
+        self.attempts = []
+        self.wall_time = 0.
+        self.stats = None
+        self._profile = cProfile.Profile() if cprofile else None
+        self._start = self._attempt_start = self._suspended = None
+
+    def start(self) -> None:
+        """Starts timing the sample."""
+        self._start = self._attempt_start = time.perf_counter(), time.process_time()
+        if self._profile is not None:
+            self._profile.enable()
+
+    def suspend(self) -> None:
+        """Stops the clocks of the sample while other samples are worked on, until `resume` is called."""
+        self._suspended = time.perf_counter(), time.process_time()
+        if self._profile is not None:
+            self._profile.disable()
+
+    def resume(self) -> None:
+        """Restarts the clocks of the sample, leaving out the time elapsed since `suspend`."""
+        now = time.perf_counter(), time.process_time()
+        elapsed = now[0] - self._suspended[0], now[1] - self._suspended[1]
+        self._start = self._start[0] + elapsed[0], self._start[1] + elapsed[1]
+        self._attempt_start = self._attempt_start[0] + elapsed[0], self._attempt_start[1] + elapsed[1]
+        if self._profile is not None:
+            self._profile.enable()
+
+    @contextlib.contextmanager
+    def running(self):
+        """Runs the clocks of a suspended sample during the enclosed block."""
+        self.resume()
+        try:
+            yield
+        finally:
+            self.suspend()
+
+    def stop(self) -> None:
+        """Stops timing the sample, and collects the cProfile statistics."""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.create_stats()
+            self.stats = self._profile.stats
+            self._profile = None
+        self.wall_time = time.perf_counter() - self._start[0]
+        self.durations.append(("sample", self.wall_time))
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Times the wall time of the enclosed block as the stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations.append((name, time.perf_counter() - start))
+
+    def record(self, stage: str, duration: float) -> None:
+        """Records `duration` seconds of the stage `stage`, e.g. the share of the sample in work done for several
+        samples while its clocks were suspended. It is not counted in the time of its attempts."""
+        self.durations.append((stage, duration))
+
+    def end_attempt(self, outcome: str, newton_iterations: int = None) -> None:
+        """Records the outcome of the current attempt, the time spent since the previous one, and the amount of
+        Newton-Raphson iterations of its power flow if one was run."""
+        now = time.perf_counter(), time.process_time()
+        self.attempts.append((outcome, now[1] - self._attempt_start[1], now[0] - self._attempt_start[0],
+                              newton_iterations))
+        self._attempt_start = now
+
+
+def running(profile: SampleProfile):
+    """Returns a context that runs the clocks of the suspended `profile`, or does nothing if `profile` is None."""
+    if profile is None:
+        return contextlib.nullcontext()
+    return profile.running()
+
+
+def timed(profile, stage: str, watchdog=None):
+    """Returns a context that times `stage` into `profile`, a `SampleProfile` or a `PipelineProfiler`, or does
+    nothing if `profile` is None. If a `watchdog.Watchdog` is provided, `stage` is also bounded by its budget."""
+    if watchdog is None:
+        return contextlib.nullcontext() if profile is None else profile.stage(stage)
+    stack = contextlib.ExitStack()
+    stack.enter_context(watchdog.stage(stage))
+    if profile is not None:
+        stack.enter_context(profile.stage(stage))
+    return stack
+
+
+class PipelineProfiler:
+    """Aggregates the profiles of the samples of a dataset into histograms, and writes them as a report.
+
+    The cProfile statistics of the `n_slowest` samples are kept, and dumped along with the report.
+    """
+
+    def __init__(self, n_slowest: int = 0):
+        self.n_slowest = n_slowest
+        self.histograms = {}
+        self.stages = {}
+        self.outcomes = {outcome: {"count": 0, "cpu_s": 0., "wall_s": 0., "newton_iterations": {}}
+                         for outcome in OUTCOMES}
+        self.slowest = []
+
+    def record(self, stage: str, duration: float) -> None:
+        """Records a single duration of `stage`, in seconds."""
+        if stage not in self.stages:
+            self.stages[stage] = {"count": 0, "total_s": 0., "max_s": 0.}
+            self.histograms[stage] = np.zeros(len(HISTOGRAM_EDGES) + 1, dtype=int)
+        self.stages[stage]["count"] += 1
+        self.stages[stage]["total_s"] += duration
+        self.stages[stage]["max_s"] = max(self.stages[stage]["max_s"], duration)
+        self.histograms[stage][np.searchsorted(HISTOGRAM_EDGES, duration)] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Times the wall time of the enclosed block as the stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def add(self, index: int, profile: SampleProfile) -> None:
+        """Adds the profile of the sample `index`."""
+        for stage, duration in profile.durations:
+            self.record(stage, duration)
+        for outcome, cpu_time, wall_time, newton_iterations in profile.attempts:
+            self.outcomes[outcome]["count"] += 1
+            self.outcomes[outcome]["cpu_s"] += cpu_time
+            self.outcomes[outcome]["wall_s"] += wall_time
+            if newton_iterations is not None:
+                histogram = self.outcomes[outcome]["newton_iterations"]
+                histogram[newton_iterations] = histogram.get(newton_iterations, 0) + 1
+        if profile.stats is not None and self.n_slowest > 0:
+            item = (profile.wall_time, index, profile.stats)
+            if len(self.slowest) < self.n_slowest:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def report(self) -> dict:
+        """Returns the aggregated statistics as plain Python containers."""
+        stages = {}
+        for stage in sorted(self.stages, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            stats = self.stages[stage]
+            stages[stage] = {"count": stats["count"], "total_s": stats["total_s"],
+                             "mean_ms": 1e3 * stats["total_s"] / stats["count"], "max_ms": 1e3 * stats["max_s"],
+                             "histogram": self.histograms[stage].tolist()}
+        outcomes = {outcome: dict(stats, newton_iterations={str(k): v for k, v in
+                                                            sorted(stats["newton_iterations"].items())})
+                    for outcome, stats in self.outcomes.items()}
+        return {"histogram_edges_s": HISTOGRAM_EDGES.tolist(), "stages": stages, "outcomes": outcomes,
+                "slowest": [{"index": index, "wall_s": wall_time}
+                            for wall_time, index, _ in sorted(self.slowest, reverse=True)]}
+
+    def save(self, path: str) -> None:
+        """Writes `report.json`, `stages.csv`, `outcomes.csv` and the cProfile dumps of the slowest samples, named
+        `slowest_<rank>_sample_<index>.prof`, into `path`. Dumps can be read with `pstats.Stats`."""
+        os.makedirs(path, exist_ok=True)
+        report = self.report()
+        with open(os.path.join(path, "report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(path, "stages.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stage", "count", "total_s", "mean_ms", "max_ms"])
+            for stage, stats in report["stages"].items():
+                writer.writerow([stage, stats["count"], stats["total_s"], stats["mean_ms"], stats["max_ms"]])
+        with open(os.path.join(path, "outcomes.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["outcome", "count", "cpu_s", "wall_s", "newton_iterations"])
+            for outcome, stats in report["outcomes"].items():
+                n_iterations = sum(int(k) * v for k, v in stats["newton_iterations"].items())
+                writer.writerow([outcome, stats["count"], stats["cpu_s"], stats["wall_s"], n_iterations])
+        for rank, (_, index, stats) in enumerate(sorted(self.slowest, reverse=True)):
+            with open(os.path.join(path, "slowest_{}_sample_{}.prof".format(rank, index)), "wb") as f:
+                marshal.dump(stats, f)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Adapts the proposal of sampling attempts to the acceptance rates of their outage sets and total load bins."""
+
+import numpy as np
+from pandapower import pandapowerNet
+
+from powerdata_gen.powergrid.topology import DEVICE_TABLES
+from powerdata_gen.storage import original_index
+from powerdata_gen.utils import get_rng
+
+
+class Thinned(Exception):
+    """Raised when an attempt is thinned out by the adaptive proposal, before its expensive steps."""
+    pass
+
+
+class AdaptiveProposal:
+    """Acceptance statistics of the sampling attempts per outage set and per total load bin, from which the keep
+    probabilities of the attempts of later samples are derived, cf. `ProposalTable`.
+
+    Samples are proposed by epochs of `epoch` consecutive indices, whose keep probabilities only depend on the
+    statistics of the samples of previous epochs, so that samples only depend on the seed and their index. The keep
+    probability of an outage set or of a load bin (of width `load_bin_width`, as a factor of the total load of the
+    default power grid) is its acceptance rate divided by the overall one, capped at 1, once it has `min_attempts`
+    completed attempts, and 1 before. It is floored at `min_keep_prob` : with the default of 0, the outage sets and
+    load bins that were never accepted are not completed anymore.
+    """
+
+    def __init__(self, epoch: int = 1000, load_bin_width: float = 0.05, min_attempts: int = 20,
+                 min_keep_prob: float = 0.):
+        if epoch <= 0 or load_bin_width <= 0:
+            raise ValueError("The epoch and load_bin_width should be positive, got {} and {}".format(
+                epoch, load_bin_width))
+        if not 0 <= min_keep_prob <= 1:
+            raise ValueError("min_keep_prob should be in [0, 1], got {}".format(min_keep_prob))
+        self.epoch = epoch
+        self.load_bin_width = load_bin_width
+        self.min_attempts = min_attempts
+        self.min_keep_prob = min_keep_prob
+        # Completed and accepted attempts, per outage set and per load bin.
+        self.outages = {}
+        self.load_bins = {}
+        # Records of the samples that are not counted yet, as they may belong to the current epoch.
+        self.pending = []
+
+    def update(self, record: dict) -> None:
+        """Adds the record of a sample, cf. `ProposalTable.record`."""
+        self.pending.append(record)
+
+    def table(self, default_net: pandapowerNet, seed: int, epoch_start: int) -> "ProposalTable":
+        """Returns the keep probabilities of the epoch starting at the sample `epoch_start`, from the statistics of
+        all the samples before it."""
+        pending = []
+        for record in self.pending:
+            if record["key"][1] >= epoch_start:
+                pending.append(record)
+                continue
+            for outages, load_bin, accepted in record["attempts"]:
+                for stats, key in [(self.outages, tuple(tuple(labels) for labels in outages)),
+                                   (self.load_bins, load_bin)]:
+                    if key is not None:
+                        n_attempts, n_accepted = stats.get(key, (0, 0))
+                        stats[key] = n_attempts + 1, n_accepted + int(accepted)
+        self.pending = pending
+
+        n_attempts = sum(n for n, _ in self.outages.values())
+        rate = sum(k for _, k in self.outages.values()) / max(n_attempts, 1)
+        outages, load_bins = [{key: p for key, (n, k) in stats.items() if (p := self.keep_prob(n, k, rate)) < 1.}
+                              for stats in [self.outages, self.load_bins]]
+        return ProposalTable(default_net, seed, outages, load_bins, self.load_bin_width)
+
+    def keep_prob(self, n_attempts: int, n_accepted: int, rate: float) -> float:
+        """Returns the keep probability of an outage set or load bin, given its statistics and the overall acceptance
+        rate."""
+        if n_attempts < self.min_attempts or rate == 0.:
+            return 1.
+        return max(self.min_keep_prob, min(1., n_accepted / n_attempts / rate))
+
+
+class ProposalTable:
+    """Keep probabilities of the outage sets and total load bins of an epoch of samples, cf. `AdaptiveProposal`.
+
+    An attempt is only completed with the keep probability of its outage set, checked right after its topology is
+    drawn, times the one of its total load bin, checked right before its power flow. Otherwise, `Thinned` is raised.
+    Thinning draws come from their own random stream, so that completed attempts are the same as without thinning.
+    Accepted samples are weighted by the inverse of their keep probability, so that the weighted accepted samples
+    follow the same distribution as without thinning, except for the outage sets and load bins that are not kept.
+    """
+
+    def __init__(self, default_net: pandapowerNet, seed: int, outages: dict, load_bins: dict, load_bin_width: float):
+        self.labels = {table: default_net[table].index.values for table in DEVICE_TABLES}
+        self.default_load = total_load(default_net)
+        self.seed = seed
+        self.outages = outages
+        self.load_bins = load_bins
+        self.load_bin_width = load_bin_width
+
+    def propose(self, key: tuple) -> dict:
+        """Returns the proposal state of the attempt `key`, along with its own random stream."""
+        return {"rng": get_rng(self.seed, *key, 1), "outages": None, "load_bin": None, "keep_prob": 1.}
+
+    def thin_topology(self, state: dict, net: pandapowerNet) -> None:
+        """Thins out the attempt of `state` according to the outage set of `net`, whose topology is sampled."""
+        state["outages"] = outage_set(net, self.labels)
+        self._thin(state, self.outages.get(state["outages"], 1.))
+
+    def thin_load(self, state: dict, net: pandapowerNet) -> None:
+        """Thins out the attempt of `state` according to the total load bin of `net`, whose injections are sampled."""
+        state["load_bin"] = int(np.floor(total_load(net) / self.default_load / self.load_bin_width))
+        self._thin(state, self.load_bins.get(state["load_bin"], 1.))
+
+    @staticmethod
+    def _thin(state: dict, keep_prob: float) -> None:
+        """Raises `Thinned` with probability 1 - `keep_prob`, and updates the keep probability of the attempt."""
+        if state["rng"].random() >= keep_prob:
+            raise Thinned
+        state["keep_prob"] *= keep_prob
+
+    @staticmethod
+    def record(key: tuple, state: dict, attempts: list) -> dict:
+        """Returns the record of the sample accepted at the attempt `key` with `state`, along with the
+        (outage set, load bin, accepted) triplets of its completed `attempts`."""
+        return {"key": [int(k) for k in key], "weight": 1. / state["keep_prob"],
+                "attempts": [[[list(labels) for labels in outages], load_bin, accepted]
+                             for outages, load_bin, accepted in attempts]}
+
+
+def outage_set(net: pandapowerNet, labels: dict) -> tuple:
+    """Returns the labels of the generators, loads and lines of the default power grid, whose labels per table are
+    `labels`, that are removed or out of service in `net`."""
+    outages = []
+    for table in DEVICE_TABLES:
+        in_service = original_index(net[table])[net[table].in_service.values.astype(bool)]
+        outages.append(tuple(int(label) for label in np.setdiff1d(labels[table], in_service)))
+    return tuple(outages)
+
+
+def total_load(net: pandapowerNet) -> float:
+    """Returns the total active power of the in service loads of `net`, in *MW*."""
+    return float(net.load.p_mw.values[net.load.in_service.values.astype(bool)].sum())
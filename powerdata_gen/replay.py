@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Regenerates rejected attempts from their records, cf. the `seed` format of rejected samples."""
+
+import pandapower as pp
+from omegaconf import DictConfig, OmegaConf
+from pandapower import pandapowerNet
+
+from powerdata_gen.dataset import compile_filtering, filter_sample
+from powerdata_gen.powerflow import compile_powerflow, compile_recovery, recover_power_flow, run_power_flow
+from powerdata_gen.powergrid.core import sample_power_grid
+from powerdata_gen.storage import (RECOVERY_RECORDS_FILE, REJECT_RECORDS_FILE, TIMEOUT_RECORDS_FILE, load_manifest,
+                                   load_reject_records)
+from powerdata_gen.utils import get_rng
+
+
+def replay_attempt(default_net: pandapowerNet, sampling_cfg: DictConfig, powerflow_cfg: DictConfig | dict,
+                   filtering_cfg: DictConfig | dict, seed: int, key: tuple) -> tuple[pandapowerNet, str, dict]:
+    """Regenerates the attempt of the random stream keyed by `key` = (dataset_id, index, attempt), and returns its
+    power grid, its outcome (`divergence`, `rejection` or `accepted`) and its filtering info.
+
+    The power grid is sampled exactly as when the dataset was built. Its power flow is solved without the `solver`
+    options, hence results only match up to the power flow tolerance if the solver cache or warm start was used, and
+    attempts rejected by the DC screening are solved as well. Power flows that do not converge go through the
+    `recovery` chain of `powerflow_cfg`. Raises `SamplingException` for sampling errors.
+    """
+    net = sample_power_grid(default_net, sampling_cfg, get_rng(seed, *key))
+    try:
+        run_power_flow(net, compile_powerflow(powerflow_cfg))
+    except pp.powerflow.LoadflowNotConverged:
+        if recover_power_flow(net, compile_powerflow(powerflow_cfg), compile_recovery(powerflow_cfg)) is None:
+            return net, "divergence", {}
+    reject, info = filter_sample(net, **compile_filtering(filtering_cfg))
+    return net, "rejection" if reject else "accepted", info
+
+
+def replay_record(path: str, default_net: pandapowerNet, index: int, attempt: int) -> tuple:
+    """Regenerates the recorded attempt `attempt` of the sample `index` of the dataset stored in `path`, using the
+    seed and configuration of its manifest. Returns the result of `replay_attempt`, followed by the record.
+    Timed out attempts are replayed without time budget.
+
+    Raises a `ValueError` if the dataset has no manifest, or no record of this attempt.
+    """
+    manifest = load_manifest(path)
+    if manifest is None:
+        raise ValueError("{} has no manifest".format(path))
+    records = [record for file_name in [REJECT_RECORDS_FILE, TIMEOUT_RECORDS_FILE, RECOVERY_RECORDS_FILE]
+               for record in load_reject_records(path, file_name) if record["key"][1:] == [index, attempt]]
+    if not records:
+        raise ValueError("{} has no record of the attempt {} of the sample {}".format(path, attempt, index))
+    config = manifest["config"]
+    net, outcome, info = replay_attempt(default_net, OmegaConf.create(config["sampling"]), config["powerflow"],
+                                        config["filtering"], manifest["seed"], records[0]["key"])
+    return net, outcome, info, records[0]
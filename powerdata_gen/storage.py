@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""Stores sampled power grids."""
+
+import copy
+import glob
+import json
+import os
+import queue
+import threading
+
+import h5py
+import numpy as np
+import pandapower as pp
+import pandas as pd
+from omegaconf import DictConfig
+from pandapower import pandapowerNet
+
+ELEMENT_TABLES = ["bus", "line", "trafo", "load", "sgen", "gen", "shunt", "ext_grid"]
+INPUT_COLUMNS = {
+    "load": ["p_mw", "q_mvar"], "sgen": ["p_mw", "q_mvar"], "gen": ["p_mw", "vm_pu"], "ext_grid": ["vm_pu"],
+    "poly_cost": ["cp0_eur", "cp1_eur_per_mw", "cp2_eur_per_mw2"]}
+MANIFEST_FILE = "manifest.json"
+REJECT_RECORDS_FILE = "rejected_attempts.jsonl"
+TIMEOUT_RECORDS_FILE = "timeouts.jsonl"
+RECOVERY_RECORDS_FILE = "recoveries.jsonl"
+ADAPTIVE_RECORDS_FILE = "adaptive.jsonl"
+
+
+def get_writer(path: str, default_net: pandapowerNet, n_files: int, cfg: DictConfig = None, start: int = 0):
+    """Returns the writer in charge of storing accepted samples into `path`, starting from the sample `start`.
+
+    Samples before `start` should already be stored in `path`. If `cfg.queue_size` > 0, the writer runs in the
+    background, cf. `AsyncWriter`.
+    """
+
+    writer_dict = {"json": JsonWriter, "hdf5": ShardWriter, "delta": DeltaWriter}
+
+    if cfg is None:
+        return JsonWriter(path, default_net, n_files, start)
+    if cfg.format in writer_dict:
+        params = cfg.params if 'params' in cfg else {}
+        writer = writer_dict[cfg.format](path, default_net, n_files, start, **params)
+        if cfg.get("queue_size", 0) > 0:
+            return AsyncWriter(writer, cfg.queue_size)
+        return writer
+    else:
+        raise ValueError("{} is not a valid storage format".format(cfg.format) + ", choose from {}".format(
+            list(writer_dict.keys())))
+
+
+def name_width(n_files: int) -> int:
+    """Returns the amount of digits of the sample indices in the file names of a dataset of `n_files` samples."""
+    return int(np.ceil(np.log10(max(n_files, 1))))
+
+
+def original_index(table: pd.DataFrame) -> pd.Index:
+    """Returns the labels that the rows of `table` had in the default power grid.
+
+    Samplers that remove elements call `reset_index` before dropping rows, which moves the original labels into an
+    `index` column.
+    """
+    if "index" in table.columns:
+        return pd.Index(table["index"].values)
+    return table.index
+
+
+def extract_features(net: pandapowerNet, default_net: pandapowerNet) -> dict[str, np.ndarray]:
+    """Returns the variable fields of `net` as dense arrays, aligned with the elements of `default_net`.
+
+    Each element table yields an `in_service` mask, which is False for disconnected and removed elements.
+    Values of removed elements are set to NaN.
+    """
+    features = {}
+    for table, columns in INPUT_COLUMNS.items():
+        positions = default_net[table].index.get_indexer(original_index(net[table]))
+        for column in columns:
+            values = np.full(len(default_net[table]), np.nan)
+            values[positions] = net[table][column].values
+            features[table + "/" + column] = values
+
+    for table in ELEMENT_TABLES:
+        positions = default_net[table].index.get_indexer(original_index(net[table]))
+        mask = np.zeros(len(default_net[table]), dtype=bool)
+        mask[positions] = net[table].in_service.values
+        features[table + "/in_service"] = mask
+
+        res_table = net["res_" + table].reindex(net[table].index)
+        for column in default_net["res_" + table].columns:
+            values = np.full(len(default_net[table]), np.nan)
+            values[positions] = res_table[column].values
+            features["res_" + table + "/" + column] = values
+    return features
+
+
+def element_tables(net: pandapowerNet) -> list[str]:
+    """Returns the names of the non-empty element tables of `net`, excluding result tables."""
+    return [key for key, value in net.items() if isinstance(value, pd.DataFrame) and not key.startswith(("_", "res_"))
+            and len(value) > 0]
+
+
+def _equal(a: np.ndarray, b: np.ndarray) -> bool:
+    """Checks if two arrays are equal, NaNs included."""
+    try:
+        return np.array_equal(a, b, equal_nan=True)
+    except TypeError:
+        return np.array_equal(a, b)
+
+
+def extract_delta(net: pandapowerNet, default_net: pandapowerNet) -> dict[str, np.ndarray]:
+    """Returns the difference between `net` and `default_net`.
+
+    For each element table, the delta contains the labels of removed elements (`<table>/dropped`), and the values of
+    the numerical columns that differ from `default_net` (`<table>/<column>`), for the remaining elements in the order
+    of `default_net`. Non-empty result tables are fully stored (`res_<table>/<column>`), as deriving them again from
+    the bus voltages would not reproduce them exactly.
+    """
+    delta = {"converged": np.array(net.converged)}
+    for table in element_tables(default_net):
+        default_table = default_net[table]
+        sampled_table = net[table].set_axis(original_index(net[table]))
+        kept = default_table.index.isin(sampled_table.index)
+        if not kept.all():
+            delta[table + "/dropped"] = default_table.index[~kept].values
+        sampled_table = sampled_table.reindex(default_table.index[kept])
+        for column, dtype in default_table.dtypes.items():
+            if (dtype == object) or (column not in sampled_table.columns):
+                continue
+            values = sampled_table[column].values
+            if not _equal(values, default_table[column].values[kept]):
+                delta[table + "/" + column] = values
+
+        res_table = net["res_" + table] if "res_" + table in net else pd.DataFrame()
+        if len(res_table) > 0:
+            res_table = res_table.reindex(net[table].index).set_axis(original_index(net[table]))
+            res_table = res_table.reindex(default_table.index[kept])
+            for column in res_table.columns:
+                delta["res_" + table + "/" + column] = res_table[column].values
+    return delta
+
+
+def apply_delta(default_net: pandapowerNet, delta: dict[str, np.ndarray]) -> pandapowerNet:
+    """Rebuilds a full power grid from `default_net` and a delta returned by `extract_delta`.
+
+    Removed elements are dropped from their tables, while remaining ones keep their label in `default_net`.
+    """
+    net = copy.deepcopy(default_net)
+    net.converged = bool(delta["converged"])
+    res_columns = {}
+    for key, values in delta.items():
+        if key.endswith("/dropped"):
+            net[key[:-len("/dropped")]].drop(values, inplace=True)
+    for key, values in delta.items():
+        if "/" not in key or key.endswith("/dropped"):
+            continue
+        table, column = key.split("/", 1)
+        if table.startswith("res_"):
+            res_columns.setdefault(table, {})[column] = values
+        else:
+            net[table][column] = values
+    for res_table, columns in res_columns.items():
+        net[res_table] = pd.DataFrame(columns, index=net[res_table[len("res_"):]].index)
+    return net
+
+
+class JsonWriter:
+    """Stores each sample as a full pandapower .json file.
+
+    `n_stored` is the amount of samples that are durably stored, i.e. the index of the next sample to write.
+    """
+
+    def __init__(self, path: str, _, n_files: int, start: int = 0):
+        self.path = path
+        self.n_characters = name_width(n_files)
+        self.n_stored = start
+
+    def write(self, index: int, net: pandapowerNet) -> None:
+        """Writes the sample `index`."""
+        file_name = 'sample_' + str(index).rjust(self.n_characters, '0') + '.json'
+        pp.to_json(net, os.path.join(self.path, file_name))
+        self.n_stored = index + 1
+
+    def close(self) -> None:
+        """Nothing to flush."""
+        pass
+
+
+class ShardWriter:
+    """Stores the variable fields of samples into compressed, column-oriented HDF5 shards.
+
+    Samples are buffered and written by blocks of `shard_size` into `shard_XXXXX.h5` files, where each field
+    (e.g. `load/p_mw` or `res_bus/vm_pu`) is a dense array of shape (n_samples, n_elements).
+    When closing, a `samples.h5` file is written, whose virtual datasets expose the whole split.
+    The static part of the power grids should be read from the default power grid.
+    Shards are numbered after the index of their first sample divided by `shard_size`, and may start elsewhere than
+    at a multiple of `shard_size` when only a slice of the split is built, cf. `dataset.shard_range`.
+    If the last shard written before `start` is incomplete, its samples are read back into the buffer, so that the
+    shard is completed rather than overwritten.
+    """
+
+    def __init__(self, path: str, default_net: pandapowerNet, _, start: int = 0, shard_size: int = 1000,
+                 compression: str = "gzip"):
+        self.path = path
+        self.default_net = default_net
+        self.shard_size = shard_size
+        self.compression = compression
+        self.buffer = []
+        self.first_index = start
+        file_path = os.path.join(self.path, 'shard_' + str(start // shard_size).rjust(5, '0') + '.h5')
+        if start % shard_size > 0 and os.path.exists(file_path):
+            fields = {}
+            with h5py.File(file_path, 'r') as f:
+                self.first_index = int(f.attrs["first_index"])
+                n_buffered = start - self.first_index
+                f.visititems(lambda key, item: fields.update({key: item[:n_buffered]})
+                             if isinstance(item, h5py.Dataset) else None)
+            self.buffer = [{key: values[k] for key, values in fields.items()} for k in range(n_buffered)]
+
+    @property
+    def n_stored(self) -> int:
+        """Amount of samples that are durably stored, which excludes buffered ones."""
+        return self.first_index
+
+    def write(self, index: int, net: pandapowerNet) -> None:
+        """Buffers the sample `index`, and writes a shard if the buffer is full."""
+        if index != self.first_index + len(self.buffer):
+            raise ValueError("Samples should be written in order, expected {}, got {}".format(
+                self.first_index + len(self.buffer), index))
+        self.buffer.append(extract_features(net, self.default_net))
+        if (self.first_index + len(self.buffer)) % self.shard_size == 0:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes buffered samples into a new shard."""
+        if not self.buffer:
+            return
+        shard_id = self.first_index // self.shard_size
+        file_path = os.path.join(self.path, 'shard_' + str(shard_id).rjust(5, '0') + '.h5')
+        with h5py.File(file_path, 'w') as f:
+            f.attrs["first_index"] = self.first_index
+            for key in self.buffer[0]:
+                values = np.stack([features[key] for features in self.buffer])
+                f.create_dataset(key, data=values, compression=self.compression,
+                                 shuffle=self.compression is not None)
+        self.first_index += len(self.buffer)
+        self.buffer = []
+
+    def close(self) -> None:
+        """Flushes remaining samples and indexes all shards into `samples.h5`."""
+        self.flush()
+        write_split_index(self.path)
+
+
+class DeltaWriter:
+    """Stores each sample as a compressed `sample_XXX.npz` file, that only contains its difference with the default
+    power grid. Samples can be rebuilt as full power grids using `load_delta_sample`.
+    """
+
+    def __init__(self, path: str, default_net: pandapowerNet, n_files: int, start: int = 0):
+        self.path = path
+        self.default_net = default_net
+        self.n_characters = name_width(n_files)
+        self.n_stored = start
+
+    def write(self, index: int, net: pandapowerNet) -> None:
+        """Writes the sample `index`."""
+        file_name = 'sample_' + str(index).rjust(self.n_characters, '0') + '.npz'
+        np.savez_compressed(os.path.join(self.path, file_name), **extract_delta(net, self.default_net))
+        self.n_stored = index + 1
+
+    def close(self) -> None:
+        """Nothing to flush."""
+        pass
+
+
+class AsyncWriter:
+    """Runs the writes of `writer`, and other storage tasks, in a background thread, so that serialization and file
+    system latency overlap with sampling.
+
+    Tasks are run in submission order. At most `queue_size` tasks are pending, beyond which submitting blocks until
+    the thread catches up. An exception raised by a task stops all later tasks, and is raised again by the next call
+    to `submit`, `write` or `close`. `n_stored` only counts the samples whose write is complete.
+    """
+
+    def __init__(self, writer, queue_size: int = 16):
+        self.writer = writer
+        self.n_stored = writer.n_stored
+        self.error = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        """Runs tasks until `close` is called, skipping them after a failure so that submitters never block."""
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            if self.error is None:
+                function, args = task
+                try:
+                    function(*args)
+                    self.n_stored = self.writer.n_stored
+                except BaseException as error:
+                    self.error = error
+
+    def _raise_error(self) -> None:
+        """Raises the exception of a failed task, if any."""
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, function, *args) -> None:
+        """Runs `function(*args)` in the background, once previously submitted tasks are done."""
+        self._raise_error()
+        self.queue.put((function, args))
+
+    def write(self, index: int, net: pandapowerNet) -> None:
+        """Writes the sample `index` in the background."""
+        self.submit(self.writer.write, index, net)
+
+    def close(self) -> None:
+        """Waits for all pending tasks, and closes the underlying writer."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise_error()
+        self.writer.close()
+        self.n_stored = self.writer.n_stored
+
+
+def submit(writer, function, *args) -> None:
+    """Runs `function(*args)` in the background thread of `writer` if it is an `AsyncWriter`, or right away."""
+    if isinstance(writer, AsyncWriter):
+        writer.submit(function, *args)
+    else:
+        function(*args)
+
+
+def load_delta_sample(file_path: str, default_net: pandapowerNet) -> pandapowerNet:
+    """Loads a sample written in the `delta` format as a full power grid."""
+    with np.load(file_path) as f:
+        return apply_delta(default_net, dict(f))
+
+
+def list_shards(path: str) -> list[str]:
+    """Returns the sorted list of shard files of a split."""
+    return sorted(glob.glob(os.path.join(path, 'shard_*.h5')))
+
+
+def write_split_index(path: str) -> None:
+    """Writes `samples.h5`, whose virtual datasets concatenate the fields of all shards of a split."""
+    shards = [h5py.File(shard_path, 'r') for shard_path in list_shards(path)]
+    if not shards:
+        return
+    with h5py.File(os.path.join(path, 'samples.h5'), 'w') as f:
+        keys = []
+        shards[0].visit(lambda key: keys.append(key) if isinstance(shards[0][key], h5py.Dataset) else None)
+        for key in keys:
+            n_samples = sum(shard[key].shape[0] for shard in shards)
+            layout = h5py.VirtualLayout(shape=(n_samples,) + shards[0][key].shape[1:], dtype=shards[0][key].dtype)
+            start = 0
+            for shard in shards:
+                n = shard[key].shape[0]
+                layout[start:start + n] = h5py.VirtualSource(os.path.basename(shard.filename), key,
+                                                             shape=shard[key].shape)
+                start += n
+            f.create_virtual_dataset(key, layout, fillvalue=np.nan if layout.dtype.kind == 'f' else 0)
+    for shard in shards:
+        shard.close()
+
+
+def concatenate_shards(file_paths: list[str], out_path: str) -> None:
+    """Writes the samples of the shards `file_paths`, in this order, into the single shard `out_path`.
+
+    Used to merge the parts of a shard that were written by different nodes, cf. `merge.merge_datasets`.
+    Fields keep the compression of the first shard.
+    """
+    shards = [h5py.File(file_path, 'r') for file_path in file_paths]
+    with h5py.File(out_path, 'w') as f:
+        f.attrs["first_index"] = shards[0].attrs["first_index"]
+        keys = []
+        shards[0].visit(lambda key: keys.append(key) if isinstance(shards[0][key], h5py.Dataset) else None)
+        for key in keys:
+            values = np.concatenate([shard[key][()] for shard in shards])
+            f.create_dataset(key, data=values, compression=shards[0][key].compression,
+                             shuffle=shards[0][key].shuffle)
+    for shard in shards:
+        shard.close()
+
+
+def open_split(path: str) -> h5py.File:
+    """Opens a split written in the `hdf5` format.
+
+    Datasets of the returned file span the whole split, and are lazily read when sliced.
+    """
+    return h5py.File(os.path.join(path, 'samples.h5'), 'r')
+
+
+def load_split(path: str) -> dict[str, np.ndarray]:
+    """Loads all fields of a split written in the `hdf5` format as dense arrays."""
+    features = {}
+    with open_split(path) as f:
+        f.visititems(lambda key, item: features.update({key: item[()]}) if isinstance(item, h5py.Dataset) else None)
+    return features
+
+
+def pad_file_names(path: str, prefix: str, n_characters: int) -> None:
+    """Renames the `<prefix><index>.<extension>` files of `path`, so that indices are padded to `n_characters` digits.
+
+    Used when a dataset is extended to an amount of samples that requires more digits.
+    """
+    for file_path in glob.glob(os.path.join(path, prefix + '*')):
+        index, extension = os.path.basename(file_path)[len(prefix):].split('.', 1)
+        if index.isdigit() and len(index) < n_characters:
+            os.rename(file_path, os.path.join(path, prefix + index.rjust(n_characters, '0') + '.' + extension))
+
+
+def load_manifest(path: str) -> dict:
+    """Returns the manifest of the split stored in `path`, or None if there is none."""
+    file_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path) as f:
+        return json.load(f)
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    """Atomically writes the manifest of the split stored in `path`, so that an interruption cannot corrupt it."""
+    tmp_path = os.path.join(path, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+
+class RecordWriter:
+    """Appends the records of rejected attempts to the file `file_name` of `path`, one JSON per line.
+
+    Records are keyed by (dataset_id, index, attempt), cf. `dataset.reject_record`. Records of the samples from
+    `start` on are removed from an existing file, as these samples are sampled again when a dataset is resumed.
+    Lines are flushed as soon as they are written.
+    """
+
+    def __init__(self, path: str, start: int = 0, file_name: str = REJECT_RECORDS_FILE):
+        self.file_path = os.path.join(path, file_name)
+        records = [record for record in load_reject_records(path, file_name) if record["key"][1] < start]
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        os.replace(tmp_path, self.file_path)
+        self.file = open(self.file_path, 'a', buffering=1)
+
+    def write(self, record: dict) -> None:
+        """Appends `record`."""
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self) -> None:
+        """Closes the file."""
+        self.file.close()
+
+
+def load_reject_records(path: str, file_name: str = REJECT_RECORDS_FILE) -> list[dict]:
+    """Returns the records of rejected attempts stored in the file `file_name` of `path`, in the order they were met.
+    """
+    file_path = os.path.join(path, file_name)
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
-"""Exception and samplers."""
+"""Exception, random generators, samplers and configuration binding."""
+
+import functools
+import inspect
+from typing import Callable
 
 import numpy as np
+from omegaconf import DictConfig, OmegaConf
 
 
 class SamplingException(Exception):
@@ -9,33 +14,65 @@ class SamplingException(Exception):
     pass
 
 
-def sample_normal_simplex(std: float = 0., size: int = 2, center_around_zero: bool = False) -> np.ndarray:
+def get_rng(seed: int, *key: int) -> np.random.Generator:
+    """Returns a random generator whose stream only depends on `seed` and on the integer `key`.
+
+    Generators built from the same seed but different keys are statistically independent.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=key))
+
+
+def sample_normal_simplex(rng: np.random.Generator, std: float = 0., size: int = 2, center_around_zero: bool = False,
+                          n_samples: int = None) -> np.ndarray:
     """Samples from a Normal distribution over the hyper-plane where values sum to 1.
 
     std = 0 implies that all values are equal to 1 / size.
     If `center_around_zero` is set to True, an offset is applied so that values sum to zero.
+    If `n_samples` is provided, returns an array of shape (n_samples, size) of independent draws.
     """
-    a = np.random.normal(0, std / size, size=size)
-    r = a - np.mean(a) * np.ones(size) + 1 / size
+    shape = (size,) if n_samples is None else (n_samples, size)
+    a = rng.normal(0, std / size, size=shape)
+    r = a - np.mean(a, axis=-1, keepdims=True) + 1 / size
     if center_around_zero:
         return r - 1 / size
     else:
         return r
 
 
-def sample_uniform_simplex(beta: float = 1., size: int = 2, center_around_zero: bool = False) -> np.ndarray:
+def sample_uniform_simplex(rng: np.random.Generator, beta: float = 1., size: int = 2, center_around_zero: bool = False,
+                           n_samples: int = None) -> np.ndarray:
     """Samples uniformly from a `size`-dimensional simplex.
 
     beta = 0 implies that all values are equal to 1 / size,
     while beta = 1 implies a uniform sampling over `size`-dimensional simplex.
     If `center_around_zero` is set to True, an offset is applied so that values
     sum to zero.
+    If `n_samples` is provided, returns an array of shape (n_samples, size) of independent draws.
     """
     assert (beta <= 1) and (beta >= 0)
-    a = np.concatenate([[0.], np.random.uniform(0., 1., size=size - 1), [1.]])
-    a = np.sort(a)[1:] - np.sort(a)[:-1]
+    shape = (size - 1,) if n_samples is None else (n_samples, size - 1)
+    a = rng.uniform(0., 1., size=shape)
+    bounds = np.ones(shape[:-1] + (1,))
+    a = np.diff(np.sort(np.concatenate([0. * bounds, a, bounds], axis=-1), axis=-1), axis=-1)
     r = (1 - beta) / size + beta * a
     if center_around_zero:
         return r - 1 / size
     else:
         return r
+
+
+def bind(function: Callable, n_args: int, params: DictConfig | dict | None, name: str) -> functools.partial:
+    """Returns `function` with the keyword arguments `params` bound, converted into plain Python containers.
+
+    Raises a `ValueError` mentioning `name` if `function` cannot be called with `params` and `n_args` positional
+    arguments, e.g. if a parameter is unknown or missing.
+    """
+    if params is None:
+        params = {}
+    elif isinstance(params, DictConfig):
+        params = OmegaConf.to_container(params, resolve=True)
+    try:
+        inspect.signature(function).bind(*[None] * n_args, **params)
+    except TypeError as e:
+        raise ValueError("Invalid parameters {} for {}: {}".format(params, name, e))
+    return functools.partial(function, **params)
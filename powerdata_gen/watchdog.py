@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Aborts the sampling attempts and stages that exceed their wall-clock budget."""
+
+import contextlib
+import math
+import signal
+import threading
+import time
+
+from omegaconf import DictConfig
+
+from powerdata_gen.profiling import STAGES
+from powerdata_gen.utils import bind
+
+# Interval at which an expired budget is signaled again, in case a signal is swallowed by the sampling code.
+SIGNAL_INTERVAL_S = 0.1
+
+
+class AttemptTimeout(BaseException):
+    """Raised when a sampling attempt exceeds the time budget `budget` (`attempt` or a stage name) of `budget_s`
+    seconds, while running the stage `stage`.
+
+    As for `KeyboardInterrupt`, it does not inherit from `Exception`, so that the generic error handlers of the
+    libraries it is raised in, e.g. SciPy, do not catch or convert it.
+    """
+
+    def __init__(self, budget: str, budget_s: float, stage: str):
+        super().__init__("The {} budget of {} s was exceeded during {}".format(budget, budget_s, stage))
+        self.budget = budget
+        self.budget_s = budget_s
+        self.stage = stage
+
+
+class Watchdog:
+    """Wall-clock budgets of sampling attempts and of their stages, in seconds.
+
+    `attempt_s` bounds whole attempts, and `stages` bounds each run of the stages of `profiling.STAGES` it names. Once
+    a budget is exceeded, `AttemptTimeout` is raised in the sampling code, so that the attempt is aborted without
+    stopping the process. Budgets are enforced by a real-time interval timer, whose SIGALRM signals are only
+    handled in the main thread of a process on Unix. Code running outside the interpreter, e.g. a sparse solver, is
+    only interrupted once it returns.
+    """
+
+    def __init__(self, attempt_s: float = None, stages: dict = None):
+        if not hasattr(signal, "SIGALRM"):
+            raise ValueError("Time budgets require SIGALRM, which is not available on this platform")
+        if stages is None:
+            stages = {}
+        unknown_stages = [stage for stage in stages if stage not in STAGES]
+        if unknown_stages:
+            raise ValueError("{} are not valid stages, choose from {}".format(unknown_stages, STAGES))
+        for name, budget_s in [("attempt", attempt_s)] + list(stages.items()):
+            if budget_s is not None and budget_s <= 0:
+                raise ValueError("The {} budget should be positive, got {}".format(name, budget_s))
+        self.attempt_s = attempt_s
+        self.stages = {stage: budget_s for stage, budget_s in stages.items() if budget_s is not None}
+        # Running attempt and stages, as (name, budget_s, deadline).
+        self._running = []
+        self._handler = None
+
+    def attempt(self, elapsed_s: float = 0.):
+        """Returns a context that bounds the enclosed block by the attempt budget, of which `elapsed_s` seconds were
+        already spent."""
+        if self.attempt_s is None:
+            return contextlib.nullcontext()
+        return self._budget("attempt", self.attempt_s, elapsed_s)
+
+    def stage(self, name: str):
+        """Returns a context that bounds the enclosed block by the budget of the stage `name`, if any."""
+        return self._budget(name, self.stages.get(name))
+
+    @contextlib.contextmanager
+    def _budget(self, name: str, budget_s: float = None, elapsed_s: float = 0.):
+        """Runs the enclosed block as `name`, until `budget_s` seconds have elapsed or forever if it is None."""
+        if not self._running:
+            if threading.current_thread() is not threading.main_thread():
+                raise RuntimeError("Time budgets can only be enforced in the main thread of a process")
+            self._handler = signal.signal(signal.SIGALRM, self._expire)
+        deadline = math.inf if budget_s is None else time.perf_counter() + budget_s - elapsed_s
+        self._running.append((name, budget_s, deadline))
+        self._arm()
+        try:
+            yield
+        finally:
+            if len(self._running) == 1:
+                signal.setitimer(signal.ITIMER_REAL, 0.)
+                self._running.pop()
+                signal.signal(signal.SIGALRM, self._handler)
+                self._handler = None
+            else:
+                self._running.pop()
+                self._arm()
+
+    def _arm(self) -> None:
+        """Sets the timer to the earliest deadline of the running attempt and stages."""
+        deadline = min(deadline for _, _, deadline in self._running)
+        if deadline == math.inf:
+            signal.setitimer(signal.ITIMER_REAL, 0.)
+        else:
+            signal.setitimer(signal.ITIMER_REAL, max(deadline - time.perf_counter(), 1e-6), SIGNAL_INTERVAL_S)
+
+    def _expire(self, *_) -> None:
+        """Raises `AttemptTimeout` for the outermost exceeded budget, naming the innermost running stage."""
+        now = time.perf_counter()
+        for name, budget_s, deadline in self._running:
+            if now >= deadline:
+                raise AttemptTimeout(name, budget_s, self._running[-1][0])
+
+
+def get_watchdog(timeout_cfg: DictConfig | dict | None) -> Watchdog | None:
+    """Returns the `Watchdog` of the budgets of `timeout_cfg`, or None if no budget is set."""
+    watchdog = bind(Watchdog, 0, timeout_cfg, "the time budgets")()
+    if watchdog.attempt_s is None and not watchdog.stages:
+        return None
+    return watchdog
+
+
+def attempt_budget(watchdog: Watchdog = None, elapsed_s: float = 0.):
+    """Returns a context that bounds the enclosed block by the attempt budget of `watchdog`, or does nothing if
+    `watchdog` is None, cf. `Watchdog.attempt`."""
+    if watchdog is None:
+        return contextlib.nullcontext()
+    return watchdog.attempt(elapsed_s)
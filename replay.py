@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Regenerates a rejected attempt recorded with `reject_format: seed`, and stores it as a pandapower .json file."""
+
+import argparse
+import logging
+import os
+
+import pandapower as pp
+
+from powerdata_gen.replay import replay_record
+from powerdata_gen.utils import SamplingException
+
+log = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """Replays the attempt `attempt` of the sample `index` of the dataset `path`, and writes it into `--output`."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="directory of the dataset, e.g. outputs/<date>/<time>/train")
+    parser.add_argument("index", type=int, help="index of the sample")
+    parser.add_argument("attempt", type=int, help="attempt of the sample, starting from 0")
+    parser.add_argument("--default-net", default=None,
+                        help="default power grid, defaults to the default_net.json file next to the dataset")
+    parser.add_argument("--output", default=None, help="output .json file, defaults to replay_<index>_<attempt>.json")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    default_net_path = args.default_net or os.path.join(os.path.dirname(os.path.normpath(args.path)),
+                                                        'default_net.json')
+    output = args.output or "replay_{}_{}.json".format(args.index, args.attempt)
+
+    default_net = pp.from_json(default_net_path)
+    try:
+        net, outcome, info, record = replay_record(args.path, default_net, args.index, args.attempt)
+    except SamplingException:
+        log.info("The attempt is a sampling error, there is no power grid to store")
+        return
+    log.info("Recorded outcome : {}, filtering info : {}".format(record["outcome"], record["filtering_info"]))
+    log.info("Replayed outcome : {}, filtering info : {}".format(outcome, info))
+    pp.to_json(net, output)
+    log.info("Power grid written into {}".format(output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Fixtures shared by the tests, which sample a handful of power grids from the bundled Nordic grid."""
+
+import os
+
+import pandapower as pp
+import pytest
+from omegaconf import DictConfig, OmegaConf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NET_PATH = os.path.join(ROOT, "inputs", "case60nordic_vanilla.json")
+CONFIG_PATH = os.path.join(ROOT, "config", "config.yaml")
+SEED = 0
+
+
+@pytest.fixture(scope="session")
+def default_net() -> pp.pandapowerNet:
+    """Nordic power grid that samples are drawn from."""
+    return pp.from_json(NET_PATH)
+
+
+@pytest.fixture
+def cfg() -> DictConfig:
+    """Shipped configuration, which tests may modify."""
+    return OmegaConf.load(CONFIG_PATH)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Tests that datasets only depend on the seed and the sample indices, whichever way they are built."""
+
+import glob
+import logging
+import os
+
+import numpy as np
+import pandapower as pp
+import pytest
+
+from powerdata_gen import dataset
+from powerdata_gen.merge import merge_one_dataset
+from powerdata_gen.storage import load_manifest
+from tests.conftest import SEED
+
+N_FILES = 4
+LOG = logging.getLogger(__name__)
+
+
+def build(default_net, cfg, path, **kwargs):
+    """Builds a dataset of `N_FILES` samples into `path` with the shipped configuration."""
+    dataset.build_one_dataset(default_net, str(path), LOG, N_FILES, False, cfg.sampling, cfg.powerflow, cfg.filtering,
+                              SEED, **kwargs)
+
+
+def assert_same_dataset(path, expected_path):
+    """Checks that two datasets have the same samples and statistics."""
+    file_names = sorted(os.path.basename(file_path) for file_path in glob.glob(os.path.join(expected_path, "sample_*")))
+    assert len(file_names) == N_FILES
+    assert sorted(os.path.basename(file_path) for file_path in glob.glob(os.path.join(path, "sample_*"))) == file_names
+    for file_name in file_names:
+        net = pp.from_json(os.path.join(path, file_name))
+        expected_net = pp.from_json(os.path.join(expected_path, file_name))
+        np.testing.assert_array_equal(net.line.index.values, expected_net.line.index.values)
+        np.testing.assert_array_equal(net.res_bus.values, expected_net.res_bus.values)
+    manifest, expected_manifest = load_manifest(str(path)), load_manifest(str(expected_path))
+    for key in ["n_completed", "counts", "filtering_info"]:
+        assert manifest[key] == expected_manifest[key]
+
+
+def test_n_workers(default_net, cfg):
+    """Samples do not depend on the amount of worker processes."""
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    expected = list(dataset.imap_samples(range(N_FILES), **context))
+    results = list(dataset.imap_samples(range(N_FILES), n_workers=2, **context))
+    for (net, counts, *_), (expected_net, expected_counts, *_) in zip(results, expected):
+        assert counts == expected_counts
+        np.testing.assert_array_equal(net.line.index.values, expected_net.line.index.values)
+        np.testing.assert_array_equal(net.res_bus.values, expected_net.res_bus.values)
+
+
+def test_resume(default_net, cfg, tmp_path, monkeypatch):
+    """A dataset resumed after an interruption is the same as an uninterrupted one."""
+    build(default_net, cfg, tmp_path / "expected")
+    imap_samples = dataset.imap_samples
+
+    def interrupted(*args, **kwargs):
+        for k, sample in enumerate(imap_samples(*args, **kwargs)):
+            if k == N_FILES // 2:
+                raise KeyboardInterrupt
+            yield sample
+
+    monkeypatch.setattr(dataset, "imap_samples", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        build(default_net, cfg, tmp_path / "resumed")
+    assert load_manifest(str(tmp_path / "resumed"))["n_completed"] == N_FILES // 2
+    monkeypatch.setattr(dataset, "imap_samples", imap_samples)
+    build(default_net, cfg, tmp_path / "resumed")
+    assert_same_dataset(tmp_path / "resumed", tmp_path / "expected")
+
+
+def test_merge_shards(default_net, cfg, tmp_path):
+    """Shards built independently and merged are the same as a dataset built at once."""
+    build(default_net, cfg, tmp_path / "expected")
+    shard_paths = [str(tmp_path / "shard_{}".format(k)) for k in range(2)]
+    for k, shard_path in enumerate(shard_paths):
+        build(default_net, cfg, shard_path, shard_index=k, num_shards=2)
+    merge_one_dataset(shard_paths[::-1], str(tmp_path / "merged"), LOG)
+    assert_same_dataset(tmp_path / "merged", tmp_path / "expected")
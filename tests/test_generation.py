@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""Tests the sampling of the active generation."""
+
+import warnings
+
+import numpy as np
+
+from powerdata_gen import dataset
+from tests.conftest import SEED
+
+
+def test_dc_opf_highs_real(default_net, cfg):
+    """The DC-OPF solved with HiGHS passes real arrays to `linprog`, which warns when complex values are discarded."""
+    cfg.sampling.active_gen.params.backend = "highs"
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", np.ComplexWarning)
+        list(dataset.imap_samples(range(2), **context))
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Tests the power flow solvers and their reuse across samples."""
+
+import numpy as np
+import pytest
+
+from powerdata_gen import dataset
+from powerdata_gen.batch_powerflow import run_power_flows
+from powerdata_gen.powerflow import compile_powerflow, run_power_flow
+from powerdata_gen.powergrid.core import clone_net
+from tests.conftest import SEED
+
+
+def test_warm_start_fallback(default_net, cfg):
+    """The warm start keeps the accepted samples, and counts its fallbacks to the configured initialization."""
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    expected = [net for net, *_ in dataset.imap_samples(range(8), **context)]
+    cfg.solver.warm_start_size = 16
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED,
+                                       solver_cfg=cfg.solver)
+    results = list(dataset.imap_samples(range(8), **context))
+    for (net, *_), expected_net in zip(results, expected):
+        np.testing.assert_array_equal(net.line.index.values, expected_net.line.index.values)
+        for column in ["vm_pu", "va_degree", "p_mw", "q_mvar"]:
+            np.testing.assert_allclose(net.res_bus[column].values, expected_net.res_bus[column].values, atol=1e-4)
+    counts = [counts for _, counts, *_ in results]
+    assert sum(count["warm_start_hit"] for count in counts) > 0
+    assert all(0 <= count["warm_start_fallback"] <= count["warm_start_hit"] for count in counts)
+
+
+def test_powerflow_cache(default_net, cfg):
+    """The solver cache is hit by samples of `dc_opf_disconnect`, and keeps their power flow results."""
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    expected = [net for net, *_ in dataset.imap_samples(range(8), **context)]
+    cfg.solver.cache_size = 64
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED,
+                                       solver_cfg=cfg.solver)
+    results = list(dataset.imap_samples(range(8), **context))
+    for (net, *_), expected_net in zip(results, expected):
+        np.testing.assert_array_equal(net.gen.in_service.values, expected_net.gen.in_service.values)
+        np.testing.assert_allclose(net.res_bus.vm_pu.values, expected_net.res_bus.vm_pu.values, atol=1e-6)
+        np.testing.assert_allclose(net.res_bus.va_degree.values, expected_net.res_bus.va_degree.values, atol=1e-4)
+    assert sum(counts["cache_hit"] for _, counts, *_ in results) > 0
+
+
+def test_dc_screening_dc_opf(default_net, cfg):
+    """The DC screening is refused when the DC-OPF of the active generation already limits branch loadings."""
+    cfg.solver.dc_screening_margin = 5.
+    with pytest.raises(ValueError):
+        dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED,
+                                 solver_cfg=cfg.solver)
+    cfg.sampling.active_gen.params.max_loading_percent = 110.
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED,
+                                       solver_cfg=cfg.solver)
+    assert "dc_screen" in context
+
+
+def test_schedule_block_cache(default_net, cfg):
+    """Samples built by blocks are the same as one by one, and their groups hit the solver cache."""
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    expected = [net for net, *_ in dataset.imap_samples(range(8), **context)]
+    cfg.solver.cache_size = 64
+    cfg.solver.schedule_block = 8
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED,
+                                       solver_cfg=cfg.solver)
+    results = list(dataset.imap_samples(range(8), **context))
+    for (net, *_), expected_net in zip(results, expected):
+        np.testing.assert_array_equal(net.gen.in_service.values, expected_net.gen.in_service.values)
+        np.testing.assert_allclose(net.res_bus.vm_pu.values, expected_net.res_bus.vm_pu.values, atol=1e-6)
+    assert sum(counts["cache_hit"] for _, counts, *_ in results) > 0
+
+
+def test_batch_powerflow(default_net, cfg):
+    """The batched solver agrees with `pp.runpp` on injection scenarios of a sampled topology."""
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    net, *_ = next(dataset.imap_samples(range(1), **context))
+    powerflow_cfg = compile_powerflow(cfg.powerflow)
+    nets = []
+    for factor in [0.9, 0.95, 1., 1.05]:
+        scenario = clone_net(net)
+        scenario.load[["p_mw", "q_mvar"]] *= factor
+        scenario.gen.p_mw *= factor
+        nets.append(scenario)
+    converged = run_power_flows(nets, powerflow_cfg)
+    assert converged.all()
+    for scenario in nets:
+        expected = clone_net(scenario)
+        run_power_flow(expected, powerflow_cfg)
+        for column in ["vm_pu", "va_degree", "p_mw", "q_mvar"]:
+            np.testing.assert_allclose(scenario.res_bus[column].values, expected.res_bus[column].values, atol=1e-5)
+        np.testing.assert_allclose(scenario.res_line.loading_percent.values, expected.res_line.loading_percent.values,
+                                   atol=1e-3)
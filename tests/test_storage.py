@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Tests the storage of samples."""
+
+import os
+
+import pandas as pd
+
+from powerdata_gen import dataset
+from powerdata_gen.storage import DeltaWriter, element_tables, load_delta_sample, original_index
+from tests.conftest import SEED
+
+
+def test_delta_round_trip(default_net, cfg, tmp_path):
+    """Samples rebuilt from their delta are the same as the sampled power grids, under their original labels."""
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    writer = DeltaWriter(str(tmp_path), default_net, 4)
+    for index, (net, *_) in enumerate(dataset.imap_samples(range(4), **context)):
+        writer.write(index, net)
+        rebuilt = load_delta_sample(os.path.join(tmp_path, "sample_{}.npz".format(index)), default_net)
+        assert rebuilt.converged == net.converged
+        for table in element_tables(default_net):
+            labels = original_index(net[table])
+            expected = net[table].drop(columns="index", errors="ignore").set_axis(labels)
+            pd.testing.assert_frame_equal(rebuilt[table], expected)
+            if "res_" + table in net and len(net["res_" + table]) > 0:
+                pd.testing.assert_frame_equal(rebuilt["res_" + table], net["res_" + table].set_axis(labels))
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Tests the sampling of secure line outages."""
+
+import multiprocessing
+
+import copy
+
+import numpy as np
+import pandapower.topology as top
+
+from powerdata_gen import dataset
+from powerdata_gen.graph import unsupplied_buses
+from tests.conftest import SEED
+
+
+def test_secure_outages_spawn(default_net, cfg, monkeypatch):
+    """Secure outage sets reach worker processes started with `spawn`, and samples do not depend on the workers."""
+    cfg.sampling.topology.params.line.secure = True
+    context = dataset.sampling_context(default_net, False, cfg.sampling, cfg.powerflow, cfg.filtering, SEED)
+    expected = [net for net, *_ in dataset.imap_samples(range(4), **context)]
+    monkeypatch.setattr(multiprocessing, "Pool", multiprocessing.get_context("spawn").Pool)
+    samples = [net for net, *_ in dataset.imap_samples(range(4), n_workers=2, **context)]
+    for net, expected_net in zip(samples, expected):
+        np.testing.assert_array_equal(net.line.index.values, expected_net.line.index.values)
+        np.testing.assert_array_equal(net.res_bus.values, expected_net.res_bus.values)
+
+
+def test_unsupplied_buses_networkx(default_net):
+    """Unsupplied buses agree with `pandapower.topology`, which builds a networkx graph, when lines, transformers and
+    buses are removed or taken out of service."""
+    rng = np.random.default_rng(SEED)
+    for _ in range(16):
+        net = copy.deepcopy(default_net)
+        net.line.drop(rng.choice(net.line.index, 6, replace=False), inplace=True)
+        net.line.loc[rng.choice(net.line.index, 4, replace=False), "in_service"] = False
+        net.trafo.loc[rng.choice(net.trafo.index, 4, replace=False), "in_service"] = False
+        net.bus.loc[rng.choice(net.bus.index, 2, replace=False), "in_service"] = False
+        assert unsupplied_buses(net) == top.unsupplied_buses(net)